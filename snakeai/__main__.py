@@ -0,0 +1,4 @@
+from snakeai.cli import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""The agents that can play the game
+
+The agents can be retrieved by name with `get_agent_class`. The module of an agent is imported only the first time
+the agent is requested, so that heavy dependencies (like TensorFlow) are loaded only by the agents that need them.
+"""
+import importlib
+from typing import Dict, List, Type
+
+AGENTS: Dict[str, str] = {
+    "StateAgent": "snakeai.agents.tabular_agent",
+    "SimpleStateAgent": "snakeai.agents.simple_tabular_agent",
+    "SimpleMCAgent": "snakeai.agents.simple_mc_agent",
+    "DQN": "snakeai.agents.simple_deep_agent",
+    "DeepQAgent": "snakeai.agents.deep_agent",
+    "Recursive": "snakeai.agents.recursive_agent",
+    "NumpyAgent": "snakeai.agents.numpy_policy",
+    "CompiledPolicyAgent": "snakeai.agents.compiled_agent",
+}
+
+
+def register_agent(name: str, module: str):
+    """Add an agent to the registry
+
+    Parameters
+    ----------
+    name: str
+        The name of the agent class
+    module: str
+        The module where the class is defined
+    """
+    AGENTS[name] = module
+
+
+def available_agents() -> List[str]:
+    """Get the names of all the registered agents
+
+    Returns
+    -------
+    list(str)
+        The names of the agents
+    """
+    return sorted(AGENTS)
+
+
+def get_agent_class(name: str) -> Type:
+    """Get the class of an agent by name, importing its module if needed
+
+    Parameters
+    ----------
+    name: str
+        The name of the agent class
+
+    Returns
+    -------
+    Type[AbstractAgent]
+        The class of the agent
+
+    Raises
+    ------
+    KeyError
+        If there is no agent with the given name
+    """
+    if name not in AGENTS:
+        raise KeyError(f"Unknown agent {name}. Available agents are: {', '.join(available_agents())}")
+    return getattr(importlib.import_module(AGENTS[name]), name)
@@ -1,8 +1,13 @@
-from snakeai.game.constants import Actions
+from snakeai.game.constants import Actions, ACTION_LIST
 from abc import ABC, abstractmethod
+from typing import Sequence, Tuple, Union
+
+import numpy as np
 
 from snakeai.game.memento import FrozenState
 
+States = Union[Sequence[FrozenState], np.ndarray]
+
 
 class AbstractAgent(ABC):
     """Abstract interface for all agents
@@ -60,9 +65,64 @@ class AbstractAgent(ABC):
             Whether the new state is terminal
         """
 
+    def execute_batch(self, states: States) -> np.ndarray:
+        """Get the next action to do for many states at once (e.g. from many games played in parallel)
+
+        Agents that can evaluate many states together override this method, and accept the states already
+        encoded as an array: the agents using simplified states take an array of shape (n, 12), like the
+        one returned by `encode_simple_states`. The default implementation calls `execute` on each state,
+        so it only accepts `FrozenState` objects.
+
+        Parameters
+        --------------
+        states : list(FrozenState) or np.ndarray
+            The current states of the games
+
+        Returns
+        --------------
+        np.ndarray
+            The actions to do, encoded as their position in `ACTION_LIST`
+
+        Raises
+        -------
+        TypeError
+            If the states are encoded, but the agent does not support it
+        """
+        if isinstance(states, np.ndarray):
+            raise TypeError(f"{type(self).__name__} can only execute FrozenState objects")
+        return np.array([ACTION_LIST.index(self.execute(state)) for state in states], dtype=np.int64)
+
+    def fit_batch(self, transitions: Tuple[States, np.ndarray, np.ndarray, States, np.ndarray]):
+        """Train the agent with one step of many games played in parallel
+
+        The row ``i`` of each array must always come from the same game, so that agents that learn from
+        whole episodes can follow each game. The default implementation calls `fit` on each transition,
+        so it only accepts `FrozenState` objects.
+
+        Parameters
+        -----------
+        transitions : tuple
+            The states before taking the actions, the actions (as positions in `ACTION_LIST`), the rewards,
+            the states after taking the actions and whether each new state is terminal
+
+        Raises
+        -------
+        TypeError
+            If the states are encoded, but the agent does not support it
+        """
+        old_states, actions, rewards, states, dones = transitions
+        if isinstance(old_states, np.ndarray):
+            raise TypeError(f"{type(self).__name__} can only be trained with FrozenState objects")
+        for old_state, action, rew, state, done in zip(old_states, actions, rewards, states, dones):
+            self.fit(old_state, ACTION_LIST[action], rew, state, bool(done))
+
     def reset(self):
         """Prepare the agent for starting a new game"""
 
+    def flush(self):
+        """Write the pending changes of the model to its storage. Only the agents whose model lives on disk (like a
+        `StateAgent` with a `MMapQStore`) have something to write"""
+
     @abstractmethod
     def save(self, model_path: str = None):
         """Save the model. If no path is given, a default path will be used.
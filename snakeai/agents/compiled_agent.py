@@ -0,0 +1,179 @@
+import logging
+import time
+
+import numpy as np
+
+from snakeai.agents.agent_interface import AbstractAgent, States
+from snakeai.game.constants import Actions, ACTION_LIST
+from snakeai.game.memento import FrozenState, SIMPLE_STATES, encode_simple_states, simple_state_indices
+from snakeai.game.agent_controller import AgentGame
+
+
+def play(size: int = 20, model_path: str = None, fps: int = 7):
+    """Play with a compiled policy
+
+    If no path is given, the default `SimpleStateAgent` model is compiled and used
+
+    Parameters
+    ------------
+    size: int, default=20
+        the size of the board
+    model_path: str, optional
+        the path to the compiled policy to load
+    fps: int, default=7
+        The number of fps for the game
+    """
+    if model_path:
+        agent = CompiledPolicyAgent.load(size, model_path)
+    else:
+        from snakeai.agents.simple_tabular_agent import SimpleStateAgent
+        agent = CompiledPolicyAgent.from_agent(SimpleStateAgent.load(20, "./models/default/DefaultSimpleStateAgent"))
+    game = AgentGame(agent.dim, fps=fps, replay_allowed=True)
+    game.play(agent)
+
+
+def all_simple_states() -> np.ndarray:
+    """Enumerate all the simplified states
+
+    Returns
+    --------
+    np.ndarray
+        An array of shape (4096, 12), where row ``i`` is the simplified state with `simple_state_index` ``i``
+    """
+    indices = np.arange(SIMPLE_STATES)
+    return ((indices[:, None] >> np.arange(11, -1, -1)) & 1).astype(np.uint8)
+
+
+def compile_policy(agent: AbstractAgent) -> bytes:
+    """Evaluate the greedy policy of an agent on all the simplified states
+
+    Supported agents are the ones whose `execute_batch` accepts simplified states: `SimpleStateAgent`,
+    `SimpleMCAgent`, `DQN` and `NumpyAgent` with a simplified model. The agent is evaluated with epsilon=0.
+
+    Parameters
+    ----------
+    agent: AbstractAgent
+        The agent to compile
+
+    Returns
+    -------
+    bytes
+        4096 bytes, where the byte ``i`` is the position in `ACTION_LIST` of the action chosen in the state with
+        `simple_state_index` ``i``
+
+    Raises
+    ------
+    TypeError
+        If the agent does not use simplified states
+    """
+    epsilon = agent.epsilon
+    agent.epsilon = 0
+    try:
+        return np.asarray(agent.execute_batch(all_simple_states()), dtype=np.uint8).tobytes()
+    finally:
+        agent.epsilon = epsilon
+
+
+class CompiledPolicyAgent(AbstractAgent):
+    """An agent that plays with a policy compiled to a table, with one entry for each simplified state
+
+    Each move costs one computation of the simplified state and one lookup. The agent cannot be trained.
+
+    Parameters
+    -------------
+    dim : int
+        the side of the board
+    table : bytes
+        The policy created by `compile_policy`
+
+    Attributes
+    ----------------
+    table : bytes
+        The position in `ACTION_LIST` of the action to choose for each simplified state
+
+    Raises
+    -------
+    ValueError
+        If the table does not have one entry for each simplified state
+    """
+    def __init__(self, dim: int, table: bytes):
+        super().__init__(dim, initial_epsilon=0)
+        if len(table) != SIMPLE_STATES:
+            raise ValueError(f"The table should have {SIMPLE_STATES} entries")
+        self.table = bytes(table)
+
+    @classmethod
+    def from_agent(cls, agent: AbstractAgent) -> 'CompiledPolicyAgent':
+        """Compile the policy of a trained agent
+
+        Parameters
+        -----------
+        agent : AbstractAgent
+            The agent to compile (see `compile_policy`)
+        """
+        start = time.time()
+        compiled = cls(agent.dim, compile_policy(agent))
+        logging.info(f"Compiled {type(agent).__name__} in {time.time() - start :.2f} s")
+        return compiled
+
+    def execute(self, state: FrozenState) -> Actions:
+        """Get the next action to do, given the state
+
+        Parameters
+        --------------
+        state : FrozenState
+            the current state of the game
+
+        Returns
+        --------------
+        Actions
+            the direction in which  to move
+        """
+        return ACTION_LIST[self.table[state.simple_state_index]]
+
+    def execute_batch(self, states: States) -> np.ndarray:
+        """Get the next actions for many states, with one lookup
+
+        Parameters
+        --------------
+        states : list(FrozenState) or np.ndarray
+            the current states, or their simplified description with shape (n, 12)
+
+        Returns
+        --------------
+        np.ndarray
+            the actions, as positions in `ACTION_LIST`
+        """
+        if not isinstance(states, np.ndarray):
+            states = encode_simple_states(states)
+        return np.frombuffer(self.table, dtype=np.uint8)[simple_state_indices(states)].astype(np.int64)
+
+    def fit(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
+        """This agent cannot be trained, so this method does nothing"""
+
+    def save(self, model_path: str = None):
+        """Save the table of the agent. If a path is not given, uses a default one.
+
+        Parameters
+        ------------
+        model_path : str, optional
+            the position where the agent must be saved
+        """
+        if not model_path:
+            model_path = "./models/CompiledPolicy"
+        with open(model_path + str(self.dim) + ".policy", "wb") as fout:
+            fout.write(self.table)
+
+    @classmethod
+    def load(cls, dim: int, model_path: str) -> 'CompiledPolicyAgent':
+        """Create a new agent from the given file
+
+        Parameters
+        -----------
+        dim : int
+            The size of the board
+        model_path: str
+            The path to the policy to load
+        """
+        with open(model_path + str(dim) + ".policy", "rb") as fin:
+            return cls(dim, fin.read())
@@ -1,14 +1,10 @@
 import random
-from collections import deque
 from snakeai.agents.agent_interface import AbstractAgent
+from snakeai.agents.replay_memory import ReplayMemory, PrioritizedReplayMemory
+from snakeai.agents.numpy_policy import export_model
 from snakeai.game.memento import FrozenState
 from snakeai.game.constants import Actions
-from keras.layers import Dense, Conv2D, Flatten
-from tensorflow import keras
-from tensorflow.keras import layers
-from tensorflow.keras.optimizers import Adam
 import numpy as np
-from tensorflow.keras.models import load_model
 
 class DeepQAgent(AbstractAgent):
     """An agent that uses deep learning, using a simplified description of the state
@@ -17,6 +13,12 @@ class DeepQAgent(AbstractAgent):
     -----------
     dim : int
         the dimension of the board (side length)
+    memory_size : int, default=2500
+        The maximum number of transitions kept in memory
+    memory_file : str, optional
+        If given, the memory is backed by memory mapped files starting with this path
+    prioritized : bool, default=False
+        Whether to sample the transitions proportionally to their TD error, instead of uniformly
 
     Attributes
     -----------
@@ -36,8 +38,8 @@ class DeepQAgent(AbstractAgent):
         The decay factor of epsilon at each episode
     learning_rate : float [0, 1]
         The learning rate
-    memory : deque
-        The list of states used for learning
+    memory : ReplayMemory
+        The transitions used for learning
     model : keras.Model
         The model used by the agent
     targetModel : keras.Model
@@ -46,6 +48,10 @@ class DeepQAgent(AbstractAgent):
         The number of episodes after which the targetModel is updated
     lastUpdate : int
         The number of episodes occurred since last update of targetModel
+    train_every : int
+        The number of steps between two updates of the model
+    learner : AsyncLearner or None
+        The learner that is training the model in a separate thread, if any
     prevState1 : list(list(int))
         The previous state
     prevState2 : list(list(int))
@@ -54,7 +60,7 @@ class DeepQAgent(AbstractAgent):
         The state 3 time steps ago 
     """
 
-    def __init__(self, dim):
+    def __init__(self, dim, memory_size=2500, memory_file=None, prioritized=False):
         super().__init__(dim)
 
         self.action_space = 4
@@ -63,12 +69,17 @@ class DeepQAgent(AbstractAgent):
         self.epsilon_min = 0.01
         self.epsilon_decay = 0.995
         self.learning_rate = 0.00025
-        self.memory = deque(maxlen=2500)
+        memory_cls = PrioritizedReplayMemory if prioritized else ReplayMemory
+        self.memory = memory_cls(memory_size, (self.dim, self.dim, 2), np.int8, memory_file)
         self.model = self.createModel()
         self.targetModel = self.createModel()
         self.updatePeriod = 20
         self.lastUpdate = 0
         self.updateTargetModel()
+        self.compile_inference()
+        self.train_every = 1
+        self.learner = None
+        self._steps = 0
 
         self.prevState1 = None
         self.prevState2 = None
@@ -78,8 +89,60 @@ class DeepQAgent(AbstractAgent):
         """Update target model with weights from the current model"""
         self.targetModel.set_weights(self.model.get_weights())
 
+    def compile_inference(self, acting_model=None):
+        """Compile the forward passes of `model`, `targetModel` and of the acting model into TensorFlow graphs,
+        used by `predict_batch`
+
+        This must be called again every time one of the models is replaced by a new object
+
+        Parameters
+        -----------
+        acting_model : keras.Model, optional
+            The model used to choose the actions (e.g. the copy published by an `AsyncLearner`), by default `model`
+        """
+        import tensorflow as tf
+
+        spec = [tf.TensorSpec((None, self.dim, self.dim, 2), tf.float32)]
+        model = self.model
+        target_model = self.targetModel
+        self._forward = tf.function(lambda x: model(x, training=False), input_signature=spec)
+        self._target_forward = tf.function(lambda x: target_model(x, training=False), input_signature=spec)
+        if acting_model is None:
+            self._acting_forward = self._forward
+        else:
+            self._acting_forward = tf.function(lambda x: acting_model(x, training=False), input_signature=spec)
+
+    def predict_batch(self, states, target=False, acting=False):
+        """Compute the Q values of a batch of boards with a single call to the compiled model
+
+        Parameters
+        -----------
+        states : np.ndarray
+            The boards, with shape (n, dim, dim, 2)
+        target : bool, default=False
+            Whether to use `targetModel` instead of `model`
+        acting : bool, default=False
+            Whether to use the acting model (see `compile_inference`) instead of `model`. Training always uses `model`
+
+        Returns
+        --------
+        np.ndarray
+            The Q values, with shape (n, 4)
+        """
+        states = np.asarray(states, dtype=np.float32).reshape((-1, self.dim, self.dim, 2))
+        if target:
+            return self._target_forward(states).numpy()
+        if acting and self.learner is not None:
+            with self.learner.publish_lock:
+                return self._acting_forward(states).numpy()
+        return self._forward(states).numpy()
+
     def createModel(self):
         """Create The Deep Learning model"""
+        from tensorflow import keras
+        from tensorflow.keras.layers import Dense, Conv2D, Flatten
+        from tensorflow.keras.optimizers import Adam
+
         inputs = keras.Input((self.dim, self.dim, 2))
         x = Conv2D(filters = 32, kernel_size=(5,5), activation="relu")(inputs)
         x = Conv2D(filters = 64, kernel_size=(3,3), activation="relu")(x)
@@ -88,7 +151,7 @@ class DeepQAgent(AbstractAgent):
         x = Dense(512, activation = "relu")(x)
         #x = Dense(128, activation = "relu")(x)
         #x = Dense(128, activation = "relu")(x)
-        outputs = layers.Dense(self.action_space, activation = "linear", name = "output")(x)
+        outputs = Dense(self.action_space, activation = "linear", name = "output")(x)
         model = keras.Model(inputs = inputs, outputs = [outputs])
         model.compile(optimizer = Adam(learning_rate=self.learning_rate), loss="mse")
         return model
@@ -104,7 +167,7 @@ class DeepQAgent(AbstractAgent):
         if np.random.rand() <= self.epsilon:
             act =  random.randrange(self.action_space)
         else:
-            act_values = self.model.predict(table)
+            act_values = self.predict_batch(table, acting=True)
             act =  np.argmax(act_values[0])
         if act == 0:
             return Actions.UP
@@ -141,46 +204,66 @@ class DeepQAgent(AbstractAgent):
 
         table = np.reshape([oldState.table, state.table], (-1, self.dim, self.dim, 2))
 
-        self.memory.append((oldTable, action, rew, table, done))
+        self.memory.append(oldTable[0], action, rew, table[0], done)
         self.prevState = oldState.table
-        self.replay()
+        if self.learner is not None:
+            self.learner.notify_step()
+        else:
+            self._steps += 1
+            if self._steps % self.train_every == 0:
+                self.replay()
         if done:
             self.lastUpdate += 1
             if self.lastUpdate > self.updatePeriod :
                 self.updateTargetModel()
                 self.lastUpdate = 0
 
-    def replay(self):
-        """Train the model with one batch"""
-        if len(self.memory) < self.batch_size:
-            return
+    def replay(self) -> bool:
+        """Train the model with one batch
 
-        minibatch = random.sample(self.memory, self.batch_size)
-        states = np.array([i[0] for i in minibatch])
-        actions = np.array([i[1] for i in minibatch])
-        rewards = np.array([i[2] for i in minibatch])
-        next_states = np.array([i[3] for i in minibatch])
-        dones = np.array([i[4] for i in minibatch])
+        Returns
+        --------
+        bool
+            Whether the model has been trained: there is no update until the memory holds `batch_size` transitions
+        """
+        if len(self.memory) < self.batch_size:
+            return False
 
-        states = np.squeeze(states)
-        next_states = np.squeeze(next_states)
+        (states, actions, rewards, next_states, dones), indices, weights = self.memory.sample_weighted(self.batch_size)
 
-        targets = rewards + self.gamma*(np.amax(self.targetModel.predict(next_states), axis=1))*(1-dones)
+        targets = rewards + self.gamma*(np.amax(self.predict_batch(next_states, target=True), axis=1))*(1-dones)
 
-        targets_full = self.targetModel.predict(states)
+        targets_full = self.predict_batch(states, target=True)
 
-        ind = np.array(list(range(self.batch_size)))
-        targets_full[[ind], [actions]] = targets
-        self.model.fit(states, targets_full, epochs=1, verbose=0)
+        ind = np.arange(self.batch_size)
+        if isinstance(self.memory, PrioritizedReplayMemory):
+            # The priorities are the TD errors of the online model, not of the target model
+            self.memory.update_priorities(indices, targets - self.predict_batch(states)[ind, actions])
+        targets_full[ind, actions] = targets
+        self.model.fit(states.astype(np.float32), targets_full, sample_weight=weights, epochs=1, verbose=0)
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
+        return True
+
+    def export(self, path):
+        """Export the weights of the model to a ``.npz`` file, that can be played by `NumpyAgent` without TensorFlow
+
+        Parameters
+        -----------
+        path : str
+            The path of the file. It should end with .npz
+        """
+        export_model(self.model, path, "board", [Actions.UP, Actions.RIGHT, Actions.DOWN, Actions.LEFT])
 
     @classmethod
     def load(cls, dim, model_path):
+        from tensorflow.keras.models import load_model
+
         agent = cls(dim)
         path = model_path+"Size"+str(dim)
         agent.model = load_model(path)
         agent.updateTargetModel()
+        agent.compile_inference()
         return agent
 
     def save(self, model_path = None):
@@ -0,0 +1,123 @@
+import threading
+
+
+class AsyncLearner:
+    """Train a deep agent in a separate thread, while the game keeps running in the main thread
+
+    While the learner is running, the agent stops calling `replay` from `fit`: it only stores the
+    transitions in its memory and chooses the actions with a copy of the model. The learner thread trains the
+    model on the memory (computing the targets with the model itself, as `replay` does), and copies the new
+    weights to the acting model every `publish_interval` updates.
+
+    The learner can be used as a context manager, which starts and stops it. An exception raised in the learner
+    thread stops it, and is raised again by `stop`.
+
+    Parameters
+    -----------
+    agent : DQN or DeepQAgent
+        The agent to train
+    publish_interval : int, default=10
+        The number of updates after which the weights are copied to the acting model
+    train_every : int, default=1
+        The number of game steps for each update. If 0, the learner trains as fast as it can, as soon as the
+        memory holds a batch
+
+    Attributes
+    -----------
+    updates : int
+        The number of updates done since the learner was started (the calls to `replay` that trained the model)
+    steps : int
+        The number of game steps done since the learner was started
+    publish_lock : threading.Lock
+        Held while the weights are copied to the acting model, and while the agent uses it
+    """
+
+    def __init__(self, agent, publish_interval: int = 10, train_every: int = 1):
+        self.agent = agent
+        self.publish_interval = publish_interval
+        self.train_every = train_every
+        self.updates = 0
+        self.steps = 0
+        self.publish_lock = threading.Lock()
+        self._rounds = 0
+        self._running = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._acting_model = None
+
+    def __enter__(self) -> 'AsyncLearner':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start the learner thread"""
+        from tensorflow.keras.models import clone_model
+
+        self._acting_model = clone_model(self.agent.model)
+        self._acting_model.set_weights(self.agent.model.get_weights())
+        self.agent.compile_inference(self._acting_model)
+        self.agent.learner = self
+        self.updates = 0
+        self.steps = 0
+        self._rounds = 0
+        self._error = None
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the learner thread and let the agent act with the trained model again
+
+        Raises
+        -------
+        Exception
+            The exception that stopped the learner thread, if any
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        self.agent.learner = None
+        self.agent.compile_inference()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def notify_step(self):
+        """Signal that a new transition has been added to the memory. It is called by the agent"""
+        with self._condition:
+            self.steps += 1
+            self._condition.notify()
+
+    def _ready(self) -> bool:
+        if not self._running:
+            return True
+        if self.train_every == 0:
+            return len(self.agent.memory) >= self.agent.batch_size
+        return self.steps >= self.train_every * (self._rounds + 1)
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(self._ready)
+                    if not self._running:
+                        return
+                self._rounds += 1
+                if not self.agent.replay():
+                    continue
+                self.updates += 1
+                if self.updates % self.publish_interval == 0:
+                    weights = self.agent.model.get_weights()
+                    with self.publish_lock:
+                        self._acting_model.set_weights(weights)
+        except Exception as error:  # Raised again in the main thread by stop
+            self._error = error
+            self._running = False
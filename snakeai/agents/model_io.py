@@ -0,0 +1,208 @@
+"""A binary format for the tables of the tabular agents
+
+A ``.snkq`` file starts with a fixed header: the magic bytes ``SNKQ``, the version of the format and the flags
+(unsigned 16 bit integers), and the length of a JSON header (unsigned 32 bit integer). The JSON header stores the
+metadata of the model and, for each array, its name, type, shape, position and size in the file. The arrays
+follow, each one aligned to 64 bytes.
+
+Uncompressed arrays are opened with `np.memmap`, so loading does not copy them. With the compression flag each
+array is compressed with zlib (level 1), which makes the file smaller but requires reading it all.
+Files are written to a temporary file first and then renamed, so an interrupted save never leaves a broken model.
+"""
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, Tuple, Type
+
+import numpy as np
+
+MAGIC = b"SNKQ"
+VERSION = 1
+COMPRESSED = 1
+EXTENSION = ".snkq"
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<4sHHI")
+
+
+def _align(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any], compress: bool = False):
+    """Write arrays and metadata to a ``.snkq`` file, atomically
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    arrays : dict(str, np.ndarray)
+        The arrays to save, by name
+    metadata : dict
+        Information about the model. It must be serializable to JSON
+    compress : bool, default=False
+        Whether the arrays are compressed with zlib
+    """
+    blobs = {}
+    entries = []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+        blobs[name] = zlib.compress(data, 1) if compress else data
+        entries.append({"name": name, "dtype": array.dtype.str, "shape": array.shape, "size": len(blobs[name])})
+    # The offsets depend on the length of the header, which contains them: reserve enough digits for them
+    header = {"metadata": metadata, "arrays": entries}
+    for entry in entries:
+        entry["offset"] = 10 ** 15
+    data_start = _align(_PREFIX.size + len(json.dumps(header).encode()))
+    position = data_start
+    for entry in entries:
+        entry["offset"] = position
+        position = _align(position + entry["size"])
+    encoded = json.dumps(header).encode().ljust(data_start - _PREFIX.size)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fout:
+        fout.write(_PREFIX.pack(MAGIC, VERSION, COMPRESSED if compress else 0, len(encoded)))
+        fout.write(encoded)
+        for entry in entries:
+            fout.seek(entry["offset"])
+            fout.write(blobs[entry["name"]])
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Read the arrays and the metadata of a ``.snkq`` file
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+
+    Returns
+    -------
+    dict(str, np.ndarray)
+        The arrays, by name. If the file is not compressed, they are read-only memory maps of the file
+    dict
+        The metadata of the model
+
+    Raises
+    ------
+    ValueError
+        If the file is not in the ``.snkq`` format, or it has a newer version
+    """
+    with open(path, "rb") as fin:
+        magic, version, flags, header_size = _PREFIX.unpack(fin.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a {EXTENSION} file")
+        if version > VERSION:
+            raise ValueError(f"{path} has version {version}, but the maximum supported version is {VERSION}")
+        header = json.loads(fin.read(header_size))
+        arrays = {}
+        for entry in header["arrays"]:
+            dtype, shape = np.dtype(entry["dtype"]), tuple(entry["shape"])
+            if flags & COMPRESSED:
+                fin.seek(entry["offset"])
+                data = zlib.decompress(fin.read(entry["size"]))
+                arrays[entry["name"]] = np.frombuffer(data, dtype=dtype).reshape(shape)
+            elif entry["size"] == 0:
+                arrays[entry["name"]] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[entry["name"]] = np.memmap(path, dtype=dtype, mode="r", offset=entry["offset"], shape=shape)
+    return arrays, header["metadata"]
+
+
+def write_model(model_path: str, dim: int, agent: str, arrays: Dict[str, np.ndarray], compress: bool = False,
+                options: Dict[str, Any] = None):
+    """Save the table of an agent to ``model_path + str(dim) + ".snkq"``
+
+    Parameters
+    ----------
+    model_path : str
+        The path of the model, without the size of the board and the extension
+    dim : int
+        The size of the board
+    agent : str
+        The name of the class of the agent
+    arrays : dict(str, np.ndarray)
+        The arrays to save, by name
+    compress : bool, default=False
+        Whether the arrays are compressed with zlib
+    options : dict, optional
+        The arguments needed for creating an agent that uses the table
+    """
+    save_arrays(model_path + str(dim) + EXTENSION, arrays, {"agent": agent, "dim": dim, "options": options or {}},
+                compress)
+
+
+def read_model(model_path: str, dim: int, agent: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Read the table of an agent saved with `write_model`
+
+    Parameters
+    ----------
+    model_path : str
+        The path of the model, without the size of the board and the extension
+    dim : int
+        The size of the board
+    agent : str
+        The name of the class of the agent
+
+    Returns
+    -------
+    dict(str, np.ndarray)
+        The arrays, by name
+    dict
+        The arguments needed for creating an agent that uses the table
+
+    Raises
+    ------
+    TypeError
+        If the file contains the model of a different agent
+    """
+    arrays, metadata = load_arrays(model_path + str(dim) + EXTENSION)
+    if metadata.get("agent") != agent:
+        raise TypeError(f"The file contains a model of {metadata.get('agent')}, not of {agent}")
+    return arrays, metadata.get("options", {})
+
+
+def model_exists(model_path: str, dim: int) -> bool:
+    """Check whether a model in the ``.snkq`` format exists
+
+    Parameters
+    ----------
+    model_path : str
+        The path of the model, without the size of the board and the extension
+    dim : int
+        The size of the board
+
+    Returns
+    -------
+    bool
+        Whether the file exists
+    """
+    return os.path.exists(model_path + str(dim) + EXTENSION)
+
+
+def convert_legacy_model(cls: Type, dim: int, model_path: str, compress: bool = False) -> str:
+    """Convert a model saved by an older version (a bz2 compressed pickle) to the ``.snkq`` format
+
+    Parameters
+    ----------
+    cls : Type[AbstractAgent]
+        The class of the agent (`StateAgent`, `SimpleStateAgent` or `SimpleMCAgent`)
+    dim : int
+        The size of the board
+    model_path : str
+        The path of the model, without the size of the board and the extension
+    compress : bool, default=False
+        Whether the new file is compressed
+
+    Returns
+    -------
+    str
+        The path of the new file
+    """
+    cls.load_legacy(dim, model_path).save(model_path, compress=compress)
+    return model_path + str(dim) + EXTENSION
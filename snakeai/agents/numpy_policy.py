@@ -0,0 +1,257 @@
+import json
+from typing import Sequence
+
+import numpy as np
+
+from snakeai.agents.agent_interface import AbstractAgent, States
+from snakeai.game.constants import Actions, ACTION_LIST
+from snakeai.game.memento import FrozenState
+from snakeai.game.agent_controller import AgentGame
+
+
+def play(model_path: str, size: int = 20, fps: int = 7):
+    """Play with a deep model exported to NumPy, without loading TensorFlow
+
+    Parameters
+    ------------
+    model_path: str
+        the path to the ``.npz`` file created by `export_model`
+    size: int, default=20
+        the size of the board
+    fps: int, default=7
+        The number of fps for the game
+    """
+    agent = NumpyAgent.load(size, model_path)
+    game = AgentGame(size, replay_allowed=True, fps=fps)
+    game.play(agent)
+
+
+def export_model(model, path: str, encoding: str, actions: Sequence[Actions]):
+    """Save the weights of a Keras model to a ``.npz`` file that can be used by `NumpyPolicy`
+
+    Only ``Dense``, ``Conv2D`` (with stride 1 and valid padding) and ``Flatten`` layers are supported.
+
+    Parameters
+    -----------
+    model : keras.Model
+        The model to export
+    path : str
+        The path of the file. It should end with .npz
+    encoding : str {simple, board}
+        How the states are given to the model: the simplified state, or the board
+    actions : list(Actions)
+        The action corresponding to each output of the model
+
+    Raises
+    -------
+    ValueError
+        If the model contains a layer that is not supported
+    """
+    layers = []
+    weights = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "InputLayer":
+            continue
+        config = layer.get_config()
+        if kind in ("Dense", "Conv2D"):
+            if kind == "Conv2D" and (tuple(config["strides"]) != (1, 1) or config["padding"] != "valid"):
+                raise ValueError("Only Conv2D layers with stride 1 and valid padding are supported")
+            kernel, bias = layer.get_weights()
+            weights[f"kernel{len(layers)}"] = kernel.astype(np.float32)
+            weights[f"bias{len(layers)}"] = bias.astype(np.float32)
+            layers.append({"type": kind, "activation": config["activation"]})
+        elif kind == "Flatten":
+            layers.append({"type": kind})
+        else:
+            raise ValueError(f"Layer {kind} is not supported")
+    _write(path, layers, encoding, actions, weights)
+
+
+def _write(path: str, layers: list, encoding: str, actions: Sequence[Actions], weights: dict):
+    np.savez(path, layers=np.array(json.dumps(layers)), encoding=np.array(encoding),
+             actions=np.array([act.name for act in actions]), **weights)
+
+
+def _conv2d(x: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    n, height, width, channels = x.shape
+    k_height, k_width = kernel.shape[:2]
+    strides = x.strides
+    windows = np.lib.stride_tricks.as_strided(
+        x, (n, height - k_height + 1, width - k_width + 1, k_height, k_width, channels),
+        (strides[0], strides[1], strides[2], strides[1], strides[2], strides[3]))
+    return np.tensordot(windows, kernel, axes=([3, 4, 5], [0, 1, 2]))
+
+
+def _activate(x: np.ndarray, activation: str) -> np.ndarray:
+    if activation == "relu":
+        return np.maximum(x, 0)
+    if activation == "softmax":
+        exp = np.exp(x - x.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+    if activation == "linear":
+        return x
+    raise ValueError(f"Activation {activation} is not supported")
+
+
+class NumpyPolicy:
+    """The forward pass of a model exported with `export_model`, computed with NumPy
+
+    Parameters
+    -----------
+    path : str
+        The path to the ``.npz`` file
+
+    Attributes
+    -----------
+    encoding : str
+        How the states are given to the model (``"simple"`` or ``"board"``)
+    actions : list(Actions)
+        The action corresponding to each output of the model
+    """
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.encoding = str(data["encoding"])
+            self.actions = [Actions[name] for name in data["actions"]]
+            self._layers = json.loads(str(data["layers"]))
+            self._weights = {key: data[key] for key in data.files if key.startswith(("kernel", "bias"))}
+
+    def predict_batch(self, states: np.ndarray) -> np.ndarray:
+        """Compute the outputs of the model for a batch of states
+
+        Parameters
+        -----------
+        states : np.ndarray
+            The encoded states, with the batch as first dimension
+
+        Returns
+        --------
+        np.ndarray
+            The outputs, with shape (n, 4)
+        """
+        x = np.asarray(states, dtype=np.float32)
+        for i, layer in enumerate(self._layers):
+            if layer["type"] == "Flatten":
+                x = x.reshape((x.shape[0], -1))
+                continue
+            if layer["type"] == "Dense":
+                x = x @ self._weights[f"kernel{i}"]
+            else:
+                x = _conv2d(x, self._weights[f"kernel{i}"])
+            x = _activate(x + self._weights[f"bias{i}"], layer["activation"])
+        return x
+
+    def save(self, path: str):
+        """Write the model to a ``.npz`` file, in the format of `export_model`
+
+        Parameters
+        -----------
+        path : str
+            The path of the file. It should end with .npz
+        """
+        _write(path, self._layers, self.encoding, self.actions, self._weights)
+
+    def encode(self, state: FrozenState) -> np.ndarray:
+        """Encode a state as expected by the model
+
+        Parameters
+        -----------
+        state : FrozenState
+            The state to encode
+
+        Returns
+        --------
+        np.ndarray
+            The state, with a batch dimension of size 1
+        """
+        if self.encoding == "simple":
+            return np.array([state.simple_state], dtype=np.float32)
+        table = state.table
+        return np.reshape([table, table], (1, state.dim, state.dim, 2)).astype(np.float32)
+
+
+class NumpyAgent(AbstractAgent):
+    """An agent that plays greedily with a deep model exported to NumPy
+
+    It can be used for playing and evaluating `DQN` and `DeepQAgent` models without importing TensorFlow.
+    It cannot be trained: `save` writes the same model again.
+
+    Parameters
+    -----------
+    dim : int
+        the side of the board
+    policy : NumpyPolicy
+        The model used to choose the actions
+
+    Attributes
+    -----------
+    policy : NumpyPolicy
+        The model used to choose the actions
+    """
+
+    def __init__(self, dim: int, policy: NumpyPolicy):
+        super().__init__(dim, initial_epsilon=0)
+        self.policy = policy
+
+    def execute(self, state: FrozenState) -> Actions:
+        """Get the next action to do, given the state
+
+        Parameters
+        --------------
+        state : FrozenState
+            the current state of the game
+
+        Returns
+        --------------
+        Actions
+            the direction in which  to move
+        """
+        values = self.policy.predict_batch(self.policy.encode(state))
+        return self.policy.actions[int(np.argmax(values[0]))]
+
+    def execute_batch(self, states: States) -> np.ndarray:
+        """Get the next actions for many states, with a single forward pass
+
+        Parameters
+        --------------
+        states : list(FrozenState) or np.ndarray
+            the current states, or the states already encoded as expected by the model
+
+        Returns
+        --------------
+        np.ndarray
+            the actions, as positions in `ACTION_LIST`
+        """
+        if not isinstance(states, np.ndarray):
+            states = np.concatenate([self.policy.encode(state) for state in states])
+        to_action_list = np.array([ACTION_LIST.index(act) for act in self.policy.actions])
+        return to_action_list[np.argmax(self.policy.predict_batch(states), axis=1)]
+
+    def fit(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
+        """This agent cannot be trained, so this method does nothing"""
+
+    def save(self, model_path: str = None):
+        """Save the model to a ``.npz`` file. If no path is given, it uses a default one
+
+        Parameters
+        ------------
+        model_path : str, optional
+            the position where the model must be saved. It should end with .npz
+        """
+        if not model_path:
+            model_path = "./models/NumpyModel.npz"
+        self.policy.save(model_path)
+
+    @classmethod
+    def load(cls, dim: int, model_path: str) -> 'NumpyAgent':
+        """Create a new agent from a file created by `export_model`
+
+        Parameters
+        -----------
+        dim : int
+            The size of the board
+        model_path: str
+            The path to the ``.npz`` file
+        """
+        return cls(dim, NumpyPolicy(model_path))
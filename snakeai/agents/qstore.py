@@ -0,0 +1,350 @@
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("actions", "<u4"), ("capacity", "<u8"),
+                         ("count", "<u8"), ("flags", "<u4")])
+RECORD_DTYPE = np.dtype([("key", "<u8"), ("values", "<f4", (4,))])
+MAGIC = b"SNKQSTOR"
+# Version 2 adds the flags. In version 1 stores that part of the header is zero, which means no flags
+VERSION = 2
+# The flag set when the keys are the canonical orientations of the states (see `snakeai.game.symmetry`)
+SYMMETRIC = 1
+
+
+def state_key(state: str) -> int:
+    """Compute the 8 bytes key used by `MMapQStore` for a state
+
+    Parameters
+    ----------
+    state : str
+        The description of the state (e.g. `FrozenState.table_string`)
+
+    Returns
+    -------
+    int
+        A 64 bit hash of the state. It is never 0, which marks the empty records
+    """
+    key = int.from_bytes(hashlib.blake2b(state.encode(), digest_size=8).digest(), "little")
+    return key or 1
+
+
+class MMapQStore:
+    """A table of Q values stored on disk, in an open addressing hash table accessed through mmap
+
+    Each record holds the 64 bit hash of a state (see `state_key`) and its 4 Q values as float32. The hash
+    is used in place of the state, so two states with the same hash would share their values; with 64 bits
+    this is negligible even for billions of states. The table doubles its capacity when it is 70% full.
+
+    The store behaves like the ``dict`` used by `StateAgent` (`get`, ``[]``, ``in`` and ``len``). The most
+    recently used states are kept in an in-memory cache, and the changed values are written to the file
+    when they leave the cache or when `flush` is called: the changes still in the cache are lost unless the
+    store is flushed or closed (it can be used as a context manager, which closes it). Many processes can open
+    the same file in read-only mode, sharing the pages of the model.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file. It is created if it does not exist
+    read_only : bool, default=False
+        Whether the file is opened for reading only
+    cache_size : int, default=100000
+        The maximum number of states kept in the cache
+    capacity : int, default=1024
+        The initial number of records, when a new file is created. It is rounded up to a power of 2
+    symmetric : bool, optional
+        Whether the keys are the canonical orientations of the states, as learned by a symmetric `StateAgent`.
+        It is written in a new file. For an existing file, it is checked against the file; if not given, it is
+        read from the file (False for a new file)
+
+    Attributes
+    ----------
+    path : str
+        The path of the file
+    read_only : bool
+        Whether the store can be modified
+    symmetric : bool
+        Whether the keys are the canonical orientations of the states
+
+    Raises
+    ------
+    ValueError
+        If the file is not a Q store, or `symmetric` does not match the file
+    """
+    MAX_LOAD = 0.7
+
+    def __init__(self, path: str, read_only: bool = False, cache_size: int = 100000, capacity: int = 1024,
+                 symmetric: Optional[bool] = None):
+        self.path = path
+        self.read_only = read_only
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._dirty = set()
+        if not os.path.exists(path):
+            if read_only:
+                raise FileNotFoundError(path)
+            self._create(path, 1 << max(0, capacity - 1).bit_length(), SYMMETRIC if symmetric else 0)
+        self._open()
+        if symmetric is not None and symmetric != self.symmetric:
+            raise ValueError(f"{path} holds {'canonical' if self.symmetric else 'plain'} keys, "
+                             f"but symmetric={symmetric} was given")
+
+    @staticmethod
+    def _create(path: str, capacity: int, flags: int = 0):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["actions"] = 4
+        header["capacity"] = capacity
+        header["flags"] = flags
+        with open(path, "wb") as fout:
+            fout.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+            fout.truncate(HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+
+    def _open(self):
+        self._file = np.memmap(self.path, dtype=np.uint8, mode="r" if self.read_only else "r+")
+        self._header = self._file[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        if self._header["magic"][0] != MAGIC or self._header["version"][0] not in (1, VERSION):
+            raise ValueError(f"{self.path} is not a Q store")
+        self._records = self._file[HEADER_SIZE:].view(RECORD_DTYPE)
+        self._keys = self._records["key"]
+        self._mask = len(self._records) - 1
+
+    @property
+    def symmetric(self) -> bool:
+        """bool : Whether the keys are the canonical orientations of the states"""
+        return bool(self._header["flags"][0] & SYMMETRIC)
+
+    @property
+    def capacity(self) -> int:
+        """int : The number of records in the file"""
+        return len(self._records)
+
+    def _find(self, key: int) -> int:
+        slot = key & self._mask
+        while True:
+            found = int(self._keys[slot])
+            if found == key or found == 0:
+                return slot
+            slot = (slot + 1) & self._mask
+
+    def _read(self, key: int) -> Optional[List[float]]:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        slot = self._find(key)
+        if self._keys[slot] == 0:
+            return None
+        values = self._records["values"][slot].tolist()
+        self._remember(key, values)
+        return values
+
+    def _remember(self, key: int, values: List[float]):
+        self._cache[key] = values
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            old_key, old_values = self._cache.popitem(last=False)
+            if old_key in self._dirty:
+                self._dirty.discard(old_key)
+                self._write(old_key, old_values)
+
+    def _write(self, key: int, values: List[float]):
+        slot = self._find(key)
+        if self._keys[slot] == 0:
+            if self._header["count"][0] + 1 > self.MAX_LOAD * self.capacity:
+                self._resize(2 * self.capacity)
+                slot = self._find(key)
+            self._header["count"] += 1
+            self._keys[slot] = key
+        self._records["values"][slot] = values
+
+    def _resize(self, capacity: int):
+        records = self._records[self._keys != 0].copy()
+        flags = int(self._header["flags"][0])
+        self._file.flush()
+        del self._file, self._header, self._records, self._keys
+        tmp_path = self.path + ".tmp"
+        self._create(tmp_path, capacity, flags)
+        os.replace(tmp_path, self.path)
+        self._open()
+        self._insert_all(records)
+
+    def _insert_all(self, records: np.ndarray):
+        # Linear probing, vectorized: at each round, each empty slot takes the first pending record that wants it
+        self._header["count"] = len(records)
+        slots = records["key"] & np.uint64(self._mask)
+        pending = np.arange(len(records))
+        while len(pending):
+            free = self._keys[slots] == 0
+            _, first = np.unique(np.where(free, slots, np.uint64(self.capacity)), return_index=True)
+            placed = first[free[first]]
+            self._records[slots[placed]] = records[pending[placed]]
+            waiting = np.ones(len(pending), dtype=bool)
+            waiting[placed] = False
+            pending, slots = pending[waiting], (slots[waiting] + np.uint64(1)) & np.uint64(self._mask)
+
+    def get(self, state: str, default=None):
+        """Get the Q values of a state, or `default` if the state is not stored
+
+        Parameters
+        ----------
+        state : str
+            The state
+        default : optional
+            The value returned for the missing states
+
+        Returns
+        -------
+        list(float)
+            A copy of the Q values, in the order of `ACTION_LIST`
+        """
+        values = self._read(state_key(state))
+        return default if values is None else list(values)
+
+    def __getitem__(self, state: str) -> List[float]:
+        values = self.get(state)
+        if values is None:
+            raise KeyError(state)
+        return values
+
+    def __contains__(self, state: str) -> bool:
+        return self._read(state_key(state)) is not None
+
+    def __setitem__(self, state: str, values: List[float]):
+        if self.read_only:
+            raise ValueError(f"{self.path} is opened in read-only mode")
+        key = state_key(state)
+        self._dirty.add(key)
+        self._remember(key, [float(x) for x in values])
+
+    def update(self, states: Dict[str, List[float]]):
+        """Store the values of many states
+
+        Parameters
+        ----------
+        states : dict(str, list(float))
+            The Q values of each state
+        """
+        for state, values in states.items():
+            self[state] = values
+
+    def __len__(self) -> int:
+        self._write_back()
+        return int(self._header["count"][0])
+
+    def _write_back(self):
+        for key in self._dirty:
+            self._write(key, self._cache[key])
+        self._dirty.clear()
+
+    def flush(self):
+        """Write all the changes to the file"""
+        if self.read_only:
+            return
+        self._write_back()
+        self._file.flush()
+
+    def __enter__(self) -> 'MMapQStore':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Write all the changes and close the file"""
+        self.flush()
+        self._cache.clear()
+        del self._file, self._header, self._records, self._keys
+
+    def copy(self, path: str):
+        """Write the store, with all the changes, to another file
+
+        Parameters
+        ----------
+        path : str
+            The path of the copy
+        """
+        self.flush()
+        shutil.copyfile(self.path, path)
+
+    def prune(self, default: List[float]) -> int:
+        """Remove the states whose Q values are all equal to `default`
+
+        Parameters
+        ----------
+        default : list(float)
+            The default Q values
+
+        Returns
+        -------
+        int
+            The number of states removed
+        """
+        if self.read_only:
+            raise ValueError(f"{self.path} is opened in read-only mode")
+        self.flush()
+        used = self._keys != 0
+        unchanged = used & (self._records["values"] == np.asarray(default, dtype=np.float32)).all(axis=1)
+        removed = int(unchanged.sum())
+        if removed:
+            records = self._records[used & ~unchanged].copy()
+            self._records[:] = 0
+            self._insert_all(records)
+            self._cache.clear()
+        return removed
+
+
+class SimpleTableView(MutableMapping):
+    """A live ``dict``-like view of a table indexed by simplified state, with `simple_state_string` as keys
+
+    It gives the tables of `SimpleStateAgent` and `SimpleMCAgent` the interface of the ``defaultdict`` they
+    replaced. Reading a state returns its row of the table (a view, so that changing it changes the table),
+    writing a state sets its row, and deleting it restores the default values. Iterating lists only the
+    states returned by ``listed``.
+
+    Parameters
+    ----------
+    table : np.ndarray
+        The table, with one row for each of the 4096 simplified states
+    default : list
+        The default values of a row
+    listed : callable
+        A function that returns the indices of the rows listed by the view
+    """
+
+    def __init__(self, table: np.ndarray, default: Sequence, listed: Callable[[], np.ndarray]):
+        self.table = table
+        self.default = default
+        self.listed = listed
+
+    def _index(self, state: str) -> int:
+        if not isinstance(state, str) or len(state) != 12 or set(state) - {"0", "1"}:
+            raise KeyError(state)
+        return int(state, 2)
+
+    def __getitem__(self, state: str) -> np.ndarray:
+        return self.table[self._index(state)]
+
+    def __setitem__(self, state: str, values: Sequence):
+        self.table[self._index(state)] = values
+
+    def __delitem__(self, state: str):
+        self.table[self._index(state)] = self.default
+
+    def __contains__(self, state) -> bool:
+        try:
+            return self._index(state) in set(self.listed().tolist())
+        except KeyError:
+            return False
+
+    def __iter__(self) -> Iterator[str]:
+        return (format(index, "012b") for index in self.listed().tolist())
+
+    def __len__(self) -> int:
+        return len(self.listed())
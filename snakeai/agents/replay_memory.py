@@ -0,0 +1,363 @@
+import random
+import threading
+from typing import Tuple, Optional
+
+import numpy as np
+
+
+class ReplayMemory:
+    """A memory of transitions for experience replay, stored in preallocated arrays
+
+    The memory works as a ring buffer: when it is full, the oldest transitions are overwritten.
+    Each field of the transitions is stored in its own contiguous array, so that sampling a batch is just
+    an index gather on each array. Storing and gathering transitions are protected by a lock, so that
+    a learner thread can sample while the game is adding transitions.
+
+    Parameters
+    -------------
+    capacity : int
+        The maximum number of transitions stored
+    state_shape : tuple(int)
+        The shape of a single state
+    state_dtype : np.dtype, default=np.int8
+        The type used for storing the states
+    filename : str, optional
+        If given, the arrays are memory mapped to ``.npy`` files starting with this path, so that the
+        capacity is not limited by the available RAM
+
+    Attributes
+    ------------
+    capacity : int
+        The maximum number of transitions stored
+    states : np.ndarray
+        The states before each action
+    actions : np.ndarray
+        The actions taken
+    rewards : np.ndarray
+        The rewards obtained
+    next_states : np.ndarray
+        The states after each action
+    dones : np.ndarray
+        Whether each next state is terminal
+    """
+
+    def __init__(self, capacity: int, state_shape: Tuple[int, ...], state_dtype: np.dtype = np.int8,
+                 filename: Optional[str] = None):
+        self.capacity = capacity
+        self.filename = filename
+        self.states = self._allocate("states", (capacity,) + tuple(state_shape), state_dtype)
+        self.actions = self._allocate("actions", (capacity,), np.int8)
+        self.rewards = self._allocate("rewards", (capacity,), np.float32)
+        self.next_states = self._allocate("next_states", (capacity,) + tuple(state_shape), state_dtype)
+        self.dones = self._allocate("dones", (capacity,), np.bool_)
+        self._position = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _allocate(self, name: str, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        if self.filename is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(f"{self.filename}_{name}.npy", mode="w+", dtype=dtype, shape=shape)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, state, action: int, rew: float, next_state, done: bool) -> int:
+        """Store a transition, overwriting the oldest one if the memory is full
+
+        Parameters
+        -----------
+        state : array_like
+            The state before taking the action
+        action : int
+            The index of the action taken
+        rew : float
+            The reward obtained
+        next_state : array_like
+            The state after taking the action
+        done : bool
+            Whether `next_state` is terminal
+
+        Returns
+        --------
+        int
+            The position where the transition has been stored
+        """
+        with self._lock:
+            pos = self._position
+            self.states[pos] = state
+            self.actions[pos] = action
+            self.rewards[pos] = rew
+            self.next_states[pos] = next_state
+            self.dones[pos] = done
+            self._position = (pos + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+        return pos
+
+    def extend(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray, next_states: np.ndarray,
+               dones: np.ndarray) -> np.ndarray:
+        """Store many transitions at once, overwriting the oldest ones if the memory is full
+
+        Parameters
+        -----------
+        states : np.ndarray
+            The states before taking the actions, with the batch as first dimension
+        actions : np.ndarray
+            The indices of the actions taken
+        rewards : np.ndarray
+            The rewards obtained
+        next_states : np.ndarray
+            The states after taking the actions
+        dones : np.ndarray
+            Whether each next state is terminal
+
+        Returns
+        --------
+        np.ndarray
+            The positions where the transitions have been stored
+        """
+        n = len(actions)
+        # If there are more transitions than the capacity, only the most recent ones are kept
+        keep = slice(max(0, n - self.capacity), n)
+        with self._lock:
+            positions = (self._position + np.arange(n)[keep]) % self.capacity
+            self.states[positions] = np.asarray(states)[keep]
+            self.actions[positions] = np.asarray(actions)[keep]
+            self.rewards[positions] = np.asarray(rewards)[keep]
+            self.next_states[positions] = np.asarray(next_states)[keep]
+            self.dones[positions] = np.asarray(dones)[keep]
+            self._position = (self._position + n) % self.capacity
+            self._size = min(self._size + n, self.capacity)
+        return positions
+
+    def sample(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Sample uniformly a batch of distinct transitions (without replacement, like `random.sample`)
+
+        Parameters
+        -----------
+        batch_size : int
+            The number of transitions to sample
+
+        Returns
+        --------
+        tuple(np.ndarray)
+            The states, actions, rewards, next states and dones of the sampled transitions
+        """
+        return self.gather(self._uniform_indices(batch_size))
+
+    def sample_weighted(self, batch_size: int) -> Tuple[Tuple[np.ndarray, ...], np.ndarray, np.ndarray]:
+        """Sample a batch of transitions, together with their positions and importance sampling weights
+
+        With uniform sampling all the weights are 1.
+
+        Parameters
+        -----------
+        batch_size : int
+            The number of transitions to sample
+
+        Returns
+        --------
+        tuple(np.ndarray)
+            The states, actions, rewards, next states and dones of the sampled transitions
+        np.ndarray
+            The positions of the sampled transitions
+        np.ndarray
+            The importance sampling weights
+        """
+        indices = self._uniform_indices(batch_size)
+        return self.gather(indices), indices, np.ones(batch_size, dtype=np.float32)
+
+    def _uniform_indices(self, batch_size: int) -> np.ndarray:
+        # random.sample draws distinct positions in O(batch_size), without permuting the whole memory
+        return np.array(random.sample(range(self._size), batch_size), dtype=np.int64)
+
+    def update_priorities(self, indices: np.ndarray, errors: np.ndarray):
+        """Update the priorities of the transitions after training on them. Uniform memories ignore this
+
+        Parameters
+        -----------
+        indices : np.ndarray
+            The positions of the transitions
+        errors : np.ndarray
+            The TD errors of the transitions
+        """
+
+    def gather(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get the transitions stored at the given positions
+
+        Parameters
+        -----------
+        indices : np.ndarray
+            The positions of the transitions
+
+        Returns
+        --------
+        tuple(np.ndarray)
+            The states, actions, rewards, next states and dones of the transitions
+        """
+        with self._lock:
+            return (self.states[indices], self.actions[indices], self.rewards[indices],
+                    self.next_states[indices], self.dones[indices])
+
+
+class SumTree:
+    """A binary tree stored in an array, where each node holds the sum of its children
+
+    Leaves hold the priorities. Both updating a priority and finding the leaf corresponding to a
+    cumulative value take O(log n), and are vectorized over batches.
+
+    Parameters
+    -------------
+    capacity : int
+        The number of leaves needed
+    """
+
+    def __init__(self, capacity: int):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        """float : The sum of all priorities"""
+        return self.tree[1]
+
+    def get(self, indices: np.ndarray) -> np.ndarray:
+        """Get the priorities of the given leaves"""
+        return self.tree[np.asarray(indices) + self.leaves]
+
+    def update(self, indices: np.ndarray, priorities: np.ndarray):
+        """Set the priorities of the given leaves and update their ancestors
+
+        Parameters
+        -----------
+        indices : np.ndarray
+            The leaves to update
+        priorities : np.ndarray
+            The new priorities
+        """
+        nodes = np.asarray(indices) + self.leaves
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """Find the leaves where the cumulative sum of the priorities reaches the given values
+
+        Parameters
+        -----------
+        values : np.ndarray
+            Values in the interval [0, `total`)
+
+        Returns
+        --------
+        np.ndarray
+            The indices of the leaves
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = self.tree[2 * nodes]
+            go_right = values >= left
+            values -= np.where(go_right, left, 0)
+            nodes = 2 * nodes + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """A replay memory that samples transitions proportionally to their TD error
+
+    New transitions get the highest priority seen so far, so that they are sampled at least once.
+    The bias introduced by the non uniform sampling is corrected with importance sampling weights,
+    whose exponent `beta` is annealed towards 1.
+
+    Parameters
+    -------------
+    capacity : int
+        The maximum number of transitions stored
+    state_shape : tuple(int)
+        The shape of a single state
+    state_dtype : np.dtype, default=np.int8
+        The type used for storing the states
+    filename : str, optional
+        If given, the arrays are memory mapped to ``.npy`` files starting with this path
+    alpha : float [0, 1], default=0.6
+        How much the priorities are used (0 is uniform sampling)
+    beta : float [0, 1], default=0.4
+        The initial exponent of the importance sampling weights
+    beta_increment : float, default=0.0001
+        The increase of `beta` after each sampled batch
+
+    Attributes
+    ------------
+    tree : SumTree
+        The priorities of the transitions
+    MIN_PRIORITY : float
+        The value added to the errors, so that no transition has zero probability
+    """
+    MIN_PRIORITY = 0.01
+
+    def __init__(self, capacity: int, state_shape: Tuple[int, ...], state_dtype: np.dtype = np.int8,
+                 filename: Optional[str] = None, alpha: float = 0.6, beta: float = 0.4,
+                 beta_increment: float = 0.0001):
+        super().__init__(capacity, state_shape, state_dtype, filename)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.tree = SumTree(capacity)
+        self._max_priority = 1.0
+
+    def append(self, state, action: int, rew: float, next_state, done: bool) -> int:
+        pos = super().append(state, action, rew, next_state, done)
+        with self._lock:
+            self.tree.update(np.array([pos]), np.array([self._max_priority]))
+        return pos
+
+    def extend(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray, next_states: np.ndarray,
+               dones: np.ndarray) -> np.ndarray:
+        positions = super().extend(states, actions, rewards, next_states, dones)
+        with self._lock:
+            self.tree.update(positions, np.full(len(positions), self._max_priority))
+        return positions
+
+    def sample(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        return self.sample_weighted(batch_size)[0]
+
+    def sample_weighted(self, batch_size: int) -> Tuple[Tuple[np.ndarray, ...], np.ndarray, np.ndarray]:
+        """Sample a batch of transitions proportionally to their priority
+
+        The interval of cumulative priorities is split in `batch_size` segments, and one transition is
+        sampled from each of them.
+
+        Parameters
+        -----------
+        batch_size : int
+            The number of transitions to sample
+
+        Returns
+        --------
+        tuple(np.ndarray)
+            The states, actions, rewards, next states and dones of the sampled transitions
+        np.ndarray
+            The positions of the sampled transitions
+        np.ndarray
+            The importance sampling weights, normalized so that the maximum is 1
+        """
+        with self._lock:
+            total = self.tree.total
+            values = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+            indices = np.minimum(self.tree.find(values), len(self) - 1)
+            probabilities = self.tree.get(indices) / total
+        weights = (len(self) * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self.gather(indices), indices, weights.astype(np.float32)
+
+    def update_priorities(self, indices: np.ndarray, errors: np.ndarray):
+        priorities = (np.abs(errors) + self.MIN_PRIORITY) ** self.alpha
+        with self._lock:
+            self._max_priority = max(self._max_priority, priorities.max())
+            self.tree.update(indices, priorities)
@@ -1,17 +1,17 @@
 import random
-from collections import deque
+from typing import TYPE_CHECKING, Tuple
 import numpy as np
-from keras.layers import Dense
-from tensorflow import keras
-from tensorflow.keras import layers
-from tensorflow.keras.optimizers import Adam
-from snakeai.game.constants import Actions
-from snakeai.agents.agent_interface import AbstractAgent
-from tensorflow.keras.models import load_model
-
-from snakeai.game.memento import FrozenState
+from snakeai.game.constants import Actions, ACTION_LIST
+from snakeai.agents.agent_interface import AbstractAgent, States
+from snakeai.agents.replay_memory import ReplayMemory, PrioritizedReplayMemory
+from snakeai.agents.numpy_policy import export_model
+
+from snakeai.game.memento import FrozenState, encode_simple_states
 from snakeai.game.agent_controller import AgentGame
 
+if TYPE_CHECKING:
+    from tensorflow import keras
+
 
 def play(size: int = 20, model_path: str = None, fps: int = 7):
     """Play with an already trained `DQN`
@@ -43,6 +43,12 @@ class DQN(AbstractAgent):
     -----------
     dim : int
         the dimension of the board (side length)
+    memory_size : int, default=2500
+        The maximum number of transitions kept in memory
+    memory_file : str, optional
+        If given, the memory is backed by memory mapped files starting with this path
+    prioritized : bool, default=False
+        Whether to sample the transitions proportionally to their TD error, instead of uniformly
 
     Attributes
     -----------
@@ -60,35 +66,98 @@ class DQN(AbstractAgent):
         The decay factor of epsilon at each episode
     learning_rate : float [0, 1]
         The learning rate
-    memory : deque
-        The list of states used for learning
+    memory : ReplayMemory
+        The transitions used for learning
     model : keras.Model
         The neural network used by the agent
+    train_every : int
+        The number of steps between two updates of the model
+    learner : AsyncLearner or None
+        The learner that is training the model in a separate thread, if any
+    ACTIONS : list(Actions)
+        The action corresponding to each output of the model
     """
 
     EPSILON_DECAY = 0.995
+    ACTIONS = [Actions.UP, Actions.RIGHT, Actions.DOWN, Actions.LEFT]
+    # Conversions between the outputs of the model and the positions in ACTION_LIST
+    _TO_ACTION_LIST = np.array([ACTION_LIST.index(act) for act in ACTIONS])
+    _FROM_ACTION_LIST = np.argsort(_TO_ACTION_LIST)
     GAMMA = 0.95
 
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, memory_size: int = 2500, memory_file: str = None, prioritized: bool = False):
         super().__init__(dim)
         self.action_space = 4
         self.state_space = 12
         self.batch_size = 500
         self.learning_rate = 0.00025
-        self.memory = deque(maxlen=2500)
+        memory_cls = PrioritizedReplayMemory if prioritized else ReplayMemory
+        self.memory = memory_cls(memory_size, (self.state_space,), np.int8, memory_file)
         self.model = self.build_model()
+        self.compile_inference()
+        self.train_every = 1
+        self.learner = None
+        self._steps = 0
 
-    def build_model(self) -> keras.Model:
+    def build_model(self) -> 'keras.Model':
         """Create The Deep Learning model"""
+        from tensorflow import keras
+        from tensorflow.keras.layers import Dense
+        from tensorflow.keras.optimizers import Adam
+
         inputs = keras.Input((self.state_space,))
         x = Dense(128, activation="relu")(inputs)
         x = Dense(128, activation="relu")(x)
         x = Dense(128, activation="relu")(x)
-        outputs = layers.Dense(self.action_space, activation="softmax", name="output")(x)
+        outputs = Dense(self.action_space, activation="softmax", name="output")(x)
         model = keras.Model(inputs=inputs, outputs=[outputs])
         model.compile(optimizer=Adam(learning_rate=self.learning_rate), loss="mse")
         return model
 
+    def compile_inference(self, acting_model: 'keras.Model' = None):
+        """Compile the forward passes of `model` and of the acting model into TensorFlow graphs, used by
+        `predict_batch`
+
+        This must be called again every time `model` is replaced by a new object
+
+        Parameters
+        -----------
+        acting_model : keras.Model, optional
+            The model used to choose the actions (e.g. the copy published by an `AsyncLearner`), by default `model`
+        """
+        import tensorflow as tf
+
+        spec = [tf.TensorSpec((None, self.state_space), tf.float32)]
+        model = self.model
+        self._forward = tf.function(lambda x: model(x, training=False), input_signature=spec)
+        if acting_model is None:
+            self._acting_forward = self._forward
+        else:
+            self._acting_forward = tf.function(lambda x: acting_model(x, training=False), input_signature=spec)
+
+    def predict_batch(self, states: np.ndarray, acting: bool = False) -> np.ndarray:
+        """Compute the Q values of a batch of states with a single call to the compiled model
+
+        This avoids the fixed overhead of ``model.predict``, which dominates when it is called on a single state.
+
+        Parameters
+        -----------
+        states : np.ndarray
+            The simplified states, with shape (n, 12)
+        acting : bool, default=False
+            Whether to use the acting model (see `compile_inference`) instead of `model`. Training always uses `model`
+
+        Returns
+        --------
+        np.ndarray
+            The Q values, with shape (n, 4)
+        """
+        states = np.asarray(states, dtype=np.float32).reshape((-1, self.state_space))
+        if acting and self.learner is not None:
+            with self.learner.publish_lock:
+                return self._acting_forward(states).numpy()
+        return self._forward(states).numpy()
+
     def execute(self, state: FrozenState) -> Actions:
         """Get the next action to do, given the state
         Parameters
@@ -105,15 +174,29 @@ class DQN(AbstractAgent):
         if np.random.rand() <= self.epsilon:
             act = random.randrange(self.action_space)
         else:
-            act_values = self.model.predict(state)
+            act_values = self.predict_batch(state, acting=True)
             act = np.argmax(act_values[0])
-        if act == 0:
-            return Actions.UP
-        if act == 1:
-            return Actions.RIGHT
-        if act == 2:
-            return Actions.DOWN
-        return Actions.LEFT
+        return self.ACTIONS[act]
+
+    def execute_batch(self, states: States) -> np.ndarray:
+        """Get the next actions for many states, with a single call to the model
+
+        Parameters
+        -----------
+        states : list(FrozenState) or np.ndarray
+            The current states, or their simplified description with shape (n, 12)
+
+        Returns
+        --------
+        np.ndarray
+            The actions, as positions in `ACTION_LIST`
+        """
+        if not isinstance(states, np.ndarray):
+            states = encode_simple_states(states)
+        actions = np.argmax(self.predict_batch(states, acting=True), axis=1)
+        explore = np.random.rand(len(actions)) <= self.epsilon
+        actions[explore] = np.random.randint(0, self.action_space, np.count_nonzero(explore))
+        return self._TO_ACTION_LIST[actions]
 
     def fit(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
         """Add the current step to the memory and train the model
@@ -131,35 +214,94 @@ class DQN(AbstractAgent):
         done : bool
             Whether the state is terminal 
         """
-        action = [Actions.UP, Actions.RIGHT, Actions.DOWN, Actions.LEFT].index(action)
-        old_state = np.reshape(old_state.simple_state, (1, self.state_space))
-        state = np.reshape(state.simple_state, (1, self.state_space))
-        self.memory.append((old_state, action, rew, state, done))
-        self.replay()
+        action = self.ACTIONS.index(action)
+        self.memory.append(old_state.simple_state, action, rew, state.simple_state, done)
+        if self.learner is not None:
+            self.learner.notify_step()
+        else:
+            self._steps += 1
+            if self._steps % self.train_every == 0:
+                self.replay()
 
-    def replay(self):
-        """Train the model with one batch"""
-        if len(self.memory) < self.batch_size:
-            return
+    def fit_batch(self, transitions: Tuple[States, np.ndarray, np.ndarray, States, np.ndarray]):
+        """Add one step of many games to the memory, and train the model with one batch
 
-        minibatch = random.sample(self.memory, self.batch_size)
-        states = np.array([i[0] for i in minibatch])
-        actions = np.array([i[1] for i in minibatch])
-        rewards = np.array([i[2] for i in minibatch])
-        next_states = np.array([i[3] for i in minibatch])
-        dones = np.array([i[4] for i in minibatch])
+        Parameters
+        -----------
+        transitions : tuple
+            The states before taking the actions, the actions (as positions in `ACTION_LIST`), the rewards,
+            the states after taking the actions and whether each new state is terminal. The states can
+            be given as `FrozenState` objects or as their simplified description
+        """
+        old_states, actions, rewards, states, dones = transitions
+        if not isinstance(old_states, np.ndarray):
+            old_states = encode_simple_states(old_states)
+        if not isinstance(states, np.ndarray):
+            states = encode_simple_states(states)
+        self.memory.extend(old_states, self._FROM_ACTION_LIST[np.asarray(actions)], rewards, states, dones)
+        if self.learner is not None:
+            self.learner.notify_step()
+        else:
+            self._steps += 1
+            if self._steps % self.train_every == 0:
+                self.replay()
 
-        states = np.squeeze(states)
-        next_states = np.squeeze(next_states)
+    def replay(self) -> bool:
+        """Train the model with one batch
 
-        targets = rewards + self.GAMMA * (np.amax(self.model.predict(next_states), axis=1)) * (1 - dones)
-        targets_full = self.model.predict(states)
+        Returns
+        --------
+        bool
+            Whether the model has been trained: there is no update until the memory holds `batch_size` transitions
+        """
+        if len(self.memory) < self.batch_size:
+            return False
 
-        ind = np.array(list(range(self.batch_size)))
-        targets_full[[ind], [actions]] = targets
-        self.model.fit(states, targets_full, epochs=1, verbose=0)
+        (states, actions, rewards, next_states, dones), indices, weights = self.memory.sample_weighted(self.batch_size)
+        self.memory.update_priorities(indices, self.train_batch(states, actions, rewards, next_states, dones, weights))
         if self.epsilon > self.MIN_EPSILON:
             self.epsilon *= self.EPSILON_DECAY
+        return True
+
+    def train_batch(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray, next_states: np.ndarray,
+                    dones: np.ndarray, weights: np.ndarray = None, minibatch_size: int = None) -> np.ndarray:
+        """Train the model for one epoch on a batch of transitions
+
+        The targets are all computed with the model before training, with one call for the whole batch. The
+        batch can be much larger than `batch_size` (e.g. when training from a dataset).
+
+        Parameters
+        -----------
+        states : np.ndarray
+            The simplified states before taking the actions, with shape (n, 12)
+        actions : np.ndarray
+            The actions, as outputs of the model (positions in `ACTIONS`)
+        rewards : np.ndarray
+            The rewards
+        next_states : np.ndarray
+            The simplified states after taking the actions
+        dones : np.ndarray
+            Whether each new state is terminal
+        weights : np.ndarray, optional
+            The weight of each transition in the loss
+        minibatch_size : int, optional
+            The number of transitions of each gradient step. If not given, the default of ``keras.Model.fit``
+
+        Returns
+        --------
+        np.ndarray
+            The TD error of each transition, before training
+        """
+        dones = np.asarray(dones, dtype=np.float32)
+        targets = rewards + self.GAMMA * (np.amax(self.predict_batch(next_states), axis=1)) * (1 - dones)
+        targets_full = self.predict_batch(states)
+
+        ind = np.arange(len(targets))
+        errors = targets - targets_full[ind, actions]
+        targets_full[ind, actions] = targets
+        self.model.fit(np.asarray(states, dtype=np.float32), targets_full, sample_weight=weights,
+                       batch_size=minibatch_size, epochs=1, verbose=0)
+        return errors
 
     def save(self, model_path: str = None):
         """Save the model to a file. if no path is given, it uses a default one."""
@@ -167,9 +309,22 @@ class DQN(AbstractAgent):
             model_path = "./models/SimpleDeepModel"
         self.model.save(model_path)
 
+    def export(self, path: str):
+        """Export the weights of the model to a ``.npz`` file, that can be played by `NumpyAgent` without TensorFlow
+
+        Parameters
+        -----------
+        path : str
+            The path of the file. It should end with .npz
+        """
+        export_model(self.model, path, "simple", self.ACTIONS)
+
     @classmethod
     def load(cls, dim: int, model_path: str) -> 'DQN':
         """Create a new agent from the given file."""
+        from tensorflow.keras.models import load_model
+
         agent = cls(dim)
         agent.model = load_model(model_path)
+        agent.compile_inference()
         return agent
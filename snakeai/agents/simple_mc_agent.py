@@ -3,10 +3,15 @@ import pickle
 import random
 import bz2
 import time
-from collections import defaultdict
-from snakeai.game.constants import Actions
-from snakeai.agents.agent_interface import AbstractAgent
-from snakeai.game.memento import FrozenState
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from snakeai.game.constants import Actions, ACTION_LIST, Rewards
+from snakeai.agents.agent_interface import AbstractAgent, States
+from snakeai.agents.model_io import model_exists, read_model, write_model
+from snakeai.agents.qstore import SimpleTableView
+from snakeai.game.memento import FrozenState, SIMPLE_STATES, encode_simple_states, simple_state_indices
 from snakeai.game.agent_controller import AgentGame
 
 
@@ -33,21 +38,138 @@ def play(size: int = 20, model_path: str = None, fps: int = 7):
     game.play(agent)
 
 
+def discounted_returns(rewards: np.ndarray, gamma: float, block: int = 1024) -> np.ndarray:
+    """Compute the discounted return of each step of an episode
+
+    The returns are computed with cumulative sums over blocks of steps, going backwards and carrying the
+    return of each block into the previous one. The blocks keep the powers of `gamma` away from underflow
+    in long episodes.
+
+    Parameters
+    -----------
+    rewards : np.ndarray
+        The rewards obtained at each step
+    gamma : float [0, 1]
+        The discount factor
+    block : int, default=1024
+        The number of steps computed together
+
+    Returns
+    --------
+    np.ndarray
+        The return of each step, ``G[t] = rewards[t] + gamma * G[t + 1]``
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    returns = np.empty(len(rewards), dtype=np.float64)
+    powers = gamma ** np.arange(block + 1, dtype=np.float64)
+    carry = 0.0
+    for end in range(len(rewards), 0, -block):
+        start = max(0, end - block)
+        length = end - start
+        scaled = rewards[start:end] * powers[:length]
+        returns[start:end] = np.cumsum(scaled[::-1])[::-1] / powers[:length] + carry * powers[length:0:-1]
+        carry = returns[start]
+    return returns
+
+
+class EpisodeBuffer:
+    """The steps of one episode for each of many games, stored in growing arrays
+
+    Parameters
+    -----------
+    rows : int, default=1
+        The number of games
+    capacity : int, default=256
+        The initial number of steps that can be stored for each game. It doubles when needed
+
+    Attributes
+    -----------
+    states : np.ndarray
+        The `simple_state_index` of the state at each step, with shape (rows, capacity)
+    actions : np.ndarray
+        The position in `ACTION_LIST` of the action at each step
+    rewards : np.ndarray
+        The reward obtained at each step
+    lengths : np.ndarray
+        The number of steps stored for each game
+    """
+
+    def __init__(self, rows: int = 1, capacity: int = 256):
+        self.states = np.zeros((rows, capacity), dtype=np.int16)
+        self.actions = np.zeros((rows, capacity), dtype=np.int8)
+        self.rewards = np.zeros((rows, capacity), dtype=np.float64)
+        self.lengths = np.zeros(rows, dtype=np.int64)
+
+    @property
+    def rows(self) -> int:
+        """int : The number of games"""
+        return len(self.lengths)
+
+    def append(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray):
+        """Add one step to the episode of every game
+
+        Parameters
+        -----------
+        states : np.ndarray
+            The index of the state for each game
+        actions : np.ndarray
+            The action for each game
+        rewards : np.ndarray
+            The reward for each game
+        """
+        if self.lengths.max() == self.states.shape[1]:
+            self.states, self.actions, self.rewards = (np.concatenate([x, np.zeros_like(x)], axis=1)
+                                                       for x in (self.states, self.actions, self.rewards))
+        rows = np.arange(self.rows)
+        self.states[rows, self.lengths] = states
+        self.actions[rows, self.lengths] = actions
+        self.rewards[rows, self.lengths] = rewards
+        self.lengths += 1
+
+    def episode(self, row: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the steps stored for a game
+
+        Parameters
+        -----------
+        row : int, default=0
+            The game
+
+        Returns
+        --------
+        tuple(np.ndarray)
+            The states, actions and rewards of the episode
+        """
+        length = self.lengths[row]
+        return self.states[row, :length], self.actions[row, :length], self.rewards[row, :length]
+
+    def clear(self, row: int = 0):
+        """Start a new episode for a game"""
+        self.lengths[row] = 0
+
+
 class SimpleMCAgent(AbstractAgent):
     """A class for an agent that uses a monte carlo method, with simplified states.
 
     All Q values for the states are recorded. The agent chooses the action that maximizes Q.
     The values are updated only at the end of the episode.
+    The Q values and the visit counts are stored in arrays indexed by `FrozenState.simple_state_index`,
+    with the actions in the order of `ACTION_LIST`.
 
     Parameters
     -------------
     dim : int
         the side of the board
+    first_visit : bool, default=False
+        Whether only the first visit of each state and action in an episode is learned, instead of every visit
 
     Attributes
     ----------------
-    state_dict : dict
-        The dictionary that stores Q values
+    q_table : np.ndarray
+        The array, of shape (4096, 4), that stores Q values
+    count_table : np.ndarray
+        The array, of shape (4096, 4), that stores how many times each action was learned in each state
+    current_episode : EpisodeBuffer
+        The steps of the current episode
     GAMMA : float [0, 1]
         the gamma value for training
     STEP : float [0, 1]
@@ -63,10 +185,12 @@ class SimpleMCAgent(AbstractAgent):
     STEP = 0.6
     DECAY = 0.999
 
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, first_visit: bool = False):
         super().__init__(dim)
-        self.state_dict = defaultdict(self.default_value)
-        self.count_dict = defaultdict(self.default_count)
+        self.first_visit = first_visit
+        self.q_table = np.full((SIMPLE_STATES, len(ACTION_LIST)), self.default_value(), dtype=np.float64)
+        self.count_table = np.zeros((SIMPLE_STATES, len(ACTION_LIST)), dtype=np.int64)
+        self._batch_episodes = EpisodeBuffer(0)
         self.reset()
 
     @staticmethod
@@ -79,9 +203,34 @@ class SimpleMCAgent(AbstractAgent):
         """list : The default Value for N"""
         return [0, 0, 0, 0].copy()
 
+    @property
+    def state_dict(self) -> SimpleTableView:
+        """SimpleTableView : A live view of `q_table` by `simple_state_string`, listing the states that have been
+        learned (or changed). Writing to it changes `q_table`"""
+        return SimpleTableView(self.q_table, self.default_value(), self._learned_states)
+
+    @state_dict.setter
+    def state_dict(self, values: Dict[str, List[float]]):
+        self.q_table[:] = self.default_value()
+        self.state_dict.update(values)
+
+    @property
+    def count_dict(self) -> SimpleTableView:
+        """SimpleTableView : A live view of `count_table` by `simple_state_string`, listing the states that have
+        been learned (or changed). Writing to it changes `count_table`"""
+        return SimpleTableView(self.count_table, self.default_count(), self._learned_states)
+
+    @count_dict.setter
+    def count_dict(self, counts: Dict[str, List[int]]):
+        self.count_table[:] = self.default_count()
+        self.count_dict.update(counts)
+
+    def _learned_states(self) -> np.ndarray:
+        return np.flatnonzero(self.count_table.any(axis=1) | (self.q_table != self.default_value()).any(axis=1))
+
     def reset(self):
         self.prev_action = 1
-        self.current_episode = []
+        self.current_episode = EpisodeBuffer()
 
     def execute(self, state: FrozenState) -> Actions:
         """Get the next action to do, given the state
@@ -96,17 +245,34 @@ class SimpleMCAgent(AbstractAgent):
         Actions
             the direction in which  to move
         """
-        state = state.simple_state_string
-        action = self.state_dict[state].index(max(self.state_dict[state]))
+        action = int(self.q_table[state.simple_state_index].argmax())
         if random.random() < self.epsilon:
             action = random.choice([0, 1, 2, 3])
-        if action == 0:
-            return Actions.UP
-        if action == 1:
-            return Actions.DOWN
-        if action == 2:
-            return Actions.LEFT
-        return Actions.RIGHT
+        return ACTION_LIST[action]
+
+    def execute_batch(self, states: States) -> np.ndarray:
+        """Get the next actions for many states at once
+
+        Parameters
+        --------------
+        states : list(FrozenState) or np.ndarray
+            the current states, or their simplified description with shape (n, 12)
+
+        Returns
+        --------------
+        np.ndarray
+            the actions, as positions in `ACTION_LIST`
+        """
+        actions = self.q_table[self._indices(states)].argmax(axis=1)
+        explore = np.random.random(len(actions)) < self.epsilon
+        actions[explore] = np.random.randint(0, len(ACTION_LIST), np.count_nonzero(explore))
+        return actions
+
+    @staticmethod
+    def _indices(states: States) -> np.ndarray:
+        if not isinstance(states, np.ndarray):
+            states = encode_simple_states(states)
+        return simple_state_indices(states)
 
     def fit(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
         """Update the Q values
@@ -122,54 +288,115 @@ class SimpleMCAgent(AbstractAgent):
         state : FrozenState
             the state of the game after taking the action
         done : bool
-            Whether the new state is terminal
+            Whether the new state is terminal. A truncated episode (`Rewards.TRUNCATED`) is also learned, with
+            the returns observed until the truncation
         """
-        self.current_episode.append(old_state.simple_state_string)
-        if action == Actions.UP:
-            action_num = 0
-        elif action == Actions.DOWN:
-            action_num = 1
-        elif action == Actions.LEFT:
-            action_num = 2
-        else:
-            action_num = 3
-        self.current_episode.append(action_num)
-        self.current_episode.append(rew)
-        if done:
+        self.current_episode.append(old_state.simple_state_index, ACTION_LIST.index(action), rew)
+        if done or rew == Rewards.TRUNCATED.value:
             self.replay()
             if self.epsilon > self.MIN_EPSILON:
                 self.epsilon *= self.DECAY
 
+    def fit_batch(self, transitions: Tuple[States, np.ndarray, np.ndarray, States, np.ndarray]):
+        """Record one step of many games, and learn the episodes that have ended
+
+        The agent keeps a separate episode for each row of the batch, so the row ``i`` must always come from
+        the same game. When a game ends, its episode is learned and a new one is started for that row.
+
+        Parameters
+        -----------
+        transitions : tuple
+            The states before taking the actions, the actions (as positions in `ACTION_LIST`), the rewards,
+            the states after taking the actions and whether each new state is terminal. The states can
+            be given as `FrozenState` objects or as their simplified description. If the number of games
+            changes, the episodes in progress are discarded. The truncated games end their episodes too
+        """
+        old_states, actions, rewards, _, dones = transitions
+        indices = self._indices(old_states)
+        if self._batch_episodes.rows != len(indices):
+            self._batch_episodes = EpisodeBuffer(len(indices))
+        self._batch_episodes.append(indices, actions, rewards)
+        for row in np.flatnonzero(np.asarray(dones) | (np.asarray(rewards) == Rewards.TRUNCATED.value)):
+            self._learn(*self._batch_episodes.episode(row))
+            self._batch_episodes.clear(row)
+            if self.epsilon > self.MIN_EPSILON:
+                self.epsilon *= self.DECAY
+
     def replay(self):
         """Replay the episode and learn the new values for Q"""
-        g = 0
-        for i in range(len(self.current_episode) - 3, -1, -3):
-            g = self.GAMMA * g + self.current_episode[i + 2]
-            state = self.current_episode[i]
-            action = self.current_episode[i + 1]
-            self.count_dict[state][action] += 1
-            self.state_dict[state][action] = self.state_dict[state][action] + \
-                                             (1 / self.count_dict[state][action]) * (g - self.state_dict[state][action])
-
-    def save(self, model_path: str = None):
-        """Save the states values of the agent. If a path is not given, uses a default one.
+        self._learn(*self.current_episode.episode())
+        self.current_episode.clear()
+
+    def _learn(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray):
+        """Learn the returns of an episode, with one update for each state and action
+
+        Averaging the ``k`` returns of a state and action one at a time gives
+        ``Q + (sum(returns) - k * Q) / (N + k)``, so all the visits are applied together.
+        """
+        returns = discounted_returns(rewards, self.GAMMA)
+        cells = states.astype(np.int64) * len(ACTION_LIST) + actions
+        if self.first_visit:
+            cells, first = np.unique(cells, return_index=True)
+            returns = returns[first]
+        sums = np.bincount(cells, weights=returns, minlength=self.q_table.size)
+        visits = np.bincount(cells, minlength=self.q_table.size)
+        updated = np.flatnonzero(visits)
+        q_values, counts = self.q_table.reshape(-1), self.count_table.reshape(-1)
+        counts[updated] += visits[updated]
+        q_values[updated] += (sums[updated] - visits[updated] * q_values[updated]) / counts[updated]
+
+    def save(self, model_path: str = None, compress: bool = False):
+        """Save the states values of the agent in the ``.snkq`` format. If a path is not given, uses a default one.
 
         Parameters
         ------------
         model_path : str, optional
             the position where the agent must be saved
+        compress : bool, default=False
+            whether the file is compressed
         """
         start = time.time()
         if not model_path:
             model_path = "./models/SimpleMonteCarloModel"
-        with bz2.BZ2File(model_path + str(self.dim) + ".pbz2", "w") as fout:
-            pickle.dump((dict(self.state_dict), dict(self.count_dict)), fout)
-        logging.info(f"Saved  {len(self.state_dict)} states in {time.time() - start :.2f} s")
+        states = self._learned_states()
+        write_model(model_path, self.dim, type(self).__name__,
+                    {"states": states.astype(np.int16), "values": self.q_table[states].astype(np.float32),
+                     "counts": self.count_table[states]}, compress, {"first_visit": self.first_visit})
+        logging.info(f"Saved  {len(states)} states ({SIMPLE_STATES - len(states)} at default value skipped) "
+                     f"in {time.time() - start :.2f} s")
 
     @classmethod
     def load(cls, dim: int, model_path: str) -> 'SimpleMCAgent':
         """Create a new agent from the given file
 
+        If there is no ``.snkq`` file, the model is loaded with `load_legacy`
+
+        Parameters
+        -----------
+        dim : int
+            The size of the board
+        model_path: str
+            The path from which the agent is loaded
+
+        Raises
+        -------
+        TypeError
+            If the file does not contain a model of this agent
+        """
+        if not model_exists(model_path, dim):
+            return cls.load_legacy(dim, model_path)
+        start = time.time()
+        arrays, options = read_model(model_path, dim, cls.__name__)
+        agent = cls(dim, **options)
+        agent.q_table[arrays["states"]] = arrays["values"]
+        agent.count_table[arrays["states"]] = arrays["counts"]
+        logging.info(f"loaded {len(arrays['states'])} states in {time.time() - start :.2f} s")
+        return agent
+
+    @classmethod
+    def load_legacy(cls, dim: int, model_path: str) -> 'SimpleMCAgent':
+        """Create a new agent from a file saved by older versions (a bz2 compressed pickle of two dicts)
+
         Parameters
         -----------
         dim : int
@@ -188,7 +415,12 @@ class SimpleMCAgent(AbstractAgent):
         data, counter = pickle.load(data)
         if not (isinstance(data, dict) and isinstance(counter, dict)):
             raise TypeError("The file should contain two dictionaries")
-        agent.state_dict = defaultdict(agent.default_value, data)
-        agent.count_dict = defaultdict(agent.default_count, counter)
-        logging.info(f"loaded {len(agent.state_dict)} states in {time.time() - start :.2f} s")
+        for state, values in data.items():
+            agent.q_table[int(state, 2)] = values
+        for state, counts in counter.items():
+            agent.count_table[int(state, 2)] = counts
+        # Every state is copied to the table: the ones at their default value are only counted
+        live = len(agent.state_dict)
+        logging.info(f"loaded {len(data)} states ({len(data) - live} of them at default value) "
+                     f"in {time.time() - start :.2f} s")
         return agent
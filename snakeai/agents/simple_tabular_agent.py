@@ -3,10 +3,17 @@ import pickle as pkl
 import random
 import bz2
 import time
-from collections import defaultdict
-from snakeai.game.constants import Actions
-from snakeai.agents.agent_interface import AbstractAgent
-from snakeai.game.memento import FrozenState
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from snakeai.game.constants import Actions, ACTION_LIST
+from snakeai.agents.agent_interface import AbstractAgent, States
+from snakeai.agents.model_io import model_exists, read_model, write_model
+from snakeai.agents.qstore import SimpleTableView
+from snakeai.game.memento import FrozenState, SIMPLE_STATES, encode_simple_states, simple_state_indices
+from snakeai.game.symmetry import (ACTION_MAP, CANONICAL_SIMPLE, INVERSE_ACTION_MAP, SIMPLE_TRANSFORM,
+                                   canonical_simple_indices)
 from snakeai.game.agent_controller import AgentGame
 
 
@@ -37,16 +44,21 @@ class SimpleStateAgent(AbstractAgent):
     """A class for an agent that uses a tabular method, with simplified states.
 
     All Q values for the states are recorded. The agent chooses the action that maximizes Q.
+    Since there are only 4096 simplified states, the Q values are stored in an array, indexed by
+    `FrozenState.simple_state_index`; the actions are in the order of `ACTION_LIST`.
 
     Parameters
     -------------
     dim : int
         the side of the board
+    symmetric : bool, default=False
+        Whether only the canonical orientation of each state is learned (see `snakeai.game.symmetry`)
 
     Attributes
     ----------------
-    state_dict : dict
-        The dictionary that stores Q values
+    q_table : np.ndarray
+        The array, of shape (4096, 4), that stores Q values. With `symmetric`, only the rows of the canonical
+        states are used, and the actions are in the canonical orientation
     GAMMA : float [0, 1]
         the gamma value for training
     STEP : float [0, 1]
@@ -62,9 +74,10 @@ class SimpleStateAgent(AbstractAgent):
     STEP = 0.6
     DECAY = 0.999
 
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, symmetric: bool = False):
         super().__init__(dim)
-        self.state_dict = defaultdict(lambda: self.default_value)
+        self.symmetric = symmetric
+        self.q_table = np.full((SIMPLE_STATES, len(ACTION_LIST)), self.default_value, dtype=np.float64)
         self.reset()
 
     @property
@@ -72,6 +85,20 @@ class SimpleStateAgent(AbstractAgent):
         """list : The default Value for Q"""
         return [2, 2, 2, 2].copy()
 
+    @property
+    def state_dict(self) -> SimpleTableView:
+        """SimpleTableView : A live view of `q_table` by `simple_state_string`, listing the states that are not at
+        their default value. Writing to it changes `q_table`"""
+        return SimpleTableView(self.q_table, self.default_value, self._updated_states)
+
+    @state_dict.setter
+    def state_dict(self, values: Dict[str, List[float]]):
+        self.q_table[:] = self.default_value
+        self.state_dict.update(values)
+
+    def _updated_states(self) -> np.ndarray:
+        return np.flatnonzero((self.q_table != self.default_value).any(axis=1))
+
     def reset(self):
         self.prev_action = 1
 
@@ -88,18 +115,45 @@ class SimpleStateAgent(AbstractAgent):
         Actions
             the direction in which  to move
         """
-        state = state.simple_state_string
-        action = self.state_dict[state].index(max(self.state_dict[state]))
+        index = state.simple_state_index
+        action = int(self.q_table[CANONICAL_SIMPLE[index] if self.symmetric else index].argmax())
+        if self.symmetric:
+            action = INVERSE_ACTION_MAP[SIMPLE_TRANSFORM[index], action]
         if random.random() < self.epsilon:
-            action = random. choice([0, 1, 2, 3])
+            action = random.choice([0, 1, 2, 3])
         self.prev_action = action
-        if action == 0:
-            return Actions.UP
-        if action == 1:
-            return Actions.DOWN
-        if action == 2:
-            return Actions.LEFT
-        return Actions.RIGHT
+        return ACTION_LIST[action]
+
+    def execute_batch(self, states: States) -> np.ndarray:
+        """Get the next actions for many states at once
+
+        Parameters
+        --------------
+        states : list(FrozenState) or np.ndarray
+            the current states, or their simplified description with shape (n, 12)
+
+        Returns
+        --------------
+        np.ndarray
+            the actions, as positions in `ACTION_LIST`
+        """
+        rows, transforms = self._rows(self._indices(states))
+        actions = INVERSE_ACTION_MAP[transforms, self.q_table[rows].argmax(axis=1)]
+        explore = np.random.random(len(actions)) < self.epsilon
+        actions[explore] = np.random.randint(0, len(ACTION_LIST), np.count_nonzero(explore))
+        return actions
+
+    @staticmethod
+    def _indices(states: States) -> np.ndarray:
+        if not isinstance(states, np.ndarray):
+            states = encode_simple_states(states)
+        return simple_state_indices(states)
+
+    def _rows(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # The rows of the Q table used for the states, and the symmetries that transform the states to them
+        if self.symmetric:
+            return canonical_simple_indices(indices)
+        return indices, np.zeros(len(indices), dtype=np.int64)
 
     def fit(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
         """Update the Q values
@@ -117,37 +171,104 @@ class SimpleStateAgent(AbstractAgent):
         done : bool
             Whether the new state is terminal
         """
-        old_state = old_state.simple_state_string
-        next_state = state.simple_state_string
+        old_index = old_state.simple_state_index
+        action = ACTION_LIST.index(action)
+        next_index = state.simple_state_index
+        if self.symmetric:
+            action = ACTION_MAP[SIMPLE_TRANSFORM[old_index], action]
+            old_index, next_index = CANONICAL_SIMPLE[old_index], CANONICAL_SIMPLE[next_index]
+        target = rew
         if not done:
-            self.state_dict[old_state][self.prev_action] = self.state_dict[old_state][self.prev_action] + \
-                                                           self.STEP * (rew + self.GAMMA * max(self.state_dict[next_state]) -
-                                                                        self.state_dict[old_state][self.prev_action])
-        else:
-            self.state_dict[old_state][self.prev_action] = self.state_dict[old_state][self.prev_action] + \
-                                                           self.STEP * (rew - self.state_dict[old_state][self.prev_action])
+            target += self.GAMMA * self.q_table[next_index].max()
+        self.q_table[old_index, action] += self.STEP * (target - self.q_table[old_index, action])
+        if done and self.epsilon > self.MIN_EPSILON:
+            self.epsilon *= self.DECAY
+
+    def fit_batch(self, transitions: Tuple[States, np.ndarray, np.ndarray, States, np.ndarray]):
+        """Update the Q values with one step of many games
+
+        All the targets are computed from the Q values before the batch. When more transitions have the
+        same state and action, their updates are combined as if they were applied one after the other
+        (in order of row) with `fit`: the target of the ``j``-th of ``k`` updates has weight
+        ``STEP * (1 - STEP) ** (k - j)``, and none of them is lost.
+
+        Parameters
+        -----------
+        transitions : tuple
+            The states before taking the actions, the actions (as positions in `ACTION_LIST`), the rewards,
+            the states after taking the actions and whether each new state is terminal. The states can
+            be given as `FrozenState` objects or as their simplified description
+        """
+        old_states, actions, rewards, states, dones = transitions
+        old_indices, transforms = self._rows(self._indices(old_states))
+        actions = ACTION_MAP[transforms, np.asarray(actions, dtype=np.int64)]
+        dones = np.asarray(dones, dtype=bool)
+        targets = np.asarray(rewards, dtype=np.float64) + \
+            self.GAMMA * self.q_table[self._rows(self._indices(states))[0]].max(axis=1) * ~dones
+        errors = targets - self.q_table[old_indices, actions]
+        cells = old_indices * len(ACTION_LIST) + actions
+        order = np.argsort(cells, kind="stable")
+        cells, errors = cells[order], errors[order]
+        updated, first, counts = np.unique(cells, return_index=True, return_counts=True)
+        # Position of each update in its group, counted from the last one
+        from_last = np.repeat(first + counts, counts) - 1 - np.arange(len(cells))
+        weights = self.STEP * (1 - self.STEP) ** from_last
+        deltas = np.bincount(cells, weights=weights * errors, minlength=self.q_table.size)
+        self.q_table.reshape(-1)[updated] += deltas[updated]
+        for _ in range(np.count_nonzero(dones)):
             if self.epsilon > self.MIN_EPSILON:
                 self.epsilon *= self.DECAY
 
-    def save(self, model_path: str = None):
-        """Save the states of the agent. If a path is not given, uses a default one.
+    def save(self, model_path: str = None, compress: bool = False):
+        """Save the states of the agent in the ``.snkq`` format. If a path is not given, uses a default one.
 
         Parameters
         ------------
         model_path : str, optional
             the position where the agent must be saved
+        compress : bool, default=False
+            whether the file is compressed
         """
         start = time.time()
         if not model_path:
             model_path = "./models/SimpleStateAgent"
-        with bz2.BZ2File(model_path + str(self.dim) + ".pbz2", "w") as fout:
-            pkl.dump(dict(self.state_dict), fout)
-        logging.info(f"Saved  {len(self.state_dict)} states in {time.time() - start :.2f} s")
+        states = np.flatnonzero((self.q_table != self.default_value).any(axis=1))
+        write_model(model_path, self.dim, type(self).__name__,
+                    {"states": states.astype(np.int16), "values": self.q_table[states].astype(np.float32)}, compress,
+                    {"symmetric": self.symmetric})
+        logging.info(f"Saved  {len(states)} states ({SIMPLE_STATES - len(states)} at default value skipped) "
+                     f"in {time.time() - start :.2f} s")
 
     @classmethod
     def load(cls, dim: int, model_path: str) -> 'SimpleStateAgent':
         """Create a new agent from the given file
 
+        If there is no ``.snkq`` file, the model is loaded with `load_legacy`
+
+        Parameters
+        -----------
+        dim : int
+            The size of the board
+        model_path: str
+            The path to the model to load
+        Raises
+        -------
+        TypeError
+            If the file does not contain a model of this agent
+        """
+        if not model_exists(model_path, dim):
+            return cls.load_legacy(dim, model_path)
+        start = time.time()
+        arrays, options = read_model(model_path, dim, cls.__name__)
+        agent = cls(dim, **options)
+        agent.q_table[arrays["states"]] = arrays["values"]
+        logging.info(f"loaded {len(arrays['states'])} states in {time.time() - start :.2f} s")
+        return agent
+
+    @classmethod
+    def load_legacy(cls, dim: int, model_path: str) -> 'SimpleStateAgent':
+        """Create a new agent from a file saved by older versions (a bz2 compressed pickle of a dict)
+
         Parameters
         -----------
         dim : int
@@ -163,11 +284,12 @@ class SimpleStateAgent(AbstractAgent):
         agent = cls(dim)
         data = bz2.BZ2File(model_path + str(dim) + ".pbz2", "rb")
         data = pkl.load(data)
-        if isinstance(data, dict):
-            agent.state_dict = defaultdict(lambda: agent.default_value, data)
-        elif isinstance(data, defaultdict):
-            agent.state_dict = data
-        else:
+        if not isinstance(data, dict):
             raise TypeError("The file should contain a dict or a defaultdict")
-        logging.info(f"loaded {len(agent.state_dict)} states in {time.time() - start :.2f} s")
+        for state, values in data.items():
+            agent.q_table[int(state, 2)] = values
+        # Every state is copied to the table: the ones at their default value are only counted
+        live = len(agent.state_dict)
+        logging.info(f"loaded {len(data)} states ({len(data) - live} of them at default value) "
+                     f"in {time.time() - start :.2f} s")
         return agent
@@ -1,12 +1,19 @@
 import logging
+import os
 import pickle as pkl
 import random
 import bz2
 import time
-from collections import defaultdict
-from snakeai.game.constants import Actions
-from snakeai.agents.agent_interface import AbstractAgent
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from snakeai.game.constants import Actions, ACTION_LIST
+from snakeai.agents.agent_interface import AbstractAgent, States
+from snakeai.agents.model_io import model_exists, read_model, write_model
+from snakeai.agents.qstore import MMapQStore
 from snakeai.game.memento import FrozenState
+from snakeai.game.symmetry import ACTION_MAP, INVERSE_ACTION_MAP, canonical_table_string
 from snakeai.game.agent_controller import AgentGame
 
 
@@ -38,16 +45,30 @@ class StateAgent(AbstractAgent):
 
     All Q values for the states are recorded. The agent chooses the action that maximizes Q.
     States are represented as a string with all the positions of the snake plus the position
-    of the apple.
+    of the apple. Only the states whose values have been updated are stored: reading the values of a
+    state that is not in `state_dict` returns `default_value` without inserting it.
+
+    The Q values can also be kept in a `MMapQStore` on disk instead of a dict, for tables that do not fit
+    in memory. The store file is then the model: `save` writes it, and `load` opens it without reading it.
 
     Parameters
     -------------
     dim : int
         the side of the board
+    store_path : str, optional
+        If given, the Q values are kept in a `MMapQStore` at this path. An existing store must have been
+        created with the same `symmetric`
+    read_only : bool, default=False
+        Whether the store is opened in read-only mode (e.g. for sharing it between many processes)
+    cache_size : int, default=100000
+        The number of states kept in memory by the store
+    symmetric : bool, default=False
+        Whether only the canonical orientation of each state is learned (see `snakeai.game.symmetry`). The
+        table is up to 8 times smaller, but each state is transformed in the 8 orientations to find the canonical one
 
     Attributes
     ----------------
-    state_dict : dict
+    state_dict : dict or MMapQStore
         The dictionary that stores Q values
     epsilon: float [0, 1]
         the epsilon value for epsilon-greedy
@@ -56,9 +77,14 @@ class StateAgent(AbstractAgent):
     STEP = 0.6
     DECAY = 0.999
 
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, store_path: str = None, read_only: bool = False, cache_size: int = 100000,
+                 symmetric: bool = False):
         super().__init__(dim)
-        self.state_dict = defaultdict(lambda: self.default_value)
+        self.symmetric = symmetric
+        if store_path:
+            self.state_dict = MMapQStore(store_path, read_only=read_only, cache_size=cache_size, symmetric=symmetric)
+        else:
+            self.state_dict = {}
         self.reset()
 
     @property
@@ -66,6 +92,56 @@ class StateAgent(AbstractAgent):
         """list : The default Value for Q"""
         return [2, 2, 2, 2].copy()
 
+    def q_values(self, state: str) -> list:
+        """Get the Q values of a state, without adding it to `state_dict`
+
+        Parameters
+        -----------
+        state : str
+            The `table_string` of the state
+
+        Returns
+        --------
+        list
+            The Q values, in the order of `ACTION_LIST`
+        """
+        return self.state_dict.get(state, self.default_value)
+
+    def key(self, state: FrozenState) -> Tuple[str, int]:
+        """Get the key of a state in `state_dict`
+
+        Parameters
+        -----------
+        state : FrozenState
+            The state
+
+        Returns
+        --------
+        str
+            The `table_string` of the state or, with `symmetric`, of its canonical orientation
+        int
+            The symmetry that transforms the state to the orientation of the key
+        """
+        if self.symmetric:
+            return canonical_table_string(state)
+        return state.table_string, 0
+
+    def prune(self) -> int:
+        """Remove the states whose Q values are all still at the default value
+
+        Returns
+        --------
+        int
+            The number of states removed
+        """
+        default = self.default_value
+        if isinstance(self.state_dict, MMapQStore):
+            return self.state_dict.prune(default)
+        unchanged = [state for state, values in self.state_dict.items() if values == default]
+        for state in unchanged:
+            del self.state_dict[state]
+        return len(unchanged)
+
     def reset(self):
         self.prev_action = 1
 
@@ -82,18 +158,13 @@ class StateAgent(AbstractAgent):
         Actions
             the direction in which  to move
         """
-        state = state.table_string
-        action = self.state_dict[state].index(max(self.state_dict[state]))
+        key, transform = self.key(state)
+        values = self.q_values(key)
+        action = INVERSE_ACTION_MAP[transform, values.index(max(values))]
         if random.random() < self.epsilon:
             action = random.choice([0, 1, 2, 3])
         self.prev_action = action
-        if action == 0:
-            return Actions.UP
-        if action == 1:
-            return Actions.DOWN
-        if action == 2:
-            return Actions.LEFT
-        return Actions.RIGHT
+        return ACTION_LIST[action]
 
     def fit(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
         """Update the Q values
@@ -111,37 +182,159 @@ class StateAgent(AbstractAgent):
         done : bool
             Whether the new state is terminal
         """
-        old_state = old_state.table_string
-        next_state = state.table_string
+        old_state, transform = self.key(old_state)
+        action = ACTION_MAP[transform, ACTION_LIST.index(action)]
+        values = self.q_values(old_state)
         if not done:
-            self.state_dict[old_state][self.prev_action] = self.state_dict[old_state][self.prev_action] + \
-                                                           self.STEP * (rew + self.GAMMA * max(self.state_dict[next_state]) -
-                                                                        self.state_dict[old_state][self.prev_action])
+            values[action] = values[action] + \
+                self.STEP * (rew + self.GAMMA * max(self.q_values(self.key(state)[0])) - values[action])
         else:
-            self.state_dict[old_state][self.prev_action] = self.state_dict[old_state][self.prev_action] + \
-                                                           self.STEP * (rew - self.state_dict[old_state][self.prev_action])
+            values[action] = values[action] + self.STEP * (rew - values[action])
+        self.state_dict[old_state] = values
+        if done and self.epsilon > self.MIN_EPSILON:
+            self.epsilon *= self.DECAY
+
+    def fit_batch(self, transitions: Tuple[States, np.ndarray, np.ndarray, States, np.ndarray]):
+        """Update the Q values with many transitions at once (see `fit_keys`)
+
+        Parameters
+        -----------
+        transitions : tuple
+            The states before taking the actions, the actions (as positions in `ACTION_LIST`), the rewards,
+            the states after taking the actions and whether each new state is terminal
+
+        Raises
+        -------
+        TypeError
+            If the states are encoded
+        """
+        old_states, actions, rewards, states, dones = transitions
+        if isinstance(old_states, np.ndarray):
+            raise TypeError(f"{type(self).__name__} can only be trained with FrozenState objects")
+        old_keys, transforms = zip(*[self.key(state) for state in old_states]) if len(old_states) else ((), ())
+        actions = ACTION_MAP[np.asarray(transforms, dtype=np.int64), np.asarray(actions, dtype=np.int64)]
+        self.fit_keys(old_keys, actions, rewards, [self.key(state)[0] for state in states], dones)
+
+    def fit_keys(self, old_keys: Sequence[str], actions: np.ndarray, rewards: np.ndarray, keys: Sequence[str],
+                 dones: np.ndarray):
+        """Update the Q values with many transitions, given the keys of the states
+
+        All the targets are computed from the Q values before the batch, then the updates are applied in
+        order, as with `fit`: the transitions do not need to come from the same game.
+
+        Parameters
+        -----------
+        old_keys : list(str)
+            The keys (see `key`) of the states before taking the actions
+        actions : np.ndarray
+            The actions, as positions in `ACTION_LIST` in the orientation of the keys
+        rewards : np.ndarray
+            The rewards
+        keys : list(str)
+            The keys of the states after taking the actions
+        dones : np.ndarray
+            Whether each new state is terminal
+        """
+        targets = np.asarray(rewards, dtype=np.float64).tolist()
+        for i, (key, done) in enumerate(zip(keys, np.asarray(dones, dtype=bool).tolist())):
+            if not done:
+                targets[i] += self.GAMMA * max(self.q_values(key))
+        for key, action, target in zip(old_keys, np.asarray(actions).tolist(), targets):
+            values = self.q_values(key)
+            values[action] += self.STEP * (target - values[action])
+            self.state_dict[key] = values
+        for _ in range(np.count_nonzero(dones)):
             if self.epsilon > self.MIN_EPSILON:
                 self.epsilon *= self.DECAY
 
-    def save(self, model_path: str = None):
-        """Save the states of the agent. If a path is not given, uses a default one.
+    def flush(self):
+        """Write the changes kept in the cache of the store to its file, if the agent uses a `MMapQStore`"""
+        if isinstance(self.state_dict, MMapQStore):
+            self.state_dict.flush()
+
+    def save(self, model_path: str = None, compress: bool = False):
+        """Save the states of the agent in the ``.snkq`` format (or the store, if the agent uses one).
+        If a path is not given, uses a default one.
 
         Parameters
         ------------
         model_path : str, optional
             the position where the agent must be saved
+        compress : bool, default=False
+            whether the ``.snkq`` file is compressed
         """
         start = time.time()
         if not model_path:
             model_path = "./models/StateAgentDictionary"
-        with bz2.BZ2File(model_path + str(self.dim) + ".pbz2", "w") as fout:
-            pkl.dump(dict(self.state_dict), fout)
-        logging.info(f"Saved  {len(self.state_dict)} states in {time.time() - start :.2f} s")
+        if isinstance(self.state_dict, MMapQStore):
+            path = model_path + str(self.dim) + ".qstore"
+            self.state_dict.flush()
+            if not (os.path.exists(path) and os.path.samefile(path, self.state_dict.path)):
+                self.state_dict.copy(path)
+            logging.info(f"Saved  {len(self.state_dict)} states in {time.time() - start :.2f} s")
+            return
+        default = self.default_value
+        states = sorted(state for state, values in self.state_dict.items() if values != default)
+        # The states have different lengths: they are concatenated, and their boundaries are stored separately
+        keys = [state.encode() for state in states]
+        offsets = np.cumsum([0] + [len(key) for key in keys], dtype=np.int64)
+        values = np.array([self.state_dict[state] for state in states], dtype=np.float32).reshape((-1, 4))
+        write_model(model_path, self.dim, type(self).__name__,
+                    {"states": np.frombuffer(b"".join(keys), dtype=np.uint8), "offsets": offsets, "values": values},
+                    compress, {"symmetric": self.symmetric})
+        logging.info(f"Saved  {len(states)} states ({len(self.state_dict) - len(states)} at default value skipped) "
+                     f"in {time.time() - start :.2f} s")
 
     @classmethod
-    def load(cls, dim: int, model_path: str) -> 'StateAgent':
+    def load(cls, dim: int, model_path: str, read_only: bool = False) -> 'StateAgent':
         """Create a new agent from the given file
 
+        If a store (``.qstore``) exists at the path, it is opened directly. Otherwise the ``.snkq`` file is
+        loaded or, if there is none, the model is loaded with `load_legacy`.
+
+        Parameters
+        -----------
+        dim : int
+            The size of the board
+        model_path: str
+            The path to the model to load
+        read_only : bool, default=False
+            Whether a store is opened in read-only mode. The agent is `symmetric` if the store says so
+
+        Raises
+        -------
+        TypeError
+            If the file does not contain a model of this agent
+        """
+        start = time.time()
+        if os.path.exists(model_path + str(dim) + ".qstore"):
+            store = MMapQStore(model_path + str(dim) + ".qstore", read_only=read_only)
+            agent = cls(dim, symmetric=store.symmetric)
+            agent.state_dict = store
+            logging.info(f"opened {len(agent.state_dict)} states in {time.time() - start :.2f} s")
+            return agent
+        if not model_exists(model_path, dim):
+            return cls.load_legacy(dim, model_path)
+        arrays, options = read_model(model_path, dim, cls.__name__)
+        agent = cls(dim, **options)
+        keys, offsets = arrays["states"].tobytes().decode(), arrays["offsets"].tolist()
+        states = [keys[start:end] for start, end in zip(offsets, offsets[1:])]
+        agent.state_dict = dict(zip(states, arrays["values"].tolist()))
+        logging.info(f"loaded {len(agent.state_dict)} states in {time.time() - start :.2f} s")
+        return agent
+
+    @classmethod
+    def load_legacy(cls, dim: int, model_path: str) -> 'StateAgent':
+        """Create a new agent from a file saved by older versions (a bz2 compressed pickle of a dict).
+        The states at their default value are not kept
+
+        Parameters
+        -----------
+        dim : int
+            The size of the board
+        model_path: str
+            The path to the model to load
+
         Raises
         -------
         TypeError
@@ -151,11 +344,10 @@ class StateAgent(AbstractAgent):
         agent = cls(dim)
         data = bz2.BZ2File(model_path + str(dim) + ".pbz2", "rb")
         data = pkl.load(data)
-        if isinstance(data, dict):
-            agent.state_dict = defaultdict(lambda : agent.default_value, data)
-        elif isinstance(data, defaultdict):
-            agent.state_dict = data
-        else:
+        if not isinstance(data, dict):
             raise TypeError("The file should contain a dict or a defaultdict")
-        logging.info(f"loaded {len(agent.state_dict)} states in {time.time() - start :.2f} s")
+        agent.state_dict = dict(data)
+        pruned = agent.prune()
+        logging.info(f"loaded {len(agent.state_dict)} states ({pruned} at default value dropped) "
+                     f"in {time.time() - start :.2f} s")
         return agent
@@ -0,0 +1,336 @@
+"""The command line interface of the package, used with ``python -m snakeai``
+
+Each subcommand imports only the modules it needs, so that the startup stays fast.
+The options can also be given in a JSON configuration file (``--config``), whose keys are the option names
+with underscores (e.g. ``checkpoint_interval``); options given on the command line take precedence.
+The results are written as JSON on the standard output (or in the file given with ``--results``), while
+progress bars and logs go to the standard error.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULTS = {
+    "agent": None,
+    "model": None,
+    "output": None,
+    "size": 20,
+    "episodes": 1000,
+    "workers": 1,
+    "checkpoint_interval": 0,
+    "avg_length": 1000,
+    "trials": 50,
+    "seed": 0,
+    "fps": 7,
+    "mode": "window",
+    "runs": 3,
+    "start": 0,
+    "headless": False,
+}
+
+
+def _seed(seed: int):
+    import numpy as np
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def create_agent(name: str, size: int, model_path: Optional[str] = None):
+    """Create an agent from the registry, loading it from a file if a path is given
+
+    Parameters
+    ----------
+    name: str
+        The name of the agent class
+    size: int
+        The size of the board
+    model_path: str, optional
+        The path of the model to load
+
+    Returns
+    -------
+    AbstractAgent
+        The agent
+    """
+    from snakeai.agents import get_agent_class
+
+    cls = get_agent_class(name)
+    if model_path:
+        return cls.load(size, model_path)
+    return cls(size)
+
+
+def _run_parallel(func: Callable[[Dict[str, Any]], Dict[str, Any]], jobs: List[Dict[str, Any]],
+                  workers: int) -> List[Dict[str, Any]]:
+    if workers <= 1:
+        return [func(job) for job in jobs]
+    from multiprocessing import Pool
+
+    with Pool(workers) as pool:
+        return pool.map(func, jobs)
+
+
+def _train_worker(job: Dict[str, Any]) -> Dict[str, Any]:
+    from snakeai.utils.train import general_train
+
+    with contextlib.redirect_stdout(sys.stderr):
+        _seed(job["seed"])
+        agent = create_agent(job["agent"], job["size"], job["model"])
+        start = time.time()
+        _, scores = general_train(agent, job["episodes"], job["size"], avg_length=job["avg_length"],
+                                  checkpoint_interval=job["checkpoint_interval"], checkpoint_path=job["output"])
+        agent.save(job["output"])
+    last_scores = scores[-job["avg_length"]:]
+    return {"seed": job["seed"], "output": job["output"], "episodes": len(scores), "high_score": max(scores),
+            "average_score": sum(last_scores) / len(last_scores), "epsilon": agent.epsilon,
+            "seconds": time.time() - start}
+
+
+def train(args: argparse.Namespace) -> Dict[str, Any]:
+    """Train agents. With more than one worker, each worker trains its own agent with a different seed"""
+    jobs = []
+    for i in range(args.workers):
+        output = args.output
+        if output and args.workers > 1:
+            # The agents add the size of the board to the path
+            output = f"{output}_{i}_"
+        jobs.append({"agent": args.agent, "size": args.size, "model": args.model, "episodes": args.episodes,
+                     "avg_length": args.avg_length, "checkpoint_interval": args.checkpoint_interval,
+                     "output": output, "seed": args.seed + i})
+    return {"command": "train", "agent": args.agent, "size": args.size,
+            "runs": _run_parallel(_train_worker, jobs, args.workers)}
+
+
+def _eval_worker(job: Dict[str, Any]) -> Dict[str, Any]:
+    from snakeai.utils.train import evaluate_agent
+
+    with contextlib.redirect_stdout(sys.stderr):
+        agent = create_agent(job["agent"], job["size"], job["model"])
+        _seed(job["seed"])
+        stats = evaluate_agent(agent, job["trials"])
+    return {"seed": job["seed"], "trials": job["trials"], "high_score": stats["high_score"],
+            "average_score": stats["average_score"], "truncated": stats["truncated"]}
+
+
+def evaluate(args: argparse.Namespace) -> Dict[str, Any]:
+    """Evaluate an agent with epsilon=0, splitting the trials between workers with different seeds"""
+    workers = max(1, min(args.workers, args.trials))
+    jobs = [{"agent": args.agent, "size": args.size, "model": args.model, "seed": args.seed + i,
+             "trials": args.trials // workers + (1 if i < args.trials % workers else 0)} for i in range(workers)]
+    runs = _run_parallel(_eval_worker, jobs, workers)
+    return {"command": "eval", "agent": args.agent, "size": args.size, "model": args.model, "trials": args.trials,
+            "high_score": max(run["high_score"] for run in runs),
+            "average_score": sum(run["average_score"] * run["trials"] for run in runs) / args.trials,
+            "truncated": sum(run["truncated"] for run in runs), "runs": runs}
+
+
+def play(args: argparse.Namespace) -> Dict[str, Any]:
+    """Play a game with an agent on the screen"""
+    from snakeai.game.agent_controller import AgentGame
+    from snakeai.game.constants import GUIMode
+
+    _seed(args.seed)
+    agent = create_agent(args.agent, args.size, args.model)
+    agent.epsilon = 0
+    game = AgentGame(args.size, fps=args.fps, replay_allowed=False, mode=GUIMode[args.mode.upper()])
+    game.play(agent)
+    game.view.quit()
+    return {"command": "play", "agent": args.agent, "size": args.size, "score": game.model.score,
+            "steps": game.steps}
+
+
+def record(args: argparse.Namespace) -> Dict[str, Any]:
+    """Record a game played by an agent"""
+    from snakeai.utils.recorder import Recorder
+    from snakeai.utils.recording import EXTENSION
+
+    _seed(args.seed)
+    agent = create_agent(args.agent, args.size, args.model)
+    agent.epsilon = 0
+    recorder = Recorder(args.size, show=False, max_steps_per_apple=2 * args.size * args.size,
+                        path=args.output if args.output.endswith(EXTENSION) else None)
+    recorder.play(agent)
+    recorder.save(args.output)
+    return {"command": "record", "agent": args.agent, "size": args.size, "output": args.output,
+            "score": recorder.model.score, "steps": recorder.steps, "truncated": recorder.truncated}
+
+
+def replay(args: argparse.Namespace) -> Dict[str, Any]:
+    """Show a recorded game"""
+    from snakeai.game.constants import GUIMode
+    from snakeai.utils.recorder import Player, Recorder
+    from snakeai.utils.recording import EXTENSION, RecordingReader, replay_game
+
+    recording = RecordingReader(args.recording) if args.recording.endswith(EXTENSION) else Recorder.load(args.recording)
+    if args.headless:
+        # A .pkl file is loaded as a Recorder, which holds the steps in its recording
+        steps = recording if isinstance(recording, RecordingReader) else recording.recording
+        start = time.perf_counter()
+        model = replay_game(steps, recording.dim)
+        return {"command": "replay", "recording": args.recording, "score": model.score,
+                "steps": len(steps) - 1, "seconds": time.perf_counter() - start}
+    player = Player(recording, mode=GUIMode[args.mode.upper()])
+    player.frame_time = 1 / args.fps
+    player.start()
+    if args.start:
+        player.seek(args.start)
+    while not player.model.isGameOver and player.index + 1 < len(player.recording):
+        player.step()
+    player.view.quit()
+    return {"command": "replay", "recording": args.recording, "score": player.model.score, "steps": player.index}
+
+
+def verify(args: argparse.Namespace) -> Dict[str, Any]:
+    """Check that recorded games replay to the recorded results"""
+    from snakeai.utils.verify import verify_recordings
+
+    return {"command": "verify", "workers": args.workers, **verify_recordings(args.recordings, args.workers)}
+
+
+def bench(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run a benchmark"""
+    if args.target == "startup":
+        from snakeai.utils.benchmark import benchmark_startup
+
+        with contextlib.redirect_stdout(sys.stderr):
+            return {"command": "bench", "target": "startup", "seconds": benchmark_startup(args.runs)}
+    from snakeai.game.agent_controller import AgentGame
+
+    _seed(args.seed)
+    agent = create_agent(args.agent, args.size, args.model)
+    game = AgentGame(args.size, show=False)
+    steps, scores = 0, []
+    start = time.perf_counter()
+    for _ in range(args.episodes):
+        game.play(agent)
+        agent.reset()
+        steps += game.steps
+        scores.append(game.model.score)
+    elapsed = time.perf_counter() - start
+    return {"command": "bench", "target": "game", "agent": args.agent, "size": args.size, "episodes": args.episodes,
+            "steps": steps, "seconds": elapsed, "steps_per_second": steps / elapsed,
+            "average_score": sum(scores) / len(scores)}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create the parser for the command line arguments
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        The parser
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", help="JSON file with the options")
+    common.add_argument("--results", help="file where the JSON results are written (default: standard output)")
+    common.add_argument("--seed", type=int, help="random seed")
+
+    agent = argparse.ArgumentParser(add_help=False)
+    agent.add_argument("--agent", help="name of the agent class (see snakeai.agents.available_agents)")
+    agent.add_argument("--size", type=int, help="side of the board")
+    agent.add_argument("--model", help="path of the model to load")
+
+    parser = argparse.ArgumentParser(prog="python -m snakeai", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sub = commands.add_parser("train", parents=[common, agent], help="train agents")
+    sub.add_argument("--episodes", type=int, help="number of training episodes")
+    sub.add_argument("--workers", type=int, help="number of agents trained in parallel, with different seeds")
+    sub.add_argument("--checkpoint-interval", type=int, help="save the agent every this number of episodes")
+    sub.add_argument("--avg-length", type=int, help="number of episodes in the average score")
+    sub.add_argument("--output", help="path where the model is saved (required with more than one worker)")
+    sub.set_defaults(func=train)
+
+    sub = commands.add_parser("eval", parents=[common, agent], help="evaluate an agent")
+    sub.add_argument("--trials", type=int, help="number of games played")
+    sub.add_argument("--workers", type=int, help="number of parallel processes, each with its own seed")
+    sub.set_defaults(func=evaluate)
+
+    sub = commands.add_parser("play", parents=[common, agent], help="watch an agent play")
+    sub.add_argument("--fps", type=int, help="frames per second")
+    sub.add_argument("--mode", choices=["window", "cli"], help="type of interface")
+    sub.set_defaults(func=play)
+
+    sub = commands.add_parser("record", parents=[common, agent], help="record a game played by an agent")
+    sub.add_argument("--output", help="path of the recording (.snkr, written while playing, or .pkl)")
+    sub.set_defaults(func=record)
+
+    sub = commands.add_parser("replay", parents=[common], help="show a recorded game")
+    sub.add_argument("recording", help="path of the recording")
+    sub.add_argument("--fps", type=int, help="frames per second")
+    sub.add_argument("--mode", choices=["window", "cli"], help="type of interface")
+    sub.add_argument("--start", type=int, help="step from which the game is shown")
+    sub.add_argument("--headless", action="store_true", default=None,
+                     help="simulate the game at full speed, without showing it")
+    sub.set_defaults(func=replay)
+
+    sub = commands.add_parser("verify", parents=[common], help="check many recorded games, without showing them")
+    sub.add_argument("recordings", nargs="+", help="recordings, or directories searched for .snkr and .pkl files")
+    sub.add_argument("--workers", type=int, help="number of parallel processes")
+    sub.set_defaults(func=verify)
+
+    sub = commands.add_parser("bench", parents=[common, agent], help="run a benchmark")
+    sub.add_argument("target", choices=["startup", "game"], help="what to measure")
+    sub.add_argument("--episodes", type=int, help="number of games played (game benchmark)")
+    sub.add_argument("--runs", type=int, help="number of runs (startup benchmark)")
+    sub.set_defaults(func=bench)
+    return parser
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line arguments, filling the missing ones from the configuration file and the defaults
+
+    Parameters
+    ----------
+    argv: list(str), optional
+        The arguments. By default, the ones given to the program
+
+    Returns
+    -------
+    argparse.Namespace
+        The options
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    config = {}
+    if args.config:
+        with open(args.config) as fin:
+            config = json.load(fin)
+    for key, value in {**DEFAULTS, **config}.items():
+        if getattr(args, key, None) is None:
+            setattr(args, key, value)
+    needs_agent = args.command in ("train", "eval", "play", "record") or getattr(args, "target", None) == "game"
+    if needs_agent and not args.agent:
+        parser.error("the agent must be given, with --agent or in the configuration file")
+    if args.command == "train" and args.workers > 1 and not args.output:
+        # Otherwise all the workers would save their agents to the same default path
+        parser.error("the output must be given, with --output or in the configuration file, when workers > 1")
+    if args.command == "record" and not args.output:
+        parser.error("the output must be given, with --output or in the configuration file")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run the command given on the command line and write its results
+
+    Parameters
+    ----------
+    argv: list(str), optional
+        The arguments. By default, the ones given to the program
+    """
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(module)s - %(levelname)s - %(message)s")
+    args = parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = args.func(args)
+    output = json.dumps(results)
+    if args.results:
+        with open(args.results, "w") as fout:
+            fout.write(output + "\n")
+    else:
+        print(output)
@@ -1,9 +1,9 @@
 import sys
 import time
-from typing import Union
+from typing import Callable, Sequence, Union
 
 from snakeai.agents.agent_interface import AbstractAgent
-from snakeai.game.constants import GUIMode, Actions
+from snakeai.game.constants import GUIMode, Actions, Rewards
 from snakeai.game.memento import FrozenState
 from snakeai.game.view import GeneralView
 from snakeai.game.user_controller import UserGame
@@ -24,6 +24,21 @@ class AgentGame(UserGame):
         whether the game should wait for replay after game over
     mode : GuiMode, default=GUIMode.WINDOW
         The type of interface
+    max_steps : int, default=0
+        If positive, the game is truncated after this number of steps (one more, if the snake eats an apple at
+        the last one)
+    max_steps_per_apple : int, default=0
+        If positive, the game is truncated when the snake does not eat an apple for this number of steps
+    detect_loops : bool, default=False
+        Whether the game is truncated when a state repeats before the snake eats an apple. A greedy agent that
+        does not learn would then repeat the same moves forever. With random moves (``epsilon > 0``) the agent
+        could still leave the loop, so the game might be truncated too early
+    hooks : list(callable), default=()
+        Functions called by `play` with each transition, with the same arguments as `AbstractAgent.fit`
+        (for example a `DatasetWriter`)
+
+    A truncated game is not a game over: the agent receives `Rewards.TRUNCATED`, but the state after the last step
+    is not terminal (``done`` is False), so that the agents still bootstrap from its value.
 
     Attributes
     --------------
@@ -37,10 +52,15 @@ class AgentGame(UserGame):
         Whether the game should close immediately at game over
     to_init : bool
         Whether the GUI should be initialized
+    steps : int
+        The number of steps executed in the current game
+    truncated : bool
+        Whether the current game has been stopped by one of the step limits
     """
 
     def __init__(self, dim: int = 20, fps: int = 7, show: bool = True, replay_allowed: bool = False,
-                 mode: GUIMode = GUIMode.WINDOW):
+                 mode: GUIMode = GUIMode.WINDOW, max_steps: int = 0, max_steps_per_apple: int = 0,
+                 detect_loops: bool = False, hooks: Sequence[Callable] = ()):
         self.show = show
         if not show:
             replay_allowed = False
@@ -49,6 +69,19 @@ class AgentGame(UserGame):
         super().__init__(dim, fps, mode)
         self.replay_allowed = replay_allowed
         self.agent = None
+        self.steps = 0
+        self.max_steps = max_steps
+        self.max_steps_per_apple = max_steps_per_apple
+        self.detect_loops = detect_loops
+        self.hooks = list(hooks)
+        self.truncated = False
+        self._steps_since_apple = 0
+        self._seen = set()
+
+    @property
+    def done(self) -> bool:
+        """bool : Whether the current game has ended, because of a game over or of a step limit"""
+        return self.model.isGameOver or self.truncated
 
     def wait_end_of_frame(self, elapsed: float):
         if self.show:
@@ -63,8 +96,25 @@ class AgentGame(UserGame):
             The state at the beginning of the game
         """
         super().start()
+        self.steps = 0
+        self.truncated = False
+        self._steps_since_apple = 0
+        self._seen.clear()
         return self.model.state
 
+    def _limit_reached(self) -> bool:
+        if self.max_steps and self.steps >= self.max_steps:
+            return True
+        if self.max_steps_per_apple and self._steps_since_apple >= self.max_steps_per_apple:
+            return True
+        if self.detect_loops:
+            # The hash does not include the direction, which matters only for a snake of length 1
+            key = (self.model.zobrist, self.model.direction)
+            if key in self._seen:
+                return True
+            self._seen.add(key)
+        return False
+
     def step(self, action: Union[Actions, str]):
         """Execute one step (frame) of the game
 
@@ -78,11 +128,12 @@ class AgentGame(UserGame):
         FrozenState
             The state before the step
         int
-            The reward obtained
+            The reward obtained (`Rewards.TRUNCATED` if the game is stopped by a step limit)
         FrozenState
             The state after the step
         Bool
-            True if the new state is terminal, False otherwise
+            True if the new state is terminal, False otherwise (also when the game has been truncated: see
+            `truncated` and `done`)
         """
         start = time.time()
         inp = self.view.get_input()
@@ -92,9 +143,18 @@ class AgentGame(UserGame):
         old_state = self.model.state
         self.model.change_direction(action)
         rew = self.model.step()
+        self.steps += 1
+        self._steps_since_apple += 1
+        if rew == Rewards.GOT_APPLE:
+            self._steps_since_apple = 0
+            self._seen.clear()
+        # The apple eaten in this step is rewarded: the truncation, if due, happens at the next step
+        if not self.model.isGameOver and rew != Rewards.GOT_APPLE and self._limit_reached():
+            self.truncated = True
+            rew = Rewards.TRUNCATED
         if self.show:
             self.view.updateUI(self.model.snake, self.model.apple, self.model.score,
-                               self.model.highScore, self.model.isGameOver)
+                               self.model.highScore, self.done)
             self.wait_end_of_frame(time.time() - start)
         return old_state, rew.value, self.model.state, self.model.isGameOver
 
@@ -111,13 +171,15 @@ class AgentGame(UserGame):
 
         state = self.start()
         self.agent.reset()
-        while not self.model.isGameOver:
+        while not self.done:
             action = self.agent.execute(state)
             old_state, rew, state, done = self.step(action)
             self.agent.fit(old_state, action, rew, state, done)
+            for hook in self.hooks:
+                hook(old_state, action, rew, state, done)
         if self.show:
             self.view.updateUI(self.model.snake, self.model.apple, self.model.score, self.model.highScore,
-                               self.model.isGameOver)
+                               self.done)
             self.wait_end_of_frame(0.0)
         if self.replay_allowed:
             self.wait_for_quit()
@@ -85,16 +85,23 @@ class Actions(Enum):
     RIGHT = Coords(1, 0)
 
 
+# When actions are encoded as integers, they are positions in this list
+ACTION_LIST = list(Actions)
+
+
 class Rewards(Enum):
     """The possible rewards values
 
-    The isGameOver method can be used to check if a reward is a game over value
+    The isGameOver method can be used to check if a reward is a game over value.
+    `TRUNCATED` is given when the game is stopped by a step limit (see `AgentGame`), not by the snake dying:
+    it is not a game over, since the state after it is not terminal.
     """
     GOT_APPLE = 100
     FAILED = -100
     ENDED = 100
     CLOSER = 1
     AWAY = -1
+    TRUNCATED = -50
 
     @classmethod
     def is_game_over(cls, rew: 'Rewards') -> bool:
@@ -118,3 +125,4 @@ class GUIMode(Enum):
     WINDOW = auto()
     CLI = auto()
     NO_SHOW = auto()
+    MONITOR = auto()
@@ -1,6 +1,12 @@
-from typing import List
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from snakeai.game.constants import Actions, Coords
+from snakeai.game.zobrist import zobrist_hash
+
+# The number of different simplified states (12 binary features)
+SIMPLE_STATES = 4096
 
 
 class FrozenState:
@@ -16,6 +22,8 @@ class FrozenState:
         The direction of the snake
     dim : int
         The size of the board
+    zobrist : int, optional
+        The Zobrist hash of the state, if already known. Otherwise it is computed when first needed
 
     Attributes
     -----------
@@ -28,11 +36,21 @@ class FrozenState:
     dim : int
         The size of the board
     """
-    def __init__(self, snake: List[Coords], apple: Coords, direction: Actions, dim: int):
+    def __init__(self, snake: List[Coords], apple: Coords, direction: Actions, dim: int,
+                 zobrist: Optional[int] = None):
         self.snake = snake
         self.apple = apple
         self.direction = direction
         self.dim = dim
+        self._zobrist = zobrist
+
+    @property
+    def zobrist(self) -> int:
+        """int : A 64 bit hash of the snake and of the apple (see `snakeai.game.zobrist`). Like `table_string`,
+            it does not depend on the direction"""
+        if self._zobrist is None:
+            self._zobrist = zobrist_hash(self.snake, self.apple, self.dim)
+        return self._zobrist
 
     @property
     def simple_state(self) -> List[int]:
@@ -68,6 +86,15 @@ class FrozenState:
     def simple_state_string(self):
         return "".join([str(x) for x in self.simple_state])
 
+    @property
+    def simple_state_index(self) -> int:
+        """int : The simplified state packed in an integer in [0, 4096), with the first value as the most
+            significant bit"""
+        index = 0
+        for bit in self.simple_state:
+            index = 2 * index + bit
+        return index
+
     @property
     def table_string(self) -> str:
         """str : A string with the coords of the snake and of the apple"""
@@ -94,3 +121,87 @@ class FrozenState:
                     row.append(0)
             table.append(row)
         return table
+
+
+def encode_simple_states(states: Sequence[FrozenState]) -> np.ndarray:
+    """Encode many states with their simplified description
+
+    Parameters
+    -----------
+    states : list(FrozenState)
+        The states to encode
+
+    Returns
+    --------
+    np.ndarray
+        An array of shape (n, 12), where each row is the `simple_state` of a state
+    """
+    n = len(states)
+    if n == 0:
+        return np.zeros((0, 12), dtype=np.uint8)
+    dim = states[0].dim
+    occupied, heads = _occupied_cells(states)
+    hx, hy = heads % dim, heads // dim
+    ax = np.array([state.apple.x for state in states])
+    ay = np.array([state.apple.y for state in states])
+    features = np.zeros((n, 12), dtype=np.uint8)
+    features[:, 0], features[:, 1], features[:, 2], features[:, 3] = ay < hy, ax > hx, ay > hy, ax < hx
+    for i, action in enumerate((Actions.UP, Actions.RIGHT, Actions.DOWN, Actions.LEFT)):
+        x, y = hx + action.value.x, hy + action.value.y
+        # As in simple_state, the first row is never empty
+        inside = (0 <= x) & (x < dim) & (0 < y) & (y < dim)
+        cells = np.where(inside, y * dim + x, 0)
+        features[:, 4 + i] = ~inside | occupied[np.arange(n), cells]
+        features[:, 8 + i] = [state.direction == action for state in states]
+    return features
+
+
+def _occupied_cells(states: Sequence[FrozenState]) -> Tuple[np.ndarray, np.ndarray]:
+    # The cells (y * dim + x) occupied by each snake, as an array of shape (n, dim * dim), and the cell of each head
+    dim = states[0].dim
+    cells = np.array([c.y * dim + c.x for state in states for c in state.snake], dtype=np.int64)
+    lengths = np.array([len(state.snake) for state in states], dtype=np.int64)
+    occupied = np.zeros((len(states), dim * dim), dtype=bool)
+    occupied[np.repeat(np.arange(len(states)), lengths), cells] = True
+    return occupied, cells[np.cumsum(lengths) - 1]
+
+
+def simple_state_indices(features: np.ndarray) -> np.ndarray:
+    """Pack encoded simplified states into integers, like `FrozenState.simple_state_index`
+
+    Parameters
+    -----------
+    features : np.ndarray
+        The simplified states, with shape (n, 12)
+
+    Returns
+    --------
+    np.ndarray
+        The indices of the states, in [0, 4096)
+    """
+    return np.asarray(features, dtype=np.int64) @ (1 << np.arange(11, -1, -1))
+
+
+def encode_boards(states: Sequence[FrozenState]) -> np.ndarray:
+    """Encode many states as boards, like `FrozenState.table`
+
+    Parameters
+    -----------
+    states : list(FrozenState)
+        The states to encode. They must have the same size
+
+    Returns
+    --------
+    np.ndarray
+        An array of shape (n, dim, dim) and type int8, where the cell ``[i, y, x]`` is 3 for the apple, 1 for the
+        head of the snake, -1 for the rest of the body and 0 for the empty cells
+    """
+    if len(states) == 0:
+        return np.zeros((0, 0, 0), dtype=np.int8)
+    dim = states[0].dim
+    occupied, heads = _occupied_cells(states)
+    boards = -occupied.astype(np.int8)
+    rows = np.arange(len(states))
+    boards[rows, heads] = 1
+    boards[rows, [state.apple.y * dim + state.apple.x for state in states]] = 3
+    return boards.reshape((-1, dim, dim))
@@ -3,6 +3,7 @@ from typing import List
 
 from snakeai.game.constants import Actions, Coords, Rewards
 from snakeai.game.memento import FrozenState
+from snakeai.game.zobrist import APPLE, HEAD, LINKS, link, zobrist_hash, zobrist_keys
 
 
 # noinspection PyAttributeOutsideInit
@@ -33,6 +34,7 @@ class Snake:
     """
     def __init__(self, dim: int):
         self.dim = dim
+        self._keys = zobrist_keys(dim)
         self.MAX_SCORE = dim*dim
         self.MAX_GROWING = int(0.9*dim*dim)
         self.highScore = 0
@@ -41,6 +43,10 @@ class Snake:
     def reset(self):
         """Prepare to start the game"""
         self._snake = [Coords(self.dim//2, self.dim//2)]
+        # The cells occupied by the snake, for checking collisions without scanning the body
+        self._cells = {self._cell(self._snake[-1])}
+        self._apple = None
+        self._hash = self._keys[HEAD][self._cell(self._snake[-1])]
         self.set_apple()
         self.direction = Actions.DOWN
         self.score = 0
@@ -49,16 +55,23 @@ class Snake:
     @property
     def state(self) -> FrozenState:
         """FrozenState : A description of the current state"""
-        return FrozenState(self.snake, self.apple, self.direction, self.dim)
+        return FrozenState(self.snake, self.apple, self.direction, self.dim, self._hash)
+
+    @property
+    def zobrist(self) -> int:
+        """int : The Zobrist hash of the board (see `snakeai.game.zobrist`), updated at each step"""
+        return self._hash
+
+    def _cell(self, coords: Coords) -> int:
+        return coords.y * self.dim + coords.x
 
     def set_apple(self):
         """Choose new valid position for the apple"""
         positions = []
         for x in range(self.dim):
             for y in range(self.dim):
-                coord = Coords(x, y)
-                if coord not in self._snake:
-                    positions.append(coord)
+                if y * self.dim + x not in self._cells:
+                    positions.append(Coords(x, y))
         self.apple = random.choice(positions)
 
     def change_direction(self, direction: Actions):
@@ -82,6 +95,32 @@ class Snake:
     @snake.setter
     def snake(self, new_snake: List[Coords]):
         self._snake = new_snake.copy()
+        self._cells = {self._cell(c) for c in self._snake}
+        self._hash = zobrist_hash(self._snake, self._apple, self.dim)
+
+    @property
+    def apple(self) -> Coords:
+        """Coords : The position of the apple"""
+        return self._apple
+
+    @apple.setter
+    def apple(self, new_apple: Coords):
+        if self._apple is not None:
+            self._hash ^= self._keys[APPLE][self._cell(self._apple)]
+        self._apple = new_apple
+        self._hash ^= self._keys[APPLE][self._cell(new_apple)]
+
+    def _advance_head(self, next_head: Coords):
+        head = self._cell(self._snake[-1])
+        self._hash ^= self._keys[HEAD][head] ^ self._keys[LINKS[self.direction]][head]
+        self._hash ^= self._keys[HEAD][self._cell(next_head)]
+        self._snake.append(next_head)
+        self._cells.add(self._cell(next_head))
+
+    def _retract_tail(self):
+        tail = self._snake.pop(0)
+        self._cells.discard(self._cell(tail))
+        self._hash ^= self._keys[link(tail, self._snake[0])][self._cell(tail)]
 
     def step(self) -> Rewards:
         """Update model by moving snake of one step
@@ -92,27 +131,27 @@ class Snake:
             The reward obtained after the step
         """
         next_head = self._snake[-1] + self.direction.value
-        # Check collision with itself
-        if next_head in self._snake:
-            self.isGameOver = True
-            return Rewards.FAILED
         # Check collision with border
         if not (0 <= next_head.x < self.dim and 0 <= next_head.y < self.dim):
             self.isGameOver = True
             return Rewards.FAILED
+        # Check collision with itself
+        if self._cell(next_head) in self._cells:
+            self.isGameOver = True
+            return Rewards.FAILED
         prev_distance = self._snake[-1].distance(self.apple)
-        self._snake.append(next_head)
+        self._advance_head(next_head)
         if next_head == self.apple:
             self.score += 1
             self.highScore = max(self.score, self.highScore)
             if self.score > self.MAX_GROWING:
-                self._snake.pop(0)
+                self._retract_tail()
             self.set_apple()
             self.isGameOver = self.score > self.MAX_SCORE
             if self.isGameOver:
                 return Rewards.ENDED
             return Rewards.GOT_APPLE
-        self._snake.pop(0)
+        self._retract_tail()
         if self._snake[-1].distance(self.apple) >= prev_distance:
             return Rewards.AWAY
         return Rewards.CLOSER
@@ -0,0 +1,178 @@
+"""The 8 symmetries of the square board (4 rotations, each one optionally followed by a mirroring)
+
+A symmetry is identified by an integer ``t`` in [0, 8): the board is rotated clockwise ``t % 4`` times by 90 degrees,
+and then mirrored horizontally if ``t >= 4``. The game is the same in every orientation, so an agent can learn
+only the canonical orientation of each state (chosen with a fixed order) and transform the actions to and
+from it.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from snakeai.game.constants import Actions, ACTION_LIST, Coords
+from snakeai.game.memento import FrozenState, SIMPLE_STATES, simple_state_indices
+
+SYMMETRIES = 8
+
+
+def inverse(t: int) -> int:
+    """Get the symmetry that undoes the symmetry `t`
+
+    Parameters
+    ----------
+    t : int
+        The symmetry
+
+    Returns
+    -------
+    int
+        The inverse symmetry
+    """
+    # Mirrored rotations are reflections, which are their own inverse
+    return t if t >= 4 else (4 - t) % 4
+
+
+def transform_coords(coords: Coords, t: int, dim: int) -> Coords:
+    """Transform a position on the board
+
+    Parameters
+    ----------
+    coords : Coords
+        The position
+    t : int
+        The symmetry
+    dim : int
+        The size of the board
+
+    Returns
+    -------
+    Coords
+        The transformed position
+    """
+    x, y = coords.x, coords.y
+    for _ in range(t % 4):
+        x, y = dim - 1 - y, x
+    if t >= 4:
+        x = dim - 1 - x
+    return Coords(x, y)
+
+
+def transform_action(action: Actions, t: int) -> Actions:
+    """Transform a direction
+
+    Parameters
+    ----------
+    action : Actions
+        The direction
+    t : int
+        The symmetry
+
+    Returns
+    -------
+    Actions
+        The transformed direction
+    """
+    x, y = action.value.x, action.value.y
+    for _ in range(t % 4):
+        x, y = -y, x
+    if t >= 4:
+        x = -x
+    return Actions(Coords(x, y))
+
+
+def transform_state(state: FrozenState, t: int) -> FrozenState:
+    """Transform a whole state
+
+    Parameters
+    ----------
+    state : FrozenState
+        The state
+    t : int
+        The symmetry
+
+    Returns
+    -------
+    FrozenState
+        The transformed state
+    """
+    return FrozenState([transform_coords(c, t, state.dim) for c in state.snake],
+                       transform_coords(state.apple, t, state.dim), transform_action(state.direction, t), state.dim)
+
+
+def canonical_table_string(state: FrozenState) -> Tuple[str, int]:
+    """Find the canonical orientation of a state, as used by `StateAgent`
+
+    The canonical orientation is the one whose list of coordinates (the snake followed by the apple) comes
+    first in lexicographic order.
+
+    Parameters
+    ----------
+    state : FrozenState
+        The state
+
+    Returns
+    -------
+    str
+        The `table_string` of the state in the canonical orientation
+    int
+        The symmetry that transforms the state to the canonical orientation
+    """
+    d = state.dim - 1
+    points = [(c.x, c.y) for c in state.snake]
+    points.append((state.apple.x, state.apple.y))
+    orientations = ([(x, y) for x, y in points], [(d - y, x) for x, y in points],
+                    [(d - x, d - y) for x, y in points], [(y, d - x) for x, y in points],
+                    [(d - x, y) for x, y in points], [(y, x) for x, y in points],
+                    [(x, d - y) for x, y in points], [(d - y, d - x) for x, y in points])
+    best, t = min((orientation, t) for t, orientation in enumerate(orientations))
+    return "".join(f"Coords(x={x}, y={y})" for x, y in best), t
+
+
+def _feature_permutation(t: int) -> np.ndarray:
+    # The simplified state has 3 groups of 4 features (apple, obstacles, direction), each in the order
+    # UP, RIGHT, DOWN, LEFT: a rotation shifts each group by one, a mirroring swaps RIGHT and LEFT
+    source = np.arange(12)
+    for _ in range(t % 4):
+        source = source.reshape((3, 4))[:, [3, 0, 1, 2]].reshape(-1)
+    if t >= 4:
+        source = source.reshape((3, 4))[:, [0, 3, 2, 1]].reshape(-1)
+    return source
+
+
+def _canonical_simple_states() -> Tuple[np.ndarray, np.ndarray]:
+    features = (np.arange(SIMPLE_STATES)[:, None] >> np.arange(11, -1, -1)) & 1
+    indices = np.stack([simple_state_indices(features[:, _feature_permutation(t)]) for t in range(SYMMETRIES)])
+    transforms = indices.argmin(axis=0)
+    return indices[transforms, np.arange(SIMPLE_STATES)], transforms
+
+
+# CANONICAL_SIMPLE[i] is the canonical simplified state of the state with index i,
+# and SIMPLE_TRANSFORM[i] the symmetry that transforms the state to it
+CANONICAL_SIMPLE, SIMPLE_TRANSFORM = _canonical_simple_states()
+# ACTION_MAP[t, a] is the position in ACTION_LIST of the action a transformed by the symmetry t
+ACTION_MAP = np.array([[ACTION_LIST.index(transform_action(act, t)) for act in ACTION_LIST]
+                       for t in range(SYMMETRIES)])
+# INVERSE_ACTION_MAP[t, a] transforms the action a back from the orientation given by the symmetry t
+INVERSE_ACTION_MAP = ACTION_MAP[[inverse(t) for t in range(SYMMETRIES)]]
+
+
+def canonical_simple_indices(indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the canonical orientation of simplified states
+
+    The simplified states are not exactly symmetric: the first row of the board is always seen as an obstacle
+    (see `FrozenState.simple_state`). States near that row are therefore shared with orientations that
+    are slightly different.
+
+    Parameters
+    ----------
+    indices : np.ndarray
+        The `simple_state_index` of the states
+
+    Returns
+    -------
+    np.ndarray
+        The indices of the canonical states
+    np.ndarray
+        The symmetries that transform each state to its canonical orientation
+    """
+    return CANONICAL_SIMPLE[indices], SIMPLE_TRANSFORM[indices]
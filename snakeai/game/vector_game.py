@@ -0,0 +1,158 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from snakeai.agents.agent_interface import AbstractAgent
+from snakeai.game.constants import ACTION_LIST, GUIMode, Rewards
+from snakeai.game.memento import FrozenState, encode_boards, encode_simple_states
+from snakeai.game.model import Snake
+from snakeai.game.view import generate_view
+
+
+class VectorGame:
+    """Many games played at the same time by the same agent
+
+    At each step the agent chooses the actions of all the games with one call to `execute_batch`, and learns
+    from all the transitions with one call to `fit_batch`. The games that end are restarted immediately,
+    so that the number of running games is always the same, and the row ``i`` of each batch always
+    comes from the game ``i``. With `GUIMode.MONITOR`, the first games are shown in a `MonitorGUI` window,
+    which only encodes their boards when it draws a frame.
+
+    Parameters
+    --------------
+    dim : int
+        the side of the board
+    n_games : int
+        the number of games played at the same time
+    encoded : bool, default=True
+        Whether the states are given to the agent as an array of simplified states (see `encode_simple_states`),
+        or as a list of `FrozenState`
+    max_steps : int, default=0
+        If positive, a game is truncated after this number of steps (one more, if the snake eats an apple at the
+        last one)
+    max_steps_per_apple : int, default=0
+        If positive, a game is truncated when the snake does not eat an apple for this number of steps
+    mode : GUIMode, default=GUIMode.NO_SHOW
+        `GUIMode.NO_SHOW`, or `GUIMode.MONITOR` to watch the games
+
+    Attributes
+    --------------
+    models : list(Snake)
+        The models of the games
+    states : np.ndarray or list(FrozenState)
+        The current states of the games
+    scores : list(int)
+        The final scores of the games that have ended, in order of ending
+    steps : int
+        The total number of steps executed in all the games
+    truncations : int
+        The number of games stopped by a step limit
+    ended : np.ndarray
+        Whether each game has ended (with a game over or a truncation) in the last step
+    view : GeneralView
+        The view of the games
+
+    Raises
+    --------------
+    ValueError
+        If the mode cannot show many games
+    """
+
+    def __init__(self, dim: int, n_games: int, encoded: bool = True, max_steps: int = 0, max_steps_per_apple: int = 0,
+                 mode: GUIMode = GUIMode.NO_SHOW):
+        if mode not in (GUIMode.NO_SHOW, GUIMode.MONITOR):
+            raise ValueError(f"{mode} cannot show many games: use GUIMode.NO_SHOW or GUIMode.MONITOR")
+        self.dim = dim
+        self.n_games = n_games
+        self.encoded = encoded
+        self.max_steps = max_steps
+        self.max_steps_per_apple = max_steps_per_apple
+        self.models = [Snake(dim) for _ in range(n_games)]
+        self.scores = []
+        self.steps = 0
+        self.truncations = 0
+        self.ended = np.zeros(n_games, dtype=bool)
+        self._game_steps = [0] * n_games
+        self._steps_since_apple = [0] * n_games
+        self.states = self._observe([model.state for model in self.models])
+        self.view = generate_view(mode)
+
+    def _observe(self, states: List[FrozenState]) -> Union[np.ndarray, List[FrozenState]]:
+        if self.encoded:
+            return encode_simple_states(states)
+        return states
+
+    def _limit_reached(self, i: int) -> bool:
+        return bool(self.max_steps and self._game_steps[i] >= self.max_steps
+                    or self.max_steps_per_apple and self._steps_since_apple[i] >= self.max_steps_per_apple)
+
+    def step(self, actions: np.ndarray) -> Tuple[Union[np.ndarray, List[FrozenState]], np.ndarray, np.ndarray,
+                                                 Union[np.ndarray, List[FrozenState]], np.ndarray]:
+        """Execute one step in all the games, restarting the ones that end
+
+        Parameters
+        ------------
+        actions : np.ndarray
+            The action for each game, as position in `ACTION_LIST`
+
+        Returns
+        ------------
+        tuple
+            The states before the step, the actions, the rewards, the states after the step and whether each
+            of them is terminal, in the format expected by `AbstractAgent.fit_batch`. A truncated game has the
+            reward `Rewards.TRUNCATED`, but its state is not terminal (see `ended`)
+        """
+        old_states = self.states
+        rewards = np.empty(self.n_games, dtype=np.float64)
+        dones = np.empty(self.n_games, dtype=bool)
+        ended = np.empty(self.n_games, dtype=bool)
+        new_states = []
+        current_states = []
+        for i, (model, action) in enumerate(zip(self.models, actions)):
+            model.change_direction(ACTION_LIST[action])
+            reward = model.step()
+            self._game_steps[i] += 1
+            self._steps_since_apple[i] = 0 if reward == Rewards.GOT_APPLE else self._steps_since_apple[i] + 1
+            # The apple eaten in this step is rewarded: the truncation, if due, happens at the next step
+            if not model.isGameOver and reward != Rewards.GOT_APPLE and self._limit_reached(i):
+                reward = Rewards.TRUNCATED
+                self.truncations += 1
+            rewards[i] = reward.value
+            dones[i] = model.isGameOver
+            ended[i] = model.isGameOver or reward == Rewards.TRUNCATED
+            state = model.state
+            new_states.append(state)
+            if ended[i]:
+                self.scores.append(model.score)
+                model.reset()
+                self._game_steps[i] = self._steps_since_apple[i] = 0
+                state = model.state
+            current_states.append(state)
+        self.steps += self.n_games
+        new_states = self._observe(new_states)
+        self.ended = ended
+        self.states = new_states if not ended.any() else self._observe(current_states)
+        if self.view.frame_due():
+            shown = self.models[:self.view.max_games]
+            self.view.update_games(encode_boards([model.state for model in shown]), [model.score for model in shown])
+        return old_states, np.asarray(actions), rewards, new_states, dones
+
+    def play_step(self, agent: AbstractAgent, train: bool = True) -> np.ndarray:
+        """Let the agent choose the actions for all the games and execute them
+
+        Parameters
+        ------------
+        agent : AbstractAgent
+            The agent that plays
+        train : bool, default=True
+            Whether the agent learns from the transitions
+
+        Returns
+        ------------
+        np.ndarray
+            Whether each game has ended in this step, with a game over or a truncation
+        """
+        transitions = self.step(agent.execute_batch(self.states))
+        if train:
+            agent.fit_batch(transitions)
+        return self.ended
@@ -1,6 +1,10 @@
-from typing import List, Union, Optional
+import math
+import sys
+import time
+from typing import List, Optional, Sequence, TextIO, Union
+
+import numpy as np
 
-import pygame
 from snakeai.game.constants import Actions, Coords, GUIMode
 
 
@@ -50,11 +54,42 @@ class GeneralView:
             Whether the game is finished
         """
 
+    def frame_due(self) -> bool:
+        """Whether `update_games` would show a new frame now
+
+        Returns
+        ----------
+        bool
+            False for the views that cannot show many games, so that the boards are not prepared for nothing
+        """
+        return False
+
+    def update_games(self, boards: np.ndarray, scores: Sequence[int]):
+        """Show many games at once
+
+        Parameters
+        ----------
+        boards : np.ndarray
+            The boards of the games, as returned by `encode_boards`
+        scores : list(int)
+            The current score of each game
+        """
+
 
 class GameGUI(GeneralView):
     """A GUI object for rendering and playing the game
 
-    This is the class used to create a window on the screen.
+    This is the class used to create a window on the screen. Pygame is imported only when the GUI is used,
+    so that games without a window do not need to load it.
+
+    When the snake has moved by one step since the last frame, only the cells that have changed (the new head,
+    the old head, the erased tail and the apple) and the score are drawn again, and only their rectangles of the
+    window are updated. Any other change (a new game, a jump in a recording) redraws the whole window.
+
+    Parameters
+    ----------
+    incremental : bool, default=True
+        Whether to draw only the changes between two frames. If False, every frame is drawn from scratch
     """
     SQUARE_SIDE = 20
     RED = (255, 0, 0)
@@ -63,6 +98,13 @@ class GameGUI(GeneralView):
     BLACK = (0, 0, 0)
     WHITE = (255, 255, 255)
 
+    def __init__(self, incremental: bool = True):
+        self.incremental = incremental
+        self._snake = None
+        self._apple = None
+        self._text = None
+        self._text_rect = None
+
     def init_screen(self, dim: int, snake: List[Coords], apple: Coords, score: int, high_score: int):
         """
         Create the window where the game will be shown
@@ -78,16 +120,19 @@ class GameGUI(GeneralView):
         high_score: int
             The current high score
         """
+        import pygame
         pygame.init()
         self.font = pygame.font.SysFont("freesans", 28)
         board_side = self.SQUARE_SIDE * dim
         pygame.display.set_caption('Snake Game')
         self.screen = pygame.display.set_mode([max(327, board_side), 33 + board_side])
         self.board = pygame.Surface((board_side, board_side))
+        self._snake = None
         self.updateUI(snake, apple, score, high_score)
 
     def quit(self):
         """Close the window"""
+        import pygame
         pygame.quit()
 
     def get_input(self) -> Optional[Union[Actions, str]]:
@@ -98,6 +143,7 @@ class GameGUI(GeneralView):
         `Actions`, ``"REPLAY"`` or ``"QUIT"``
             the current input
         """
+        import pygame
         res = None
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -132,50 +178,136 @@ class GameGUI(GeneralView):
         isGameOver : Bool, default=False
             if set to `True`, it shows the game over screen
         """
-        self.board.fill(self.WHITE)
-        self.screen.fill(self.WHITE)
+        import pygame
         if isGameOver:
-            text = self.font.render("Game Over! - Final score: " + str(score) + "/" + str(high_score), True, self.BLACK)
+            text = "Game Over! - Final score: " + str(score) + "/" + str(high_score)
+        else:
+            text = "Score: " + str(score) + " - " + "High Score: " + str(high_score)
+        cells = self._changed_cells(snake, apple) if self.incremental else None
+        rendered = self.font.render(text, True, self.BLACK) if cells is None or text != self._text else None
+        # The board is below the text, so it moves if the height of the text changes
+        if cells is None or rendered and rendered.get_height() != self._board_position[1]:
+            self._draw_all(snake, apple, rendered)
+            pygame.display.update()
         else:
-            text = self.font.render("Score: " + str(score) + " - " + "High Score: " + str(high_score), True, self.BLACK)
+            dirty = [self._draw_cell(cell, snake, apple) for cell in cells]
+            self._draw_borders()
+            x, y = self._board_position
+            for rect in dirty:
+                self.screen.blit(self.board, rect, rect.move(-x, -y))
+            if rendered:
+                dirty.append(self._draw_text(rendered))
+            pygame.display.update(dirty)
+        self._snake, self._apple, self._text = snake.copy(), apple, text
+
+    def _changed_cells(self, snake: List[Coords], apple: Coords) -> Optional[List[Coords]]:
+        # The cells to draw again if the snake has made at most one step since the last frame, otherwise None
+        old = self._snake
+        if not old or not snake:
+            return None
+        if len(snake) == len(old) and snake[0] == old[0] and snake[-1] == old[-1]:
+            # The snake has not moved (e.g. at game over)
+            cells = []
+        elif len(snake) == len(old) == 1 or len(snake) > 1 and snake[-2] == old[-1] and (
+                len(snake) == len(old) and snake[0] == old[1] or len(snake) == len(old) + 1 and snake[0] == old[0]):
+            cells = [old[0], old[-1], snake[-1]]
+        else:
+            return None
+        if apple != self._apple:
+            cells += [self._apple, apple]
+        return cells
+
+    def _cell_rect(self, cell: Coords) -> 'pygame.Rect':
+        import pygame
+        return pygame.Rect(cell.x * self.SQUARE_SIDE, cell.y * self.SQUARE_SIDE, self.SQUARE_SIDE, self.SQUARE_SIDE)
+
+    def _draw_cell(self, cell: Coords, snake: List[Coords], apple: Coords) -> 'pygame.Rect':
+        # Draw a cell of the board as it is now, and return its rectangle in the window. After one step, the changed
+        # cells of the body can only be its ends, except for the old position of an apple moved by hand
+        import pygame
+        rect = self._cell_rect(cell)
+        self.board.fill(self.WHITE, rect)
+        if cell == snake[-1]:
+            pygame.draw.rect(self.board, self.LIGHT_GREEN, rect)
+        elif cell == snake[0] or cell in snake[-2:-1] or cell == self._apple and cell in snake:
+            pygame.draw.rect(self.board, self.DARK_GREEN, rect)
+        if cell == apple:
+            self._draw_apple(apple)
+        return rect.move(self._board_position)
+
+    def _draw_apple(self, apple: Coords):
+        import pygame
+        pygame.draw.circle(self.board, self.RED,
+                           ((apple.x + 0.5) * self.SQUARE_SIDE, (apple.y + 0.5) * self.SQUARE_SIDE),
+                           self.SQUARE_SIDE / 2)
 
-        self.screen.blit(text, (0, 0))
+    def _draw_text(self, rendered: 'pygame.Surface') -> 'pygame.Rect':
+        # Replace the score, and return the rectangle of the window that has changed
+        rect = rendered.get_rect()
+        dirty = rect.union(self._text_rect) if self._text_rect else rect
+        self.screen.fill(self.WHITE, dirty)
+        self.screen.blit(rendered, (0, 0))
+        self._text_rect = rect
+        return dirty
+
+    def _draw_borders(self):
+        import pygame
+        width, height = self.board.get_width(), self.board.get_height()
+        pygame.draw.line(self.board, self.BLACK, (0, 0), (width, 0), 1)
+        pygame.draw.line(self.board, self.BLACK, (0, height - 1), (width, height - 1), 1)
+        pygame.draw.line(self.board, self.BLACK, (0, 0), (0, height - 1), 1)
+        pygame.draw.line(self.board, self.BLACK, (width - 1, 0), (width - 1, height - 1), 1)
+
+    def _draw_all(self, snake: List[Coords], apple: Coords, rendered: 'pygame.Surface'):
+        import pygame
+        self.board.fill(self.WHITE)
+        self.screen.fill(self.WHITE)
+        self._text_rect = None
+        self._draw_text(rendered)
 
         # Draw the snake
         for rect in snake:
             if rect == snake[-1]:
-                pygame.draw.rect(self.board, self.LIGHT_GREEN, pygame.Rect(rect.x * self.SQUARE_SIDE,
-                                                                           rect.y * self.SQUARE_SIDE, self.SQUARE_SIDE,
-                                                                           self.SQUARE_SIDE))
+                pygame.draw.rect(self.board, self.LIGHT_GREEN, self._cell_rect(rect))
             else:
-                pygame.draw.rect(self.board, self.DARK_GREEN, pygame.Rect(rect.x * self.SQUARE_SIDE,
-                                                                          rect.y * self.SQUARE_SIDE, self.SQUARE_SIDE,
-                                                                          self.SQUARE_SIDE))
-        # Draw the apple
-        pygame.draw.circle(self.board, self.RED,
-                           ((apple.x + 0.5) * self.SQUARE_SIDE, (apple.y + 0.5) * self.SQUARE_SIDE),
-                           self.SQUARE_SIDE / 2)
-        # Top border
-        pygame.draw.line(self.board, self.BLACK, (0, 0), (self.board.get_width(), 0), 1)
-        # Bottom border
-        pygame.draw.line(self.board, self.BLACK,
-                         (0, self.board.get_height() - 1), (self.board.get_width(), self.board.get_height() - 1), 1)
-        # Left border
-        pygame.draw.line(self.board, self.BLACK, (0, 0), (0, self.board.get_height() - 1), 1)
-        # Right border
-        pygame.draw.line(self.board, self.BLACK,
-                         (self.board.get_width() - 1, 0), (self.board.get_width() - 1, self.board.get_height() - 1), 1)
-        horPosition = (self.screen.get_width() - self.board.get_width()) // 2
-        self.screen.blit(self.board, (horPosition, text.get_height()))
-        pygame.display.update()
+                pygame.draw.rect(self.board, self.DARK_GREEN, self._cell_rect(rect))
+        self._draw_apple(apple)
+        self._draw_borders()
+        self._board_position = ((self.screen.get_width() - self.board.get_width()) // 2, self._text_rect.height)
+        self.screen.blit(self.board, self._board_position)
 
 
 class CliGUI(GeneralView):
-    """A GUI object for rendering the game in the command line"""
+    """A GUI object for rendering the game in the command line
+
+    Each frame is drawn in a buffer and written with a single call. In `diff` mode, the board stays at the top of
+    the terminal, and only the characters that have changed since the last frame are written, after moving the
+    cursor to them with ANSI escape codes.
+
+    Parameters
+    ----------
+    diff : bool, default=False
+        Whether to write only the changes between two frames. The terminal must support ANSI escape codes
+    stream : file, optional
+        Where the frames are written. By default, the current ``sys.stdout``
+    """
+    SNAKE = ord("x")
+    APPLE = ord("o")
+
+    def __init__(self, diff: bool = False, stream: Optional[TextIO] = None):
+        self.diff = diff
+        self.stream = stream
+        self._frame = None
+        self._game_over = False
 
     def init_screen(self, dim: int, snake: List[Coords], apple: Coords, score: int, high_score: int):
         """Show the initial state of the game"""
         self.dim = dim
+        self._border = "--" + "-" * dim + "\n"
+        # Every line has the same width, so the cell (x, y) is at (y + 1) * width + x + 1
+        self._width = dim + 3
+        self._empty = bytearray((self._border + ("|" + " " * dim + "|\n") * dim + self._border).encode())
+        self._frame = None
         self.updateUI(snake, apple, score, high_score)
 
     def get_input(self) -> Optional[Union[Actions, str]]:
@@ -217,23 +349,189 @@ class CliGUI(GeneralView):
         isGameOver : bool, default=False
             if set to `True`, it shows the game over screen
         """
-        if isGameOver:
-            print("--" + "-" * self.dim)
-            print("Final Score:", score, "/", high_score)
-        print("--" + "-" * self.dim)
-        for y in range(self.dim):
-            row = "|"
-            for x in range(self.dim):
-                coord = Coords(x, y)
-                if coord == apple:
-                    row += "o"
-                elif coord in snake:
-                    row += "x"
-                else:
-                    row += " "
-            row += "|"
-            print(row)
-        print("--" + "-" * self.dim)
+        frame = self._empty.copy()
+        width = self._width
+        for c in snake:
+            frame[(c.y + 1) * width + c.x + 1] = self.SNAKE
+        frame[(apple.y + 1) * width + apple.x + 1] = self.APPLE
+        header = self._border + f"Final Score: {score} / {high_score}\n" if isGameOver else ""
+        if not self.diff:
+            output = header + frame.decode()
+        elif self._frame is None or isGameOver != self._game_over:
+            # Clear the terminal, and draw from its top left corner
+            output = "\x1b[H\x1b[2J" + header + frame.decode()
+        else:
+            output = self._changes(frame, header.count("\n"))
+        self._frame, self._game_over = frame, isGameOver
+        stream = self.stream or sys.stdout
+        stream.write(output)
+        stream.flush()
+
+    def _changes(self, frame: bytearray, top: int) -> str:
+        # The escape codes that write the characters changed since the last frame, and bring the cursor below the board
+        changed = np.flatnonzero(np.frombuffer(frame, dtype=np.uint8) != np.frombuffer(self._frame, dtype=np.uint8))
+        parts = [f"\x1b[{top + position // self._width + 1};{position % self._width + 1}H{chr(frame[position])}"
+                 for position in changed.tolist()]
+        parts.append(f"\x1b[{top + len(frame) // self._width + 1};1H")
+        return "".join(parts)
+
+
+class MonitorGUI(GeneralView):
+    """A window that shows many games at once, tiled in a grid
+
+    The boards are drawn from the arrays of `encode_boards`: their colours are looked up for all the games together,
+    the small image with one pixel per cell is scaled to the window by pygame, and the window is updated once per
+    frame. The frame rate is capped independently of the games: a frame that comes less than ``1 / fps`` seconds
+    after the previous one is skipped without waiting, so watching the games never slows them down. Closing the
+    window stops the monitor, while the games go on.
+
+    It can also show a single game (from `UserGame` or `AgentGame`), with the same cap on the frame rate.
+
+    Parameters
+    ----------
+    max_games : int, default=16
+        The maximum number of games shown (the first ones)
+    fps : float, default=10
+        The maximum number of frames per second
+    max_side : int, default=960
+        The maximum width and height of the boards, in pixels
+    """
+    # The colours of the values of `encode_boards`, shifted by one: body, empty cell, head and apple
+    PALETTE = np.array([GameGUI.DARK_GREEN, GameGUI.WHITE, GameGUI.LIGHT_GREEN, GameGUI.WHITE, GameGUI.RED],
+                       dtype=np.uint8)
+    GRID = (64, 64, 64)
+    TEXT_HEIGHT = 33
+
+    def __init__(self, max_games: int = 16, fps: float = 10, max_side: int = 960):
+        self.max_games = max_games
+        self.frame_time = 1 / fps
+        self.max_side = max_side
+        self.closed = False
+        self.screen = None
+        self._dim = None
+        self._layout = None
+        self._last_frame = -math.inf
+
+    def init_screen(self, dim: int, snake: List[Coords], apple: Coords, score: int, high_score: int):
+        """
+        Show the first frame of a single game
+
+        Parameters
+        --------------
+        dim : int
+            the side of the board
+        snake : list(Coords)
+        apple : Coords
+        score : int
+            The current score
+        high_score: int
+            The current high score
+        """
+        self._dim = dim
+        self._last_frame = -math.inf
+        self.updateUI(snake, apple, score, high_score)
+
+    def quit(self):
+        """Close the window"""
+        if self.screen is not None:
+            import pygame
+            pygame.quit()
+            self.screen = None
+            self._layout = None
+
+    def frame_due(self) -> bool:
+        """Whether a new frame would be shown now
+
+        Returns
+        ----------
+        bool
+            False if the window has been closed, or the previous frame was shown less than ``1 / fps`` seconds ago
+        """
+        return not self.closed and time.perf_counter() - self._last_frame >= self.frame_time
+
+    def updateUI(self, snake: List[Coords], apple: Coords, score: int, high_score: int, isGameOver: bool = False):
+        """Show a single game, if a frame is due
+
+        Parameters
+        ----------
+        snake : list(Coords)
+            The position of the snake
+        apple : Coords
+            The position of the apple
+        score : int
+            The current score
+        high_score : int
+            the current high score
+        isGameOver bool, default=False
+            Whether the game is finished (the last frame of a game is always shown)
+        """
+        if not (isGameOver and not self.closed or self.frame_due()):
+            return
+        board = np.zeros((1, self._dim, self._dim), dtype=np.int8)
+        for c in snake:
+            board[0, c.y, c.x] = -1
+        board[0, snake[-1].y, snake[-1].x] = 1
+        board[0, apple.y, apple.x] = 3
+        self._show(board, f"Score: {score}  High Score: {high_score}" + ("  Game Over" if isGameOver else ""))
+
+    def update_games(self, boards: np.ndarray, scores: Sequence[int]):
+        """Show many games at once, if a frame is due
+
+        Parameters
+        ----------
+        boards : np.ndarray
+            The boards of the games, as returned by `encode_boards`. Only the first `max_games` are shown
+        scores : list(int)
+            The current score of each game
+        """
+        if not self.frame_due() or len(boards) == 0:
+            return
+        scores = list(scores)[:self.max_games]
+        self._show(boards[:self.max_games], f"{len(scores)} games  Best: {max(scores)}  "
+                                            f"Average: {sum(scores) / len(scores):.1f}")
+
+    def _open(self, dim: int, n_games: int):
+        import pygame
+        pygame.init()
+        columns = math.ceil(math.sqrt(n_games))
+        rows = math.ceil(n_games / columns)
+        # One line of cells between the boards, and around them
+        width, height = columns * (dim + 1) + 1, rows * (dim + 1) + 1
+        scale = max(1, self.max_side // max(width, height))
+        self._layout = (dim, n_games, rows, columns)
+        self.font = pygame.font.SysFont("freesans", 28)
+        pygame.display.set_caption("Snake Game Monitor")
+        self.screen = pygame.display.set_mode([max(327, width * scale), self.TEXT_HEIGHT + height * scale])
+        self._board_size = (width * scale, height * scale)
+
+    def _image(self, boards: np.ndarray) -> np.ndarray:
+        # The colours of all the cells, with the boards in a grid: one pixel per cell, indexed as [x, y] by pygame
+        dim, n_games, rows, columns = self._layout
+        tiles = np.empty((rows * columns, dim + 1, dim + 1, 3), dtype=np.uint8)
+        tiles[...] = self.GRID
+        tiles[:n_games, 1:, 1:] = self.PALETTE[boards.astype(np.intp) + 1]
+        image = np.empty((columns * (dim + 1) + 1, rows * (dim + 1) + 1, 3), dtype=np.uint8)
+        image[...] = self.GRID
+        # From (row, column, y, x) to (column, x, row, y)
+        image[:-1, :-1] = tiles.reshape((rows, columns, dim + 1, dim + 1, 3)).transpose((1, 3, 0, 2, 4)).reshape(
+            (columns * (dim + 1), rows * (dim + 1), 3))
+        return image
+
+    def _show(self, boards: np.ndarray, text: str):
+        import pygame
+        if self._layout is None or self._layout[:2] != (boards.shape[1], len(boards)):
+            self._open(boards.shape[1], len(boards))
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.closed = True
+                self.quit()
+                return
+        self.screen.fill(GameGUI.BLACK)
+        self.screen.blit(self.font.render(text, True, GameGUI.WHITE), [0, 0])
+        image = pygame.surfarray.make_surface(self._image(boards))
+        self.screen.blit(pygame.transform.scale(image, self._board_size), [0, self.TEXT_HEIGHT])
+        pygame.display.update()
+        self._last_frame = time.perf_counter()
 
 
 def generate_view(mode: GUIMode) -> GeneralView:
@@ -255,3 +553,5 @@ def generate_view(mode: GUIMode) -> GeneralView:
         return GameGUI()
     if mode == GUIMode.CLI:
         return CliGUI()
+    if mode == GUIMode.MONITOR:
+        return MonitorGUI()
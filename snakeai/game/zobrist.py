@@ -0,0 +1,87 @@
+"""Zobrist hashing of the board
+
+Each cell of the board has a random 64 bit key for each piece that can lie on it: the head of the snake, a
+segment of the body (one key for each direction towards the next segment, so that the order of the body is part of
+the hash) and the apple. The hash of a state is the XOR of the keys of its pieces, so moving the snake or the apple
+changes it with a few XOR operations, whatever the length of the snake.
+
+Like `FrozenState.table_string`, the hash describes the snake and the apple, but not the direction. The keys
+are generated with a fixed seed, so the hashes are the same in every process and can be saved.
+"""
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+
+from snakeai.game.constants import ACTION_LIST, Coords
+
+SEED = 20200606
+HEAD = len(ACTION_LIST)
+APPLE = HEAD + 1
+# The position in ACTION_LIST of each action, which is also the piece of a body segment followed in that direction
+LINKS = {action: i for i, action in enumerate(ACTION_LIST)}
+_OFFSETS = {(action.value.x, action.value.y): i for i, action in enumerate(ACTION_LIST)}
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(dim: int) -> List[List[int]]:
+    """Get the random keys for a board
+
+    Parameters
+    ----------
+    dim : int
+        The size of the board
+
+    Returns
+    -------
+    list(list(int))
+        ``keys[piece][y * dim + x]`` is the key of a piece in a cell. The pieces are the body segments
+        (by the position in `ACTION_LIST` of the direction of the next segment), `HEAD` and `APPLE`
+    """
+    rng = np.random.default_rng([SEED, dim])
+    keys = rng.integers(1, 2**64, size=(APPLE + 1, dim * dim), dtype=np.uint64)
+    return keys.tolist()
+
+
+def link(segment: Coords, following: Coords) -> int:
+    """Get the piece of a body segment
+
+    Parameters
+    ----------
+    segment : Coords
+        The position of the segment
+    following : Coords
+        The position of the next segment, towards the head
+
+    Returns
+    -------
+    int
+        The piece of the segment
+    """
+    return _OFFSETS[(following.x - segment.x, following.y - segment.y)]
+
+
+def zobrist_hash(snake: Sequence[Coords], apple: Coords, dim: int) -> int:
+    """Compute the hash of a state from scratch
+
+    Parameters
+    ----------
+    snake : list(Coords)
+        The body of the snake (head is last)
+    apple : Coords
+        The position of the apple
+    dim : int
+        The size of the board
+
+    Returns
+    -------
+    int
+        The 64 bit hash of the state
+    """
+    keys = zobrist_keys(dim)
+    head = snake[-1]
+    result = keys[HEAD][head.y * dim + head.x] ^ keys[APPLE][apple.y * dim + apple.x]
+    for segment, following in zip(snake, snake[1:]):
+        result ^= keys[link(segment, following)][segment.y * dim + segment.x]
+    return result
+
@@ -0,0 +1,40 @@
+import math
+import random
+
+from snakeai.game.constants import ACTION_LIST, Coords
+from snakeai.game.model import Snake
+from snakeai.game.zobrist import zobrist_hash
+
+"""Use this module to check that the Zobrist hash of Snake is right, and that its collisions are as rare as expected"""
+
+if __name__ == "__main__":
+    random.seed(0)
+    hashes = {}
+    steps = 0
+    # Enough states (about 300000) for a few collisions on 32 bits
+    for dim in (4, 6, 10, 20, 30):
+        snake = Snake(dim)
+        for game in range(3000):
+            snake.reset()
+            while not snake.isGameOver:
+                # The hash must follow the moves, the growth and the apples placed from outside the game
+                if random.random() < 0.05:
+                    cell = Coords(random.randrange(dim), random.randrange(dim))
+                    if cell not in snake.snake:
+                        snake.apple = cell
+                snake.change_direction(random.choice(ACTION_LIST))
+                snake.step()
+                steps += 1
+                assert snake.zobrist == zobrist_hash(snake.snake, snake.apple, dim), \
+                    f"the incremental hash is wrong after {steps} steps"
+                hashes.setdefault(snake.state.table_string, snake.zobrist)
+    states = len(hashes)
+    collisions = states - len(set(hashes.values()))
+    collisions_32 = states - len({value & 0xFFFFFFFF for value in hashes.values()})
+    # The number of 32 bit collisions is about a Poisson variable with this mean
+    expected_32 = states * (states - 1) / 2 ** 33
+    print(f"{steps} steps, {states} states, {collisions} collisions, {collisions_32} collisions on 32 bits "
+          f"({expected_32:.2f} expected)")
+    assert collisions == 0, "two states have the same 64 bit hash"
+    assert collisions_32 <= expected_32 + 5 * math.sqrt(expected_32) + 3, "too many collisions on 32 bits"
+    print("OK")
@@ -0,0 +1,784 @@
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from snakeai.agents.agent_interface import AbstractAgent
+from snakeai.game.agent_controller import AgentGame
+from snakeai.game.constants import Coords
+
+
+def time_call(func: Callable, runs: int) -> float:
+    """Call `func` `runs` times and return the average duration of a call
+
+    Parameters
+    ----------
+    func: callable
+        The function to time, called without arguments
+    runs: int
+        The number of calls
+
+    Returns
+    -------
+    float
+        The average duration of a call, in seconds
+    """
+    func()  # Warm up (graph tracing, caches...)
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs
+
+
+def benchmark_inference(agent, runs: int = 200, batch_sizes: Sequence[int] = (1, 32, 512, 4096)) -> Dict[str, float]:
+    """Compare the latency of ``model.predict`` with `predict_batch` for a deep agent
+
+    The states are random, so only the timings are meaningful.
+
+    Parameters
+    ----------
+    agent: DQN or DeepQAgent
+        The agent whose model is benchmarked
+    runs: int, default=200
+        The number of calls averaged for each measure
+    batch_sizes: list(int), default=(1, 32, 512, 4096)
+        The batch sizes for which the throughput of `predict_batch` is measured
+
+    Returns
+    -------
+    dict
+        The single state latency (in seconds) of both methods, and the throughput (in states per second)
+        of `predict_batch` for each batch size
+    """
+    shape = agent.model.input_shape[1:]
+    single = np.random.randint(0, 2, (1,) + shape).astype(np.float32)
+    results = {"predict_latency": time_call(lambda: agent.model.predict(single), runs),
+               "predict_batch_latency": time_call(lambda: agent.predict_batch(single), runs)}
+    print(f"model.predict, single state: {results['predict_latency'] * 1000:.3f} ms")
+    print(f"predict_batch, single state: {results['predict_batch_latency'] * 1000:.3f} ms")
+    for size in batch_sizes:
+        states = np.random.randint(0, 2, (size,) + shape).astype(np.float32)
+        throughput = size / time_call(lambda: agent.predict_batch(states), max(1, runs // 10))
+        results[f"throughput_{size}"] = throughput
+        print(f"predict_batch, batch of {size}: {throughput:.0f} states/s")
+    return results
+
+
+def benchmark_training_time(agents: Dict[str, AbstractAgent], size: int, minutes: int = 5,
+                            avg_length: int = 100) -> Dict[str, List[float]]:
+    """Train each agent for the same wall-clock time, and report the average score reached after each minute
+
+    This is used to compare training methods that have a different cost per step (e.g. uniform and
+    prioritized replay).
+
+    Parameters
+    ----------
+    agents: dict(str, AbstractAgent)
+        The agents to compare, by name
+    size: int
+        The size of the board
+    minutes: int, default=5
+        The training time for each agent, in minutes
+    avg_length: int, default=100
+        The number of episodes in the average score
+
+    Returns
+    -------
+    dict(str, list(float))
+        For each agent, the average score of the last `avg_length` episodes at the end of each minute
+    """
+    results = {}
+    for name, agent in agents.items():
+        game = AgentGame(size, show=False)
+        scores, curve = [], []
+        start = time.perf_counter()
+        while len(curve) < minutes:
+            game.play(agent)
+            agent.reset()
+            scores.append(game.model.score)
+            if time.perf_counter() - start >= 60 * (len(curve) + 1):
+                curve.append(sum(scores[-avg_length:]) / len(scores[-avg_length:]))
+                print(f"{name}, minute {len(curve)}: {len(scores)} episodes, average score {curve[-1]:.2f}")
+        results[name] = curve
+    return results
+
+
+def benchmark_learner(make_agent: Callable[[], AbstractAgent], size: int, episodes: int = 200, train_every: int = 1,
+                      publish_interval: int = 10) -> Dict[str, Dict[str, object]]:
+    """Compare training a deep agent synchronously and with an `AsyncLearner`
+
+    Parameters
+    ----------
+    make_agent: callable
+        A function that creates a new, untrained agent (e.g. ``lambda: DQN(20)``)
+    size: int
+        The size of the board
+    episodes: int, default=200
+        The number of training episodes for each mode
+    train_every: int, default=1
+        The number of game steps for each update of the model
+    publish_interval: int, default=10
+        The number of updates after which the asynchronous learner publishes the weights
+
+    Returns
+    -------
+    dict
+        For each mode (``"sync"`` and ``"async"``), the number of game steps per second and the list of scores
+    """
+    from snakeai.agents.learner import AsyncLearner
+
+    results = {}
+    for mode in ("sync", "async"):
+        agent = make_agent()
+        agent.train_every = train_every
+        learner = AsyncLearner(agent, publish_interval, train_every) if mode == "async" else None
+        if learner:
+            learner.start()
+        game = AgentGame(size, show=False)
+        scores, steps = [], 0
+        start = time.perf_counter()
+        for _ in range(episodes):
+            game.play(agent)
+            agent.reset()
+            scores.append(game.model.score)
+            steps += game.steps
+        elapsed = time.perf_counter() - start
+        if learner:
+            learner.stop()
+        results[mode] = {"steps_per_second": steps / elapsed, "scores": scores}
+        print(f"{mode}: {steps / elapsed:.1f} steps/s, average score {sum(scores) / len(scores):.2f}")
+    return results
+
+
+def benchmark_vectorized_training(make_agent: Callable[[], AbstractAgent], size: int = 10, samples: int = 200000,
+                                  game_counts: Sequence[int] = (16, 256, 2048), avg_length: int = 200,
+                                  test_trials: int = 20) -> Dict[str, Dict[str, float]]:
+    """Compare training with the per-step loop and with `VectorGame`, for the same number of transitions
+
+    Parameters
+    ----------
+    make_agent: callable
+        A function that creates a new, untrained agent (e.g. ``lambda: SimpleStateAgent(10)``)
+    size: int, default=10
+        The size of the board
+    samples: int, default=200000
+        The number of transitions used for training in each mode
+    game_counts: list(int), default=(16, 256, 2048)
+        The numbers of parallel games to try
+    avg_length: int, default=200
+        The number of episodes in the average training score
+    test_trials: int, default=20
+        The number of greedy games played after training
+
+    Returns
+    -------
+    dict
+        For each mode (``"loop"`` and ``"vector_<n>"``), the transitions per second, the number of episodes,
+        the average score of the last training episodes and the average greedy score after training
+    """
+    from snakeai.game.vector_game import VectorGame
+    from snakeai.utils.train import test_agent
+
+    results = {}
+    for n_games in (1,) + tuple(game_counts):
+        mode = "loop" if n_games == 1 else f"vector_{n_games}"
+        agent = make_agent()
+        start = time.perf_counter()
+        if n_games == 1:
+            game = AgentGame(size, show=False)
+            scores, steps = [], 0
+            while steps < samples:
+                game.play(agent)
+                agent.reset()
+                scores.append(game.model.score)
+                steps += game.steps
+        else:
+            games = VectorGame(size, n_games)
+            while games.steps < samples:
+                games.play_step(agent)
+            scores, steps = games.scores, games.steps
+        elapsed = time.perf_counter() - start
+        last = scores[-avg_length:] or [0]
+        _, test_average = test_agent(agent, test_trials)
+        results[mode] = {"steps_per_second": steps / elapsed, "episodes": len(scores),
+                         "average_score": sum(last) / len(last), "test_average_score": test_average}
+        print(f"{mode}: {steps / elapsed:.0f} steps/s, {len(scores)} episodes, "
+              f"average score {results[mode]['average_score']:.2f}, greedy score {test_average:.2f}")
+    return results
+
+
+def benchmark_state_store(size: int = 5, episodes: int = 2000, store_path: str = "./models/benchmark",
+                          cache_size: int = 100000) -> Dict[str, Dict[str, float]]:
+    """Compare a `StateAgent` that keeps its Q values in a dict with one that uses a `MMapQStore`
+
+    Parameters
+    ----------
+    size: int, default=5
+        The size of the board
+    episodes: int, default=2000
+        The number of training episodes
+    store_path: str, default="./models/benchmark"
+        The path used for the models (the store and the ``.snkq`` file). The files are removed at the end
+    cache_size: int, default=100000
+        The number of states kept in memory by the store
+
+    Returns
+    -------
+    dict
+        For each table (``"dict"`` and ``"store"``), the training steps per second, the number of states and
+        the seconds needed for saving and loading the model
+    """
+    import os
+    from snakeai.agents.tabular_agent import StateAgent
+
+    results = {}
+    for mode in ("dict", "store"):
+        store = store_path + str(size) + ".qstore" if mode == "store" else None
+        agent = StateAgent(size, store_path=store, cache_size=cache_size)
+        game = AgentGame(size, show=False)
+        steps = 0
+        start = time.perf_counter()
+        for _ in range(episodes):
+            game.play(agent)
+            agent.reset()
+            steps += game.steps
+        elapsed = time.perf_counter() - start
+        save_time = time_call(lambda: agent.save(store_path), 1)
+        load_time = time_call(lambda: StateAgent.load(size, store_path), 1)
+        results[mode] = {"steps_per_second": steps / elapsed, "states": len(agent.state_dict),
+                         "save_seconds": save_time, "load_seconds": load_time}
+        print(f"{mode}: {steps / elapsed:.0f} steps/s, {len(agent.state_dict)} states, "
+              f"save {save_time:.3f} s, load {load_time:.3f} s")
+        if store:
+            agent.state_dict.close()
+        os.remove(store or store_path + str(size) + ".snkq")
+    return results
+
+
+def benchmark_model_io(cls, dim: int, model_path: str, output_path: str = "./models/benchmark",
+                       runs: int = 3) -> Dict[str, float]:
+    """Compare loading a tabular model from the legacy ``.pbz2`` file with saving and loading the ``.snkq`` format
+
+    Parameters
+    ----------
+    cls: Type[AbstractAgent]
+        The class of the agent (`StateAgent`, `SimpleStateAgent` or `SimpleMCAgent`)
+    dim: int
+        The size of the board
+    model_path: str
+        The path of the legacy model (e.g. ``"./models/default/DefaultStateAgent"``)
+    output_path: str, default="./models/benchmark"
+        The path used for the new files. They are removed at the end
+    runs: int, default=3
+        The number of times each operation is timed
+
+    Returns
+    -------
+    dict
+        The seconds needed by each operation and the sizes of the files in bytes
+    """
+    import os
+    from snakeai.agents.model_io import EXTENSION
+
+    agent = cls.load_legacy(dim, model_path)
+    path = output_path + str(dim) + EXTENSION
+    results = {"legacy_load": time_call(lambda: cls.load_legacy(dim, model_path), runs),
+               "legacy_size": os.path.getsize(model_path + str(dim) + ".pbz2")}
+    for name, compress in (("snkq", False), ("snkq_zlib", True)):
+        results[f"{name}_save"] = time_call(lambda: agent.save(output_path, compress=compress), runs)
+        results[f"{name}_load"] = time_call(lambda: cls.load(dim, output_path), runs)
+        results[f"{name}_size"] = os.path.getsize(path)
+        os.remove(path)
+    for key, value in results.items():
+        print(f"{key}: {value:.3f} s" if key.endswith(("load", "save")) else f"{key}: {value} bytes")
+    return results
+
+
+def benchmark_symmetry(make_agent: Callable[[bool], AbstractAgent], size: int, episodes: int = 5000,
+                       target_score: float = 5, avg_length: int = 100) -> Dict[str, Dict[str, float]]:
+    """Compare an agent that learns every orientation of the states with one that learns only the canonical ones
+
+    Parameters
+    ----------
+    make_agent: callable
+        A function that creates a new, untrained agent, given whether it is symmetric
+        (e.g. ``lambda symmetric: StateAgent(6, symmetric=symmetric)``)
+    size: int
+        The size of the board
+    episodes: int, default=5000
+        The number of training episodes
+    target_score: float, default=5
+        The average score that the agents should reach
+    avg_length: int, default=100
+        The number of episodes in the average score
+
+    Returns
+    -------
+    dict
+        For each mode (``"plain"`` and ``"symmetric"``), the number of states in the table, the number of episodes
+        needed to reach `target_score` (or None), the final average score and the training time
+    """
+    results = {}
+    for mode in ("plain", "symmetric"):
+        agent = make_agent(mode == "symmetric")
+        game = AgentGame(size, show=False)
+        scores, reached = [], None
+        start = time.perf_counter()
+        for episode in range(episodes):
+            game.play(agent)
+            agent.reset()
+            scores.append(game.model.score)
+            last = scores[-avg_length:]
+            if reached is None and len(last) == avg_length and sum(last) / avg_length >= target_score:
+                reached = episode + 1
+        last = scores[-avg_length:]
+        results[mode] = {"states": len(agent.state_dict), "episodes_to_target": reached,
+                         "average_score": sum(last) / len(last), "seconds": time.perf_counter() - start}
+        print(f"{mode}: {len(agent.state_dict)} states, target reached after {reached} episodes, "
+              f"average score {results[mode]['average_score']:.2f}, {results[mode]['seconds']:.1f} s")
+    return results
+
+
+def benchmark_zobrist(agent: AbstractAgent, size: int, episodes: int = 1000) -> Dict[str, float]:
+    """Check the collisions of the Zobrist hash on the states visited by an agent, and compare the cost of
+    computing it from scratch with `FrozenState.table_string` (`Snake` updates it incrementally, which is cheaper)
+
+    Besides the 64 bit hash, the collisions of its lower 32 bits are counted: with ``n`` states about
+    ``n**2 / 2**33`` of them are expected, which shows whether the hash is spread as well as a random one.
+
+    Parameters
+    ----------
+    agent: AbstractAgent
+        The agent that plays the games (a trained one gives longer snakes, as in real games). It is not trained
+    size: int
+        The size of the board
+    episodes: int, default=1000
+        The number of games
+
+    Returns
+    -------
+    dict
+        The number of distinct states, the collisions of the 64 and 32 bit hashes, the expected collisions of a
+        random 32 bit hash, and the seconds per state of `table_string` and of `zobrist_hash`
+    """
+    from snakeai.game.zobrist import zobrist_hash
+
+    game = AgentGame(size, show=False)
+    hashes = {}
+    visited = []
+    for _ in range(episodes):
+        state = game.start()
+        while not game.model.isGameOver:
+            visited.append(state)
+            hashes.setdefault(state.table_string, state.zobrist)
+            _, _, state, _ = game.step(agent.execute(state))
+    states = len(hashes)
+    sample = visited[:10000]
+    results = {
+        "states": states,
+        "collisions": states - len(set(hashes.values())),
+        "collisions_32": states - len({value & 0xFFFFFFFF for value in hashes.values()}),
+        "expected_collisions_32": states * (states - 1) / 2 ** 33,
+        "table_string_seconds": time_call(lambda: [state.table_string for state in sample], 3) / len(sample),
+        "zobrist_seconds": time_call(lambda: [zobrist_hash(state.snake, state.apple, size) for state in sample], 3)
+        / len(sample),
+    }
+    print(f"{states} states, {results['collisions']} collisions, {results['collisions_32']} with 32 bits "
+          f"({results['expected_collisions_32']:.1f} expected); table_string "
+          f"{results['table_string_seconds'] * 1e6:.2f} us, zobrist_hash {results['zobrist_seconds'] * 1e6:.2f} us")
+    return results
+
+
+def benchmark_recording(size: int = 20, steps: int = 1000000, apple_interval: int = 50,
+                        path: str = "./models/benchmark") -> Dict[str, Dict[str, float]]:
+    """Compare the ``.pkl`` recordings with the ``.snkr`` format, on a long synthetic game
+
+    Parameters
+    ----------
+    size: int, default=20
+        The size of the board
+    steps: int, default=1000000
+        The number of steps of the game
+    apple_interval: int, default=50
+        The number of steps between two apples
+    path: str, default="./models/benchmark"
+        The path of the recordings, without extension. The files are removed at the end
+
+    Returns
+    -------
+    dict
+        For each format, the seconds needed for writing and reading the game, and the bytes per step
+    """
+    import os
+    import pickle as pkl
+    import random
+    from snakeai.game.constants import ACTION_LIST, Coords
+    from snakeai.utils.recording import RecordingReader, RecordingWriter
+
+    apples = [Coords(random.randrange(size), random.randrange(size)) for _ in range(steps // apple_interval + 1)]
+    recording = [(apples[i // apple_interval], random.choice(ACTION_LIST)) for i in range(steps + 1)]
+
+    def write_pkl():
+        with open(path + ".pkl", "wb") as fout:
+            pkl.dump((size, False, recording), fout)
+
+    def read_pkl():
+        with open(path + ".pkl", "rb") as fin:
+            return pkl.load(fin)
+
+    def write_snkr():
+        writer = RecordingWriter(path + ".snkr", size)
+        writer.start(*recording[0])
+        for apple, direction in recording[1:]:
+            writer.step(apple, direction)
+        writer.close(len(apples), True)
+
+    results = {}
+    for name, write, read in (("pkl", write_pkl, read_pkl),
+                              ("snkr", write_snkr, lambda: RecordingReader(path + ".snkr"))):
+        results[name] = {"write_seconds": time_call(write, 1), "read_seconds": time_call(read, 1),
+                         "bytes_per_step": os.path.getsize(path + "." + name) / steps}
+        os.remove(path + "." + name)
+        print(f"{name}: write {results[name]['write_seconds']:.2f} s, read {results[name]['read_seconds']:.3f} s, "
+              f"{results[name]['bytes_per_step']:.2f} bytes per step")
+    return results
+
+
+def benchmark_seek(size: int = 20, steps: int = 100000, seeks: int = 50, keyframe_interval: int = 1000,
+                   path: str = "./models/benchmark.snkr") -> Dict[str, float]:
+    """Measure the time needed by `Player.seek` to jump to random steps of a long game, with and without keyframes
+
+    The game is played by a snake that follows a cycle through the whole board, so it never dies.
+
+    Parameters
+    ----------
+    size: int, default=20
+        The size of the board. It must be even
+    steps: int, default=100000
+        The maximum number of steps of the game
+    seeks: int, default=50
+        The number of random steps to jump to
+    keyframe_interval: int, default=1000
+        The number of steps between two keyframes
+    path: str, default="./models/benchmark.snkr"
+        The path of the recording. The file is removed at the end
+
+    Returns
+    -------
+    dict
+        The average seconds per seek with keyframes and without them (with a new player each time), and the
+        steps per second of `replay_game`
+    """
+    import os
+    import random
+    from snakeai.game.constants import GUIMode
+    from snakeai.utils.recorder import Player
+    from snakeai.utils.recording import RecordingReader, replay_game, write_recording
+
+    recording = []
+    for model in _cycle_steps(size, steps):
+        recording.append((model.apple, model.direction))
+    write_recording(path, size, recording, model.score, model.isGameOver, keyframe_interval=keyframe_interval)
+    reader = RecordingReader(path)
+    targets = [random.randrange(len(recording)) for _ in range(seeks)]
+    player = Player(reader, mode=GUIMode.NO_SHOW)
+    player.start()
+
+    def seek_keyframes():
+        for target in targets:
+            player.seek(target)
+
+    def seek_from_start():
+        for target in targets:
+            fresh = Player(reader, mode=GUIMode.NO_SHOW)
+            fresh.recording = recording
+            fresh.frame_time = 0
+            fresh.start()
+            fresh.seek(target)
+
+    results = {"keyframes_seconds": time_call(seek_keyframes, 1) / seeks,
+               "from_start_seconds": time_call(seek_from_start, 1) / seeks,
+               "replay_steps_per_second": len(recording) / time_call(lambda: replay_game(recording, size), 1)}
+    os.remove(path)
+    print(f"{len(recording) - 1} steps, score {model.score}: seek {results['keyframes_seconds'] * 1000:.2f} ms with "
+          f"keyframes, {results['from_start_seconds'] * 1000:.1f} ms from the start; headless replay "
+          f"{results['replay_steps_per_second']:.0f} steps/s")
+    return results
+
+
+def benchmark_dataset(agent: AbstractAgent, size: int = 10, episodes: int = 500,
+                      encodings: Sequence[str] = ("simple", "board", "snake"), chunk_size: int = 65536,
+                      reads: int = 10000, path: str = "./models/benchmark_dataset") -> Dict[str, float]:
+    """Measure the cost of logging the transitions of the games with a `DatasetWriter`
+
+    The agent plays the same games (with the same seeds) with and without the writer, then random transitions are
+    read back from the dataset.
+
+    Parameters
+    ----------
+    agent: AbstractAgent
+        The agent that plays the games. It should not learn, otherwise the two runs are different
+    size: int, default=10
+        The size of the board
+    episodes: int, default=500
+        The number of games of each run
+    encodings: list(str), default=("simple", "board", "snake")
+        The encodings of the states
+    chunk_size: int, default=65536
+        The number of transitions in each chunk
+    reads: int, default=10000
+        The number of random transitions read
+    path: str, default="./models/benchmark_dataset"
+        The directory of the dataset. It is removed at the end
+
+    Returns
+    -------
+    dict
+        The steps per second without and with the writer, the seconds spent in `DatasetWriter.close`, the bytes per
+        transition and the random reads per second
+    """
+    import os
+    import random
+    import shutil
+    from snakeai.utils.dataset import DatasetWriter, TransitionDataset
+
+    def play(hooks):
+        random.seed(0)
+        steps = 0
+        start = time.perf_counter()
+        for _ in range(episodes):
+            game = AgentGame(size, show=False, max_steps_per_apple=2 * size * size, hooks=hooks)
+            game.play(agent)
+            steps += game.steps
+        return steps, time.perf_counter() - start
+
+    steps, plain = play([])
+    writer = DatasetWriter(path, size, encodings, chunk_size)
+    _, logged = play([writer])
+    start = time.perf_counter()
+    writer.close()
+    closing = time.perf_counter() - start
+    dataset = TransitionDataset(path)
+    rows = [random.randrange(len(dataset)) for _ in range(reads)]
+    reading = time_call(lambda: [dataset.rows(row, row + 1) for row in rows], 1)
+    size_bytes = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    results = {"plain_steps_per_second": steps / plain, "logged_steps_per_second": steps / logged,
+               "close_seconds": closing, "bytes_per_transition": size_bytes / len(dataset),
+               "reads_per_second": reads / reading}
+    shutil.rmtree(path)
+    print(f"{steps} steps: {results['plain_steps_per_second']:.0f} steps/s without logging, "
+          f"{results['logged_steps_per_second']:.0f} with logging (+{closing:.2f} s to close); "
+          f"{results['bytes_per_transition']:.1f} bytes per transition, "
+          f"{results['reads_per_second']:.0f} random reads/s")
+    return results
+
+
+def _cycle_steps(size: int, steps: int) -> Iterator['Snake']:
+    # The model at the start and after each step of a game in which the snake follows a cycle through the whole
+    # (even sized) board, so that it never dies. The same model is yielded each time
+    from snakeai.game.constants import Actions
+    from snakeai.game.model import Snake
+
+    def cycle(x: int, y: int) -> Actions:
+        # Down the even columns, up the odd ones, and back to the first column along the top row
+        if y == 0:
+            return Actions.LEFT if x > 0 else Actions.DOWN
+        if x % 2 == 0:
+            return Actions.DOWN if y < size - 1 else Actions.RIGHT
+        if x == size - 1:
+            return Actions.UP
+        return Actions.UP if y > 1 else Actions.RIGHT
+
+    model = Snake(size)
+    # The snake cannot turn back, so it must start in the direction of the cycle
+    model.direction = cycle(model.snake[-1].x, model.snake[-1].y)
+    yield model
+    for _ in range(steps):
+        if model.isGameOver:
+            return
+        head = model.snake[-1]
+        model.change_direction(cycle(head.x, head.y))
+        model.step()
+        yield model
+
+
+def _cycle_game(size: int, steps: int) -> List[Tuple[List[Coords], Coords, int, int, bool]]:
+    # The arguments of updateUI after each step of the game of `_cycle_steps`
+    models = _cycle_steps(size, steps)
+    next(models)
+    return [(model.snake, model.apple, model.score, model.highScore, model.isGameOver) for model in models]
+
+
+def benchmark_render(sizes: Sequence[int] = (10, 20, 40), frames: int = 2000,
+                     headless: bool = True) -> Dict[int, Dict[str, float]]:
+    """Compare the time needed by `GameGUI` to draw a frame from scratch and to draw only what has changed
+
+    The frames come from a game in which the snake follows a cycle through the whole board, so it never dies and
+    keeps growing. The same frames are drawn in both modes.
+
+    Parameters
+    ----------
+    sizes: list(int), default=(10, 20, 40)
+        The sizes of the board. They must be even
+    frames: int, default=2000
+        The number of frames drawn for each size
+    headless: bool, default=True
+        Whether the window is created with the ``dummy`` video driver of SDL, so that no screen is needed. Then
+        the time needed to show the window on the screen is not measured
+
+    Returns
+    -------
+    dict
+        For each size, the milliseconds per frame drawn from scratch and incrementally, and the final length of
+        the snake
+    """
+    import os
+    from snakeai.game.view import GameGUI
+
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    results = {}
+    for size in sizes:
+        states = _cycle_game(size, frames)
+
+        def render(view: GameGUI) -> float:
+            view.init_screen(size, *states[0][:4])
+            start = time.perf_counter()
+            for state in states:
+                view.updateUI(*state)
+            elapsed = time.perf_counter() - start
+            view.quit()
+            return elapsed * 1000 / len(states)
+
+        results[size] = {"full_ms": render(GameGUI(incremental=False)), "incremental_ms": render(GameGUI()),
+                         "length": len(states[-1][0])}
+        print(f"{size}x{size}, snake of length {results[size]['length']}: {results[size]['full_ms']:.3f} ms per "
+              f"frame from scratch, {results[size]['incremental_ms']:.3f} ms incrementally")
+    return results
+
+
+def benchmark_cli_render(sizes: Sequence[int] = (10, 20, 40, 80), frames: int = 2000) -> Dict[int, Dict[str, float]]:
+    """Measure the time and the number of characters needed by `CliGUI` to write a frame, with and without `diff`
+
+    The frames are the same as in `benchmark_render`, and they are written to memory instead of the terminal.
+
+    Parameters
+    ----------
+    sizes: list(int), default=(10, 20, 40, 80)
+        The sizes of the board. They must be even
+    frames: int, default=2000
+        The number of frames written for each size
+
+    Returns
+    -------
+    dict
+        For each size, the milliseconds and the characters per frame of the whole frames and of the differences
+    """
+    import io
+    from snakeai.game.view import CliGUI
+
+    results = {}
+    for size in sizes:
+        states = _cycle_game(size, frames)
+        results[size] = {}
+        for name, diff in (("full", False), ("diff", True)):
+            view = CliGUI(diff=diff, stream=io.StringIO())
+            view.init_screen(size, *states[0][:4])
+            view.stream = io.StringIO()
+            start = time.perf_counter()
+            for state in states:
+                view.updateUI(*state)
+            results[size][name + "_ms"] = (time.perf_counter() - start) * 1000 / len(states)
+            results[size][name + "_chars"] = len(view.stream.getvalue()) / len(states)
+        print(f"{size}x{size}: {results[size]['full_ms']:.3f} ms and {results[size]['full_chars']:.0f} characters per "
+              f"frame, {results[size]['diff_ms']:.3f} ms and {results[size]['diff_chars']:.0f} with diff")
+    return results
+
+
+def time_startup(code: str, runs: int = 3) -> float:
+    """Measure the time needed by a new Python interpreter to run `code`
+
+    Parameters
+    ----------
+    code: str
+        The code to run
+    runs: int, default=3
+        The number of runs. The fastest one is returned
+
+    Returns
+    -------
+    float
+        The duration of the fastest run, in seconds
+    """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def benchmark_numpy_policy(model_path: str, npz_path: str, size: int = 20, runs: int = 1000) -> Dict[str, float]:
+    """Compare startup time and latency per move of a Keras `DQN` and of the same model exported to NumPy
+
+    Parameters
+    ----------
+    model_path: str
+        The path of the Keras model
+    npz_path: str
+        The path of the model exported with `DQN.export`
+    size: int, default=20
+        The size of the board
+    runs: int, default=1000
+        The number of moves for measuring the latency
+
+    Returns
+    -------
+    dict
+        The startup time and the latency per move of both agents, in seconds
+    """
+    from snakeai.agents.numpy_policy import NumpyAgent
+    from snakeai.agents.simple_deep_agent import DQN
+
+    results = {
+        "keras_startup": time_startup(f"from snakeai.agents.simple_deep_agent import DQN; "
+                                      f"DQN.load({size}, {model_path!r})"),
+        "numpy_startup": time_startup(f"from snakeai.agents.numpy_policy import NumpyAgent; "
+                                      f"NumpyAgent.load({size}, {npz_path!r})")}
+    state = AgentGame(size, show=False).start()
+    keras_agent = DQN.load(size, model_path)
+    keras_agent.epsilon = 0
+    numpy_agent = NumpyAgent.load(size, npz_path)
+    results["keras_move"] = time_call(lambda: keras_agent.execute(state), runs)
+    results["numpy_move"] = time_call(lambda: numpy_agent.execute(state), runs)
+    for name in ("keras", "numpy"):
+        print(f"{name}: startup {results[name + '_startup']:.2f} s, {results[name + '_move'] * 1e6:.1f} us per move")
+    return results
+
+
+def benchmark_startup(runs: int = 3) -> Dict[str, float]:
+    """Measure the startup time of headless scripts, from the start of the interpreter to the first game played
+
+    Parameters
+    ----------
+    runs: int, default=3
+        The number of runs for each script. The fastest one is kept
+
+    Returns
+    -------
+    dict
+        The startup time of each script, in seconds
+    """
+    scripts = {
+        "tabular": "from snakeai.agents import get_agent_class; from snakeai.game.agent_controller import AgentGame; "
+                   "AgentGame(10, show=False).play(get_agent_class('SimpleStateAgent')(10))",
+        "training": "from snakeai.agents import get_agent_class; from snakeai.utils.train import general_train; "
+                    "general_train(get_agent_class('SimpleStateAgent')(10), 1, 10)",
+    }
+    results = {}
+    for name, code in scripts.items():
+        results[name] = time_startup(code, runs)
+        print(f"{name}: {results[name]:.3f} s")
+    return results
@@ -0,0 +1,404 @@
+"""Datasets of transitions, for training and evaluating agents without playing the games again
+
+A dataset is a directory with a ``meta.json`` file and one sub-directory for each chunk of transitions. Each chunk
+stores every column in its own ``.npy`` file, so the columns can be opened with a memory map and read separately.
+The chunks are only appended: ``meta.json`` is replaced, atomically, after each new chunk is complete.
+
+The columns of a chunk are ``action`` (position in `ACTION_LIST`), ``reward``, ``done`` (whether the state after
+the transition is terminal), ``truncated`` (whether the episode was stopped by a step limit there: the state is not
+terminal) and ``episode`` (the index of the episode of each transition), and the states before and after each
+transition (prefix ``state_`` and ``next_``) in each of the encodings of the dataset:
+
+* ``simple``: the 12 features of `FrozenState.simple_state`, column ``<prefix>_simple`` with shape (n, 12)
+* ``board``: the board, as in `encode_boards`, column ``<prefix>_board`` with shape (n, dim, dim)
+* ``snake``: the exact state, in the columns ``<prefix>_snake`` (the cells ``y * dim + x`` of the bodies, tail
+  first, one body after the other), ``<prefix>_length``, ``<prefix>_apple`` and ``<prefix>_direction``
+
+The file ``episodes.npy`` of each chunk lists the episodes that end in the chunk, with their first transition,
+length, total reward, score and whether they were truncated.
+"""
+import json
+import os
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from snakeai.game.constants import Actions, ACTION_LIST, Coords, Rewards
+from snakeai.game.memento import FrozenState, encode_boards, encode_simple_states
+
+VERSION = 1
+EPISODE_DTYPE = np.dtype([("start", "<i8"), ("length", "<i8"), ("total_reward", "<f8"), ("score", "<i4"),
+                          ("truncated", "?")])
+_DIRECTIONS = {action: i for i, action in enumerate(ACTION_LIST)}
+
+
+def _encode_simple(states: Sequence[FrozenState], prefix: str) -> Dict[str, np.ndarray]:
+    return {prefix + "_simple": encode_simple_states(states)}
+
+
+def _encode_board(states: Sequence[FrozenState], prefix: str) -> Dict[str, np.ndarray]:
+    return {prefix + "_board": encode_boards(states)}
+
+
+def _encode_snake(states: Sequence[FrozenState], prefix: str) -> Dict[str, np.ndarray]:
+    dim = states[0].dim
+    return {prefix + "_snake": np.array([c.y * dim + c.x for state in states for c in state.snake], dtype=np.uint16),
+            prefix + "_length": np.array([len(state.snake) for state in states], dtype=np.uint16),
+            prefix + "_apple": np.array([state.apple.y * dim + state.apple.x for state in states], dtype=np.uint16),
+            prefix + "_direction": np.array([_DIRECTIONS[state.direction] for state in states], dtype=np.uint8)}
+
+
+# The functions that encode the states, by name
+ENCODERS: Dict[str, Callable[[Sequence[FrozenState], str], Dict[str, np.ndarray]]] = {
+    "simple": _encode_simple,
+    "board": _encode_board,
+    "snake": _encode_snake,
+}
+# The columns of each encoding, without the prefix
+COLUMNS = {"simple": ["simple"], "board": ["board"], "snake": ["snake", "length", "apple", "direction"]}
+
+
+def decode_snake_states(chunk: Dict[str, np.ndarray], dim: int, prefix: str = "state") -> List[FrozenState]:
+    """Rebuild the states of a chunk saved with the ``snake`` encoding
+
+    Parameters
+    ----------
+    chunk : dict(str, np.ndarray)
+        The columns of the chunk (see `TransitionDataset.chunks`)
+    dim : int
+        The size of the board
+    prefix : str, default="state"
+        ``"state"`` for the states before the transitions, ``"next"`` for the ones after
+
+    Returns
+    -------
+    list(FrozenState)
+        The states
+    """
+    cells = chunk[prefix + "_snake"].tolist()
+    offsets = _offsets(chunk[prefix + "_length"]).tolist()
+    apples = chunk[prefix + "_apple"].tolist()
+    directions = chunk[prefix + "_direction"].tolist()
+    return [FrozenState([Coords(cell % dim, cell // dim) for cell in cells[offsets[i]:offsets[i + 1]]],
+                        Coords(apples[i] % dim, apples[i] // dim), ACTION_LIST[directions[i]], dim)
+            for i in range(len(apples))]
+
+
+def _offsets(lengths: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+
+
+def _take(columns: Dict[str, np.ndarray], rows: np.ndarray, prefix: str) -> Dict[str, np.ndarray]:
+    # Select some rows of encoded states. The cells of the snakes need the offsets of each body
+    result = {name: values[rows] for name, values in columns.items() if name != prefix + "_snake"}
+    if prefix + "_snake" in columns:
+        offsets = _offsets(columns[prefix + "_length"])
+        result[prefix + "_snake"] = np.concatenate([columns[prefix + "_snake"][offsets[row]:offsets[row + 1]]
+                                                    for row in rows.tolist()])
+    return result
+
+
+class DatasetWriter:
+    """Append the transitions of the games to a dataset
+
+    The writer is called with each transition, like `AbstractAgent.fit`, and can be given to `AgentGame` as a
+    hook. The transitions are only collected in memory: when a chunk is full, it is encoded and written by
+    a background thread, so the game is not slowed down by the disk. The transitions must come one game at a time.
+
+    The writer can be used as a context manager, which calls `close` at the end.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the dataset. If it already contains a dataset, the new transitions are appended to it
+    dim : int
+        The size of the board
+    encodings : list(str), default=("simple",)
+        The encodings of the states (see `ENCODERS`)
+    chunk_size : int, default=65536
+        The number of transitions in each chunk
+
+    Attributes
+    ----------
+    rows : int
+        The number of transitions added, including the ones already in the dataset
+    episodes : int
+        The number of complete episodes
+
+    Raises
+    ------
+    ValueError
+        If an encoding is unknown, or the existing dataset has a different size or different encodings
+    """
+    def __init__(self, path: str, dim: int, encodings: Sequence[str] = ("simple",), chunk_size: int = 65536):
+        for encoding in encodings:
+            if encoding not in ENCODERS:
+                raise ValueError(f"Unknown encoding {encoding}. The available ones are {list(ENCODERS)}")
+        self.path = path
+        self.dim = dim
+        self.encodings = list(encodings)
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        self._meta = {"version": VERSION, "dim": dim, "encodings": self.encodings, "chunks": []}
+        if os.path.exists(os.path.join(path, "meta.json")):
+            with open(os.path.join(path, "meta.json")) as fin:
+                self._meta = json.load(fin)
+            if self._meta["dim"] != dim or self._meta["encodings"] != self.encodings:
+                raise ValueError(f"The dataset in {path} has size {self._meta['dim']} and encodings "
+                                 f"{self._meta['encodings']}")
+        self.rows = sum(chunk["rows"] for chunk in self._meta["chunks"])
+        self.episodes = sum(chunk["episodes"] for chunk in self._meta["chunks"])
+        self._transitions = []
+        self._episode_start = self.rows
+        self._episode_reward = 0.0
+        self._episode_score = 0
+        self._ended = []
+        self._queue = queue.Queue(maxsize=2)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'DatasetWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __call__(self, old_state: FrozenState, action: Actions, rew: int, state: FrozenState, done: bool):
+        """Add a transition
+
+        Parameters
+        ----------
+        old_state : FrozenState
+            The state before the action
+        action : Actions
+            The action
+        rew : int
+            The reward
+        state : FrozenState
+            The state after the action
+        done : bool
+            Whether the new state is terminal. An episode also ends when it is truncated (`Rewards.TRUNCATED`)
+        """
+        self._transitions.append((old_state, action, rew, state, done))
+        self.rows += 1
+        self._episode_reward += rew
+        self._episode_score += rew == Rewards.GOT_APPLE.value
+        if done or rew == Rewards.TRUNCATED.value:
+            self._ended.append((self._episode_start, self.rows - self._episode_start, self._episode_reward,
+                                self._episode_score, rew == Rewards.TRUNCATED.value))
+            self.episodes += 1
+            self._episode_start = self.rows
+            self._episode_reward = 0.0
+            self._episode_score = 0
+        if len(self._transitions) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Send the collected transitions to the background thread, as a new chunk"""
+        if self._error:
+            raise self._error
+        if self._transitions:
+            self._queue.put((self._transitions, self._ended, self.episodes - len(self._ended)))
+            self._transitions, self._ended = [], []
+
+    def close(self):
+        """Write the last chunk and wait until all the chunks are on disk"""
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write_chunk(*item)
+            except Exception as error:  # Raised again in the thread of the game
+                self._error = error
+
+    def _write_chunk(self, transitions: List[Tuple], ended: List[Tuple], first_episode: int):
+        old_states, actions, rewards, states, dones = zip(*transitions)
+        start = sum(chunk["rows"] for chunk in self._meta["chunks"])
+        columns = {"action": np.array([_DIRECTIONS[action] for action in actions], dtype=np.uint8),
+                   "reward": np.array(rewards, dtype=np.float32),
+                   "done": np.array(dones, dtype=bool),
+                   "truncated": np.array(rewards, dtype=np.float32) == Rewards.TRUNCATED.value,
+                   "episodes": np.array(ended, dtype=EPISODE_DTYPE)}
+        # Each transition belongs to the first episode that has not ended (or been truncated) before it
+        ends = columns["done"] | columns["truncated"]
+        columns["episode"] = first_episode + np.concatenate(([0], np.cumsum(ends[:-1], dtype=np.int64)))
+        # The state before a transition is the state after the previous one, unless an episode starts there:
+        # only these states are encoded again
+        starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+        source = np.arange(-1, len(transitions) - 1)
+        source[starts] = len(transitions) + np.arange(len(starts))
+        for encoding in self.encodings:
+            encoded = ENCODERS[encoding](list(states) + [old_states[i] for i in starts], "next")
+            columns.update({"state" + name[len("next"):]: values for name, values in
+                            _take(encoded, source, "next").items()})
+            columns.update(_take(encoded, np.arange(len(transitions)), "next"))
+        name = f"chunk_{len(self._meta['chunks']):06d}"
+        os.makedirs(os.path.join(self.path, name), exist_ok=True)
+        for column, values in columns.items():
+            np.save(os.path.join(self.path, name, column + ".npy"), values)
+        self._meta["chunks"].append({"name": name, "start": start, "rows": len(transitions),
+                                     "episodes": len(ended)})
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as fout:
+            json.dump(self._meta, fout)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+
+class TransitionDataset:
+    """Read a dataset written by `DatasetWriter`
+
+    The columns are opened with memory maps only when they are used.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the dataset
+
+    Attributes
+    ----------
+    dim : int
+        The size of the board
+    encodings : list(str)
+        The encodings of the states
+    episodes : np.ndarray
+        The complete episodes, with the fields ``start`` (global index of the first transition), ``length``,
+        ``total_reward``, ``score`` and ``truncated``
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as fin:
+            meta = json.load(fin)
+        if meta["version"] > VERSION:
+            raise ValueError(f"{path} has version {meta['version']}, but the maximum supported version is {VERSION}")
+        self.dim = meta["dim"]
+        self.encodings = meta["encodings"]
+        self._chunks = meta["chunks"]
+        self._starts = np.array([chunk["start"] for chunk in self._chunks], dtype=np.int64)
+        self._cache = {}
+        episodes = [self._column(i, "episodes") for i in range(len(self._chunks))]
+        self.episodes = np.concatenate(episodes) if episodes else np.zeros(0, dtype=EPISODE_DTYPE)
+
+    def __len__(self) -> int:
+        return sum(chunk["rows"] for chunk in self._chunks)
+
+    @property
+    def n_chunks(self) -> int:
+        """int : The number of chunks"""
+        return len(self._chunks)
+
+    def _column(self, chunk: int, column: str) -> np.ndarray:
+        key = (chunk, column)
+        if key not in self._cache:
+            self._cache[key] = np.load(os.path.join(self.path, self._chunks[chunk]["name"], column + ".npy"),
+                                       mmap_mode="r")
+        return self._cache[key]
+
+    def _snake_offsets(self, chunk: int, prefix: str) -> np.ndarray:
+        key = (chunk, prefix + "_offsets")
+        if key not in self._cache:
+            self._cache[key] = _offsets(self._column(chunk, prefix + "_length"))
+        return self._cache[key]
+
+    def _columns(self, columns: Optional[Sequence[str]]) -> List[str]:
+        if columns is not None:
+            return list(columns)
+        return ["action", "reward", "done", "truncated", "episode"] + [
+            f"{prefix}_{column}" for prefix in ("state", "next")
+            for encoding in self.encodings for column in COLUMNS[encoding]]
+
+    def chunk(self, index: int, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Read the columns of a chunk
+
+        Parameters
+        ----------
+        index : int
+            The index of the chunk
+        columns : list(str), optional
+            The columns to read. If not given, all of them
+
+        Returns
+        -------
+        dict(str, np.ndarray)
+            The columns, as read-only memory maps
+        """
+        return {column: self._column(index, column) for column in self._columns(columns)}
+
+    def chunks(self, columns: Optional[Sequence[str]] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Iterate over the chunks, in order
+
+        Parameters
+        ----------
+        columns : list(str), optional
+            The columns to read. If not given, all of them
+
+        Yields
+        ------
+        dict(str, np.ndarray)
+            The columns of each chunk
+        """
+        for index in range(len(self._chunks)):
+            yield self.chunk(index, columns)
+
+    def rows(self, start: int, stop: int, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Read a range of transitions, which can span many chunks
+
+        Parameters
+        ----------
+        start : int
+            The index of the first transition
+        stop : int
+            The index after the last transition
+        columns : list(str), optional
+            The columns to read. If not given, all of them
+
+        Returns
+        -------
+        dict(str, np.ndarray)
+            The columns, for the transitions in the range
+        """
+        parts = {column: [] for column in self._columns(columns)}
+        first = max(0, int(np.searchsorted(self._starts, start, side="right")) - 1)
+        for index in range(first, len(self._chunks)):
+            chunk_start = self._chunks[index]["start"]
+            if chunk_start >= stop:
+                break
+            low, high = max(start, chunk_start) - chunk_start, min(stop, chunk_start + self._chunks[index]["rows"])
+            high -= chunk_start
+            for column in parts:
+                values = self._column(index, column)
+                if column.endswith("_snake"):
+                    offsets = self._snake_offsets(index, column[:-len("_snake")])
+                    values = values[offsets[low]:offsets[high]]
+                else:
+                    values = values[low:high]
+                parts[column].append(np.asarray(values))
+        return {column: np.concatenate(values) for column, values in parts.items()}
+
+    def episode(self, index: int, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Read the transitions of a complete episode
+
+        Parameters
+        ----------
+        index : int
+            The index of the episode
+        columns : list(str), optional
+            The columns to read. If not given, all of them
+
+        Returns
+        -------
+        dict(str, np.ndarray)
+            The columns, for the transitions of the episode
+        """
+        start, length = int(self.episodes[index]["start"]), int(self.episodes[index]["length"])
+        return self.rows(start, start + length, columns)
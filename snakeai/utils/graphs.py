@@ -1,5 +1,4 @@
 from typing import List
-import matplotlib.pyplot as plt
 import pickle as pkl
 import numpy as np
 
@@ -14,6 +13,8 @@ def show_graph(file_names: List[str], avg_length: int):
     avg_length: int
         the size of the sliding window for the average
     """
+    import matplotlib.pyplot as plt
+
     scores_tmp = []
     for file in file_names:
         with open(file, "rb") as fin:
@@ -0,0 +1,130 @@
+"""Train agents from the transitions saved in a dataset (see `snakeai.utils.dataset`), without playing any game
+
+The dataset is read one chunk at a time, and each chunk is split into large batches:
+
+* `SimpleStateAgent` is updated with `SimpleStateAgent.fit_batch`, which computes all the targets of a batch from
+  the Q values before it: over many epochs, this is a fitted Q iteration on the table
+* `StateAgent` is updated with `StateAgent.fit_keys`. The keys of the states are built directly from the ``snake``
+  columns, without creating the states (except for symmetric agents, which need the canonical orientation)
+* `DQN` is trained with `DQN.train_batch`, on shuffled batches passed to Keras in a single call
+"""
+import logging
+import time
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+from tqdm import tqdm
+
+from snakeai.agents.agent_interface import AbstractAgent
+from snakeai.game.constants import ACTION_LIST
+from snakeai.game.symmetry import ACTION_MAP
+from snakeai.utils.dataset import COLUMNS, TransitionDataset, decode_snake_states
+
+
+def _batches(length: int, batch_size: int, shuffle: bool) -> Iterator[np.ndarray]:
+    rows = np.random.permutation(length) if shuffle else np.arange(length)
+    for start in range(0, length, batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _table_strings(chunk: Dict[str, np.ndarray], dim: int, prefix: str) -> List[str]:
+    # The same strings as FrozenState.table_string, from the cells of the snakes and of the apples
+    pieces = [f"Coords(x={cell % dim}, y={cell // dim})" for cell in range(dim * dim)]
+    cells = chunk[prefix + "_snake"].tolist()
+    ends = np.cumsum(chunk[prefix + "_length"], dtype=np.int64).tolist()
+    return ["".join([pieces[cell] for cell in cells[start:end]]) + pieces[apple]
+            for start, end, apple in zip([0] + ends[:-1], ends, chunk[prefix + "_apple"].tolist())]
+
+
+def _train_simple_state_agent(agent, chunk: Dict[str, np.ndarray], dim: int, batch_size: int, shuffle: bool):
+    actions = chunk["action"].astype(np.int64)
+    for rows in _batches(len(actions), batch_size, shuffle):
+        agent.fit_batch((chunk["state_simple"][rows], actions[rows], chunk["reward"][rows],
+                         chunk["next_simple"][rows], chunk["done"][rows]))
+
+
+def _train_state_agent(agent, chunk: Dict[str, np.ndarray], dim: int, batch_size: int, shuffle: bool):
+    actions = chunk["action"].astype(np.int64)
+    if agent.symmetric:
+        old_keys, transforms = zip(*[agent.key(state) for state in decode_snake_states(chunk, dim, "state")])
+        keys = [agent.key(state)[0] for state in decode_snake_states(chunk, dim, "next")]
+        actions = ACTION_MAP[np.array(transforms, dtype=np.int64), actions]
+    else:
+        old_keys, keys = _table_strings(chunk, dim, "state"), _table_strings(chunk, dim, "next")
+    for rows in _batches(len(actions), batch_size, shuffle):
+        agent.fit_keys([old_keys[row] for row in rows.tolist()], actions[rows], chunk["reward"][rows],
+                       [keys[row] for row in rows.tolist()], chunk["done"][rows])
+
+
+def _train_dqn(agent, chunk: Dict[str, np.ndarray], dim: int, batch_size: int, shuffle: bool):
+    # The dataset stores the positions in ACTION_LIST, the model has its own order
+    outputs = np.array([agent.ACTIONS.index(action) for action in ACTION_LIST])[chunk["action"]]
+    for rows in _batches(len(outputs), batch_size, shuffle):
+        agent.train_batch(chunk["state_simple"][rows], outputs[rows], chunk["reward"][rows],
+                          chunk["next_simple"][rows], chunk["done"][rows], minibatch_size=len(rows))
+
+
+# For each agent class, the function that trains it with a chunk, and the encoding of the states that it needs
+TRAINERS: Dict[str, Tuple[Callable, str]] = {
+    "SimpleStateAgent": (_train_simple_state_agent, "simple"),
+    "StateAgent": (_train_state_agent, "snake"),
+    "DQN": (_train_dqn, "simple"),
+}
+
+
+def offline_train(agent: AbstractAgent, dataset: Union[str, TransitionDataset], epochs: int = 1,
+                  batch_size: int = 4096, shuffle: bool = True) -> AbstractAgent:
+    """Train an agent with all the transitions of a dataset
+
+    The transitions can come from any agent (even a random one): Q-learning learns the values of the greedy
+    policy anyway. The quality of the agent depends on how many of the states that it visits are in the dataset.
+
+    Parameters
+    ----------
+    agent: AbstractAgent
+        The agent to train: a `SimpleStateAgent`, `StateAgent` or `DQN` (or a subclass)
+    dataset: str or TransitionDataset
+        The dataset, or its directory. The states must be saved with the encoding used by the agent
+        (``simple`` or, for `StateAgent`, ``snake``)
+    epochs: int, default=1
+        The number of times the whole dataset is used
+    batch_size: int, default=4096
+        The number of transitions of each update
+    shuffle: bool, default=True
+        Whether the transitions of each chunk are shuffled before being split in batches
+
+    Returns
+    -------
+    AbstractAgent
+        The trained agent
+
+    Raises
+    ------
+    TypeError
+        If the agent cannot be trained offline
+    ValueError
+        If the dataset has a different board size, or does not contain the encoding needed by the agent
+    """
+    if isinstance(dataset, str):
+        dataset = TransitionDataset(dataset)
+    name = next((cls.__name__ for cls in type(agent).__mro__ if cls.__name__ in TRAINERS), None)
+    if name is None:
+        raise TypeError(f"{type(agent).__name__} cannot be trained offline. The supported agents are "
+                        f"{list(TRAINERS)}")
+    trainer, encoding = TRAINERS[name]
+    if dataset.dim != agent.dim:
+        raise ValueError(f"The dataset has size {dataset.dim}, but the agent has size {agent.dim}")
+    if encoding not in dataset.encodings:
+        raise ValueError(f"{name} needs the encoding {encoding}, but the dataset has {dataset.encodings}")
+    columns = ["action", "reward", "done"] + [f"{prefix}_{column}" for prefix in ("state", "next")
+                                              for column in COLUMNS[encoding]]
+    start = time.time()
+    for epoch in range(epochs):
+        for chunk in tqdm(dataset.chunks(columns), total=dataset.n_chunks, desc=f"Epoch {epoch + 1}/{epochs}"):
+            # Read the whole chunk once: the batches access it in random order
+            trainer(agent, {column: np.asarray(values) for column, values in chunk.items()}, dataset.dim,
+                    batch_size, shuffle)
+    elapsed = time.time() - start
+    logging.info(f"Trained on {epochs * len(dataset)} transitions in {elapsed:.2f} s "
+                 f"({epochs * len(dataset) / elapsed:.0f} transitions/s)")
+    return agent
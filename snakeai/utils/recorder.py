@@ -1,54 +1,90 @@
 import time
-from typing import Union
+from typing import Optional, Sequence, Tuple, Union
 import pickle as pkl
 
+from snakeai.agents.agent_interface import AbstractAgent
 from snakeai.game.agent_controller import AgentGame
-from snakeai.game.constants import Actions, GUIMode
+from snakeai.game.constants import Actions, Coords, GUIMode
 from snakeai.game.user_controller import UserGame
+from snakeai.utils.recording import (EXTENSION, KEYFRAME_INTERVAL, RecordingReader, RecordingWriter, Snapshot,
+                                     replay_steps, write_recording)
 
 
 class Recorder(AgentGame):
     """This class will record the game played by the agent, as a list of tuple(state, action)
 
+    If a path ending with ``.snkr`` is given, the steps are written to the file while the game is played (see
+    `snakeai.utils.recording`), instead of being kept in memory, with a keyframe every `keyframe_interval` steps.
+
     Note that for this to work properly, you should use a new recorder for each game"""
 
-    def __init__(self, dim, show):
+    def __init__(self, dim, show, max_steps_per_apple=0, detect_loops=False, path: Optional[str] = None,
+                 keyframe_interval: int = KEYFRAME_INTERVAL):
+        if path and not path.endswith(EXTENSION):
+            raise TypeError(f"The file should have {EXTENSION} extension")
         self.recorded = []
         self.dim = dim
-        super().__init__(dim, show=show)
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.writer = None
+        super().__init__(dim, show=show, max_steps_per_apple=max_steps_per_apple, detect_loops=detect_loops)
 
     @property
-    def recording(self):
+    def recording(self) -> Sequence[Tuple[Coords, Actions]]:
         """list((Coords, Action)): The list of state actions played"""
+        if self.writer:
+            # After the end of the game the file is complete, and the writer is closed
+            if not self.writer.closed:
+                self.writer.flush()
+            return RecordingReader(self.path)
         return self.recorded.copy()
 
     def start(self):
         state = super().start()
-        self.recorded.append((state.apple, state.direction))
+        if self.path:
+            self.writer = RecordingWriter(self.path, self.dim)
+            self.writer.start(state.apple, state.direction)
+        else:
+            self.recorded.append((state.apple, state.direction))
         return state
 
     def step(self, action: Union[Actions, str]):
         old_state, rew, state, isGameOver = super().step(action)
-        self.recorded.append((state.apple, state.direction))
+        if self.writer:
+            self.writer.step(state.apple, state.direction)
+            if self.keyframe_interval and self.writer.steps % self.keyframe_interval == 0:
+                self.writer.keyframe(self.model.snake, state.apple, state.direction, self.model.score)
+        else:
+            self.recorded.append((state.apple, state.direction))
         return old_state, rew, state, isGameOver
 
+    def play(self, agent: AbstractAgent = None):
+        super().play(agent)
+        if self.writer:
+            self.writer.close(self.model.score, self.model.isGameOver, self.truncated)
+
     def save(self, path: str):
         """Save the recorded game on file
 
         Parameters
         -----------
         path: str
-            the path were the game is save. ends with .pkl
+            the path were the game is save. ends with .pkl or .snkr
 
         Raises
         -------
         TypeError
-            If the file has not the .pkl extension
+            If the file has not the .pkl or .snkr extension
         """
+        if path.endswith(EXTENSION):
+            if path != self.path:
+                write_recording(path, self.dim, self.recording, self.model.score, self.model.isGameOver,
+                                self.truncated, self.keyframe_interval)
+            return
         if path[-4:] != ".pkl":
-            raise TypeError("The file should have .pkl extension")
+            raise TypeError(f"The file should have .pkl or {EXTENSION} extension")
         with open(path, "wb") as fout:
-            pkl.dump((self.dim, self.show, self.recorded), fout)
+            pkl.dump((self.dim, self.show, list(self.recording)), fout)
 
     @classmethod
     def load(cls, path: str):
@@ -57,15 +93,20 @@ class Recorder(AgentGame):
         Parameters
         -----------
         path: str
-            the path were the game is saved. Ends with .pkl
+            the path were the game is saved. Ends with .pkl or .snkr
 
         Raises
         -------
         TypeError
-            If the file has not the .pkl extension
+            If the file has not the .pkl or .snkr extension
         """
+        if path.endswith(EXTENSION):
+            reader = RecordingReader(path)
+            rec = cls(reader.dim, False)
+            rec.recorded = list(reader)
+            return rec
         if path[-4:] != ".pkl":
-            raise TypeError("The file should have .pkl extension")
+            raise TypeError(f"The file should have .pkl or {EXTENSION} extension")
         with open(path, "rb") as fin:
             dim, show, recorded = pkl.load(fin)
         rec = cls(dim, show)
@@ -74,32 +115,96 @@ class Recorder(AgentGame):
 
 
 class Player(UserGame):
-    def __init__(self, recorder: Recorder, mode: GUIMode = GUIMode.WINDOW):
-        self.recording = recorder.recording
+    """Show a recorded game
+
+    The player can jump to any step with `seek`: it restores the last keyframe before the step (from the
+    ``.snkr`` file, or taken while playing) and simulates the following steps without showing them.
+
+    Parameters
+    ----------
+    recorder : Recorder or RecordingReader
+        The recorded game
+    mode : GUIMode, default=GUIMode.WINDOW
+        The type of interface
+
+    Attributes
+    ----------
+    index : int
+        The step currently shown
+    """
+    def __init__(self, recorder: Union[Recorder, RecordingReader], mode: GUIMode = GUIMode.WINDOW):
+        self.recording = recorder if isinstance(recorder, RecordingReader) else recorder.recording
         super().__init__(recorder.dim, mode=mode)
         self.index = 0
+        self._snapshots = {}
+
+    def _advance(self, stop: int):
+        # Simulate up to the step `stop`, keeping a snapshot every KEYFRAME_INTERVAL steps for seeking back
+        while self.index < stop:
+            target = min(stop, (self.index // KEYFRAME_INTERVAL + 1) * KEYFRAME_INTERVAL)
+            replay_steps(self.model, self.recording, self.index, target)
+            self.index = target
+            if target % KEYFRAME_INTERVAL == 0 and target not in self._snapshots:
+                self._snapshots[target] = Snapshot.of(self.model, target)
+
+    def _update(self):
+        self.view.updateUI(self.model.snake, self.model.apple, self.model.score,
+                           self.model.highScore, self.model.isGameOver)
 
     def step(self):
         """Execute one step (frame) of the game"""
         start = time.time()
-        self.index += 1
-        apple, act = self.recording[self.index]
-        if act == "QUIT":
+        if self.recording[self.index + 1][1] == "QUIT":
             self.quit()
-        if act and act != "REPLAY":
-            self.model.change_direction(act)
-        self.model.step()
-        self.model.apple = apple
-        self.view.updateUI(self.model.snake, self.model.apple, self.model.score,
-                           self.model.highScore, self.model.isGameOver)
+        self._advance(self.index + 1)
+        self._update()
         self.wait_end_of_frame(time.time() - start)
 
+    def seek(self, index: int):
+        """Show the game after a certain step, without showing the steps before it
+
+        Parameters
+        ----------
+        index : int
+            The step. It is clipped to the length of the recording
+        """
+        index = max(0, min(index, len(self.recording) - 1))
+        snapshots = [snapshot for step, snapshot in self._snapshots.items() if step <= index]
+        if isinstance(self.recording, RecordingReader) and self.recording.nearest_keyframe(index):
+            snapshots.append(self.recording.nearest_keyframe(index))
+        best = max(snapshots, key=lambda snapshot: snapshot.step, default=None)
+        # Continue from the current step, unless a snapshot is closer or the step is in the past
+        if best and (best.step > self.index or self.index > index):
+            best.restore(self.model)
+            self.index = best.step
+        elif self.index > index:
+            self._restart()
+        self._advance(index)
+        self._update()
+
+    def step_back(self):
+        """Show the previous step"""
+        self.seek(self.index - 1)
+
+    def fast_forward(self, steps: int):
+        """Skip a number of steps
+
+        Parameters
+        ----------
+        steps : int
+            The number of steps to skip
+        """
+        self.seek(self.index + steps)
+
+    def _restart(self):
+        self.model.reset()
+        self.model.apple, self.model.direction = self.recording[0]
+        self.index = 0
+
     def start(self):
         """Start the game"""
         start = time.time()
-        self.model.reset()
-        self.model.apple = self.recording[0][0]
-        self.index = 0
+        self._restart()
         if self.is_first_game:
             self.is_first_game = False
             self.view.init_screen(self.model.dim, self.model.snake, self.model.apple,
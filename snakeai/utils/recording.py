@@ -0,0 +1,451 @@
+"""A compact binary format for recorded games
+
+A ``.snkr`` file starts with a header: the magic bytes ``SNKR``, the version of the format, the size of the board,
+the cell of the first apple (``y * dim + x``, unsigned 16 bit integers) and the first direction (one byte).
+Then each step takes one byte: the bits 0-1 are the position in `ACTION_LIST` of the direction, and the bit 2
+is set when the apple has moved, in which case the byte is followed by the new cell of the apple. When the game
+is over, the byte ``0xFF`` is followed by a footer with the number of steps, the score and whether the game was
+lost or truncated.
+
+Since version 2, a keyframe is written every few steps: the byte ``0x08`` followed by the number of steps, the
+score, the cell of the apple, the length of the snake, the direction and the cells of the body (tail first). A
+player can then jump to any step by restoring the previous keyframe and simulating the steps after it. The
+keyframes are found when the file is opened, so a recording interrupted before the footer can still be read
+and searched.
+
+The steps are written while the game is played, so a game of any length uses little memory.
+"""
+import pickle as pkl
+import struct
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from snakeai.game.constants import Actions, ACTION_LIST, Coords
+from snakeai.game.model import Snake
+
+MAGIC = b"SNKR"
+VERSION = 2
+EXTENSION = ".snkr"
+APPLE_MOVED = 0b100
+KEYFRAME = 0b1000
+END = 0xFF
+# The default number of steps between two keyframes
+KEYFRAME_INTERVAL = 1000
+GAME_OVER = 1
+TRUNCATED = 2
+_HEADER = struct.Struct("<4sHHHB")
+_APPLE = struct.Struct("<H")
+_FOOTER = struct.Struct("<IIB")
+_KEYFRAME = struct.Struct("<IIHHB")
+# The steps are written to the file in blocks of this size
+BUFFER_SIZE = 1 << 16
+_DIRECTIONS = {action: i for i, action in enumerate(ACTION_LIST)}
+
+
+@dataclass
+class Snapshot:
+    """The complete state of a recorded game after a certain step
+
+    Attributes
+    ----------
+    step : int
+        The number of steps executed
+    snake : list(Coords)
+        The body of the snake (head is last)
+    apple : Coords
+        The position of the apple
+    direction : Actions
+        The direction of the snake
+    score : int
+        The score
+    """
+    step: int
+    snake: List[Coords]
+    apple: Coords
+    direction: Actions
+    score: int
+
+    @classmethod
+    def of(cls, model: Snake, step: int) -> 'Snapshot':
+        """Take a snapshot of a game
+
+        Parameters
+        ----------
+        model : Snake
+            The game
+        step : int
+            The number of steps executed
+
+        Returns
+        -------
+        Snapshot
+            The snapshot
+        """
+        return cls(step, model.snake, model.apple, model.direction, model.score)
+
+    def restore(self, model: Snake):
+        """Bring a game to the state of the snapshot
+
+        Parameters
+        ----------
+        model : Snake
+            The game
+        """
+        model.snake = self.snake
+        model.apple = self.apple
+        model.direction = self.direction
+        model.score = self.score
+        model.highScore = max(model.highScore, self.score)
+        model.isGameOver = False
+
+
+def replay_steps(model: Snake, recording: Sequence[Tuple[Coords, Actions]], start: int, stop: int):
+    """Execute the recorded steps from `start` (excluded) to `stop` (included) in a game, without any interface
+
+    Parameters
+    ----------
+    model : Snake
+        The game, in the state after the step `start`
+    recording : list(tuple(Coords, Actions))
+        The recording (see `RecordingReader`)
+    start : int
+        The step of the current state of the game
+    stop : int
+        The last step to execute
+    """
+    for index in range(start + 1, stop + 1):
+        apple, direction = recording[index]
+        model.change_direction(direction)
+        model.step()
+        model.apple = apple
+
+
+class RecordingWriter:
+    """Write a game to a ``.snkr`` file, one step at a time
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    dim : int
+        The size of the board (at most 255)
+
+    Raises
+    ------
+    ValueError
+        If the board is too big for the format
+    """
+    def __init__(self, path: str, dim: int):
+        if dim > 255:
+            raise ValueError("The board can have a side of at most 255 cells")
+        self.path = path
+        self.dim = dim
+        self.steps = 0
+        self._apple = None
+        self._file = open(path, "wb")
+        self._buffer = bytearray()
+
+    def _cell(self, apple: Coords) -> int:
+        return apple.y * self.dim + apple.x
+
+    def start(self, apple: Coords, direction: Actions):
+        """Write the header, with the initial state of the game
+
+        Parameters
+        ----------
+        apple : Coords
+            The position of the apple
+        direction : Actions
+            The direction of the snake
+        """
+        self._apple = self._cell(apple)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, self.dim, self._apple, _DIRECTIONS[direction]))
+
+    def step(self, apple: Coords, direction: Actions):
+        """Write a step
+
+        Parameters
+        ----------
+        apple : Coords
+            The position of the apple after the step
+        direction : Actions
+            The direction of the snake in the step
+        """
+        cell = apple.y * self.dim + apple.x
+        if cell == self._apple:
+            self._buffer.append(_DIRECTIONS[direction])
+        else:
+            self._apple = cell
+            self._buffer.append(_DIRECTIONS[direction] | APPLE_MOVED)
+            self._buffer += _APPLE.pack(cell)
+        self.steps += 1
+        if len(self._buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def keyframe(self, snake: List[Coords], apple: Coords, direction: Actions, score: int):
+        """Write a keyframe with the state after the last step
+
+        Parameters
+        ----------
+        snake : list(Coords)
+            The body of the snake (head is last)
+        apple : Coords
+            The position of the apple
+        direction : Actions
+            The direction of the snake
+        score : int
+            The score
+        """
+        self._buffer.append(KEYFRAME)
+        self._buffer += _KEYFRAME.pack(self.steps, score, self._cell(apple), len(snake), _DIRECTIONS[direction])
+        self._buffer += np.array([self._cell(c) for c in snake], dtype="<u2").tobytes()
+
+    def close(self, score: int, game_over: bool, truncated: bool = False):
+        """Write the footer and close the file
+
+        Parameters
+        ----------
+        score : int
+            The final score
+        game_over : bool
+            Whether the snake has reached game over
+        truncated : bool, default=False
+            Whether the game has been stopped by a step limit
+        """
+        flags = (GAME_OVER if game_over else 0) | (TRUNCATED if truncated else 0)
+        self._buffer.append(END)
+        self._buffer += _FOOTER.pack(self.steps, score, flags)
+        self.flush()
+        self._file.close()
+
+    @property
+    def closed(self) -> bool:
+        """bool : Whether the file has been closed (by `close`)"""
+        return self._file.closed
+
+    def flush(self):
+        """Write the buffered steps to the file"""
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+
+
+class RecordingReader:
+    """Read a ``.snkr`` file, through a memory map
+
+    The reader is a sequence with the same items as `Recorder.recording`: the item 0 holds the initial position of
+    the apple and direction, and the item ``i`` the position of the apple after the step ``i`` and the direction
+    of that step.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+
+    Attributes
+    ----------
+    dim : int
+        The size of the board
+    directions : np.ndarray
+        The position in `ACTION_LIST` of the direction of each item
+    apples : np.ndarray
+        The cell (``y * dim + x``) of the apple in each item
+    score : int or None
+        The final score, if the recording is complete
+    game_over : bool
+        Whether the game ended with a game over
+    truncated : bool
+        Whether the game was stopped by a step limit
+    keyframes : list(Snapshot)
+        The keyframes, in order of step
+    keyframe_steps : np.ndarray
+        The step of each keyframe
+
+    Raises
+    ------
+    ValueError
+        If the file is not a recording, or it has a newer version
+    """
+    def __init__(self, path: str):
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, self.dim, first_apple, first_direction = _HEADER.unpack(data[:_HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a {EXTENSION} file")
+        if version > VERSION:
+            raise ValueError(f"{path} has version {version}, but the maximum supported version is {VERSION}")
+        body = data[_HEADER.size:]
+        # Only the bytes with the apple or keyframe bit can be followed by a payload: jumping from one of them to
+        # the next one after its payload finds all the records
+        candidates = np.flatnonzero(body & (APPLE_MOVED | KEYFRAME))
+        skipped = np.zeros(len(body), dtype=bool)
+        keyframes = []
+        end = len(body)
+        complete = False
+        i = 0
+        while i < len(candidates):
+            position = int(candidates[i])
+            code = body[position]
+            if code == END:
+                end = position
+                complete = position + _FOOTER.size < len(body)
+                break
+            if code & KEYFRAME:
+                if position + _KEYFRAME.size >= len(body):
+                    end = position
+                    break
+                length = _KEYFRAME.unpack(body[position + 1:position + 1 + _KEYFRAME.size].tobytes())[3]
+                # A keyframe is not a step: its first byte is skipped too
+                first, size = position, 1 + _KEYFRAME.size + 2 * length
+            else:
+                first, size = position + 1, 1 + _APPLE.size
+            if position + size > len(body):
+                # A file interrupted in the middle of a record
+                end = position
+                break
+            if code & KEYFRAME:
+                keyframes.append(position)
+            skipped[first:position + size] = True
+            i = int(np.searchsorted(candidates, position + size))
+        records = np.flatnonzero(~skipped[:end])
+        codes = body[records]
+        moved = (codes & APPLE_MOVED) != 0
+        changes = body[records[moved, None] + np.arange(1, 1 + _APPLE.size)].astype(np.uint16)
+        cells = changes[:, 0] | changes[:, 1] << 8
+        apples = np.concatenate(([first_apple], cells))
+        self.directions = np.concatenate(([first_direction], codes & 0b11)).astype(np.uint8)
+        self.apples = apples[np.cumsum(np.concatenate(([0], moved)))].astype(np.uint16)
+        self.keyframes = [self._read_keyframe(body, position) for position in keyframes]
+        self.keyframe_steps = np.array([keyframe.step for keyframe in self.keyframes], dtype=np.int64)
+        self.score = None
+        self.game_over = self.truncated = False
+        if complete:
+            _, self.score, flags = _FOOTER.unpack(body[end + 1:end + 1 + _FOOTER.size].tobytes())
+            self.game_over, self.truncated = bool(flags & GAME_OVER), bool(flags & TRUNCATED)
+
+    def _coords(self, cell: int) -> Coords:
+        return Coords(cell % self.dim, cell // self.dim)
+
+    def _read_keyframe(self, body: np.ndarray, position: int) -> Snapshot:
+        start = position + 1 + _KEYFRAME.size
+        step, score, apple, length, direction = _KEYFRAME.unpack(body[position + 1:start].tobytes())
+        cells = body[start:start + 2 * length].view("<u2")
+        return Snapshot(step, [self._coords(int(cell)) for cell in cells], self._coords(apple),
+                        ACTION_LIST[direction], score)
+
+    def nearest_keyframe(self, index: int) -> Optional[Snapshot]:
+        """Find the last keyframe before a step
+
+        Parameters
+        ----------
+        index : int
+            The step
+
+        Returns
+        -------
+        Snapshot or None
+            The keyframe with the highest step not greater than `index`, or None if there is none
+        """
+        position = int(np.searchsorted(self.keyframe_steps, index, side="right")) - 1
+        return self.keyframes[position] if position >= 0 else None
+
+    def __len__(self) -> int:
+        return len(self.directions)
+
+    def __getitem__(self, index: int) -> Tuple[Coords, Actions]:
+        return self._coords(int(self.apples[index])), ACTION_LIST[self.directions[index]]
+
+    def __iter__(self) -> Iterator[Tuple[Coords, Actions]]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+def replay_game(recording: Sequence[Tuple[Coords, Actions]], dim: Optional[int] = None,
+                stop: Optional[int] = None) -> Snake:
+    """Simulate a recorded game up to a step, as fast as possible and without any interface
+
+    Parameters
+    ----------
+    recording : RecordingReader or list(tuple(Coords, Actions))
+        The recording. With a `RecordingReader`, the simulation starts from the last keyframe before `stop`
+    dim : int, optional
+        The size of the board. It is needed only if `recording` is a list
+    stop : int, optional
+        The last step to simulate. If not given, the whole game is simulated
+
+    Returns
+    -------
+    Snake
+        The game after the step `stop`
+    """
+    stop = len(recording) - 1 if stop is None else stop
+    model = Snake(dim or recording.dim)
+    model.apple, model.direction = recording[0]
+    start = 0
+    keyframe = recording.nearest_keyframe(stop) if isinstance(recording, RecordingReader) else None
+    if keyframe:
+        keyframe.restore(model)
+        start = keyframe.step
+    replay_steps(model, recording, start, stop)
+    return model
+
+
+def write_recording(path: str, dim: int, recording: Sequence[Tuple[Coords, Actions]], score: Optional[int] = None,
+                    game_over: bool = True, truncated: bool = False, keyframe_interval: int = KEYFRAME_INTERVAL):
+    """Write a whole recording (as in `Recorder.recording`) to a ``.snkr`` file
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    dim : int
+        The size of the board
+    recording : list(tuple(Coords, Actions))
+        The initial position of the apple and direction, followed by the ones after each step
+    score : int, optional
+        The final score. If not given, it is found by simulating the game
+    game_over : bool, default=True
+        Whether the game ended with a game over
+    truncated : bool, default=False
+        Whether the game was stopped by a step limit
+    keyframe_interval : int, default=KEYFRAME_INTERVAL
+        The number of steps between two keyframes (0 for no keyframes). The game is simulated for writing them
+    """
+    writer = RecordingWriter(path, dim)
+    writer.start(*recording[0])
+    model = Snake(dim)
+    model.apple, model.direction = recording[0]
+    simulated = 0
+    for index in range(1, len(recording)):
+        writer.step(*recording[index])
+        if keyframe_interval and index % keyframe_interval == 0:
+            replay_steps(model, recording, simulated, index)
+            simulated = index
+            writer.keyframe(model.snake, model.apple, model.direction, model.score)
+    if score is None:
+        replay_steps(model, recording, simulated, len(recording) - 1)
+        score = model.score
+    writer.close(score, game_over, truncated)
+
+
+def convert_recording(pkl_path: str, path: Optional[str] = None) -> str:
+    """Convert a recording saved by `Recorder.save` as ``.pkl`` to the ``.snkr`` format
+
+    Parameters
+    ----------
+    pkl_path : str
+        The path of the old recording
+    path : str, optional
+        The path of the new file. If not given, the extension of `pkl_path` is replaced with ``.snkr``
+
+    Returns
+    -------
+    str
+        The path of the new file
+    """
+    with open(pkl_path, "rb") as fin:
+        dim, _, recorded = pkl.load(fin)
+    path = path or pkl_path[:-len(".pkl")] + EXTENSION
+    write_recording(path, dim, recorded)
+    return path
@@ -1,13 +1,22 @@
 import logging
 import pickle as pkl
-from typing import Tuple, List, Type
+from typing import Callable, Dict, Sequence, Tuple, List, Type
 from tqdm import tqdm
 
 from snakeai.agents.agent_interface import AbstractAgent
 from snakeai.game.agent_controller import AgentGame
+from snakeai.game.constants import GUIMode
+from snakeai.game.vector_game import VectorGame
 
 
-def general_train(agent: AbstractAgent, episodes: int, size: int, show=False, avg_length=1000) -> Tuple[AbstractAgent, List[int]]:
+def _apple_budget(size: int, max_steps_per_apple: int = None) -> int:
+    # No path to the apple is longer than the board, so twice its area leaves room for the moves of the body
+    return 2 * size * size if max_steps_per_apple is None else max_steps_per_apple
+
+
+def general_train(agent: AbstractAgent, episodes: int, size: int, show=False, avg_length=1000, checkpoint_interval=0,
+                  checkpoint_path=None, max_steps=0, max_steps_per_apple=None,
+                  hooks: Sequence[Callable] = ()) -> Tuple[AbstractAgent, List[int]]:
     """ Train the given agent and return the trained agent together with a list of scores
 
     Parameters
@@ -22,6 +31,17 @@ def general_train(agent: AbstractAgent, episodes: int, size: int, show=False, av
         Whether the screen should be shown during training
     avg_length: int, default = 1000
         The size of the sliding window for the average shown during training
+    checkpoint_interval: int, default=0
+        If positive, the agent is saved every `checkpoint_interval` episodes
+    checkpoint_path: str, optional
+        The path used for saving the checkpoints. If not given, the default path of the agent is used
+    max_steps: int, default=0
+        If positive, the maximum number of steps of an episode
+    max_steps_per_apple: int, optional
+        The maximum number of steps without eating an apple, after which the episode is truncated (0 for no
+        limit). If not given, twice the area of the board
+    hooks: list(callable), default=()
+        Functions called with each transition (see `AgentGame`), for example a `DatasetWriter`
 
     Returns
     -------
@@ -32,48 +52,149 @@ def general_train(agent: AbstractAgent, episodes: int, size: int, show=False, av
     t = tqdm(range(episodes))
     max_score = 0
     avg = 0
-    for _ in t:
-        game = AgentGame(size, show=show, replay_allowed=False)
+    truncated = 0
+    for episode in t:
+        game = AgentGame(size, show=show, replay_allowed=False, max_steps=max_steps,
+                         max_steps_per_apple=_apple_budget(size, max_steps_per_apple), hooks=hooks)
         game.play(agent)
         scores.append(game.model.score)
+        truncated += game.truncated
         agent.reset()
         length = min(len(scores), avg_length)
         avg = sum(scores[-length:])/length
         max_score = max(max_score, scores[-1])
         t.set_postfix_str(f"HS: {max_score}, avg: {avg:.2f}")
+        if checkpoint_interval > 0 and (episode + 1) % checkpoint_interval == 0:
+            agent.save(checkpoint_path)
+    agent.flush()
     print("\nEpsilon:", agent.epsilon)
     print("High Score:", max_score)
     print("Average score:", avg)
+    print("Truncated episodes:", truncated)
     return agent, scores
 
 
-def test_agent(agent: AbstractAgent, trials: int = 50) -> Tuple[int, float]:
-    """Test the agent for a certain number of time to calculate average and maximum score
+def train_vectorized(agent: AbstractAgent, episodes: int, size: int, n_games: int = 64, avg_length: int = 1000,
+                     encoded: bool = True, max_steps: int = 0, max_steps_per_apple: int = None,
+                     show: bool = False) -> Tuple[AbstractAgent, List[int]]:
+    """Train the given agent on many games at the same time, using `execute_batch` and `fit_batch`
 
     Parameters
     ----------
     agent: AbstractAgent
-        Teh agent to be tested
-    trials: int, default=50
-        The number of run to execute to get the statistics
+        The agent to be trained
+    episodes: int
+        The number of episodes to train the agent for. Since all the games are stopped together, a few more
+        episodes may be played
+    size: int
+        The size of the board
+    n_games: int, default=64
+        The number of games played at the same time
+    avg_length: int, default = 1000
+        The size of the sliding window for the average shown during training
+    encoded: bool, default=True
+        Whether the states are given to the agent as arrays of simplified states. It must be False for agents
+        that use the full state, like `StateAgent`
+    max_steps: int, default=0
+        If positive, the maximum number of steps of an episode
+    max_steps_per_apple: int, optional
+        The maximum number of steps without eating an apple, after which the episode is truncated (0 for no
+        limit). If not given, twice the area of the board
+    show: bool, default=False
+        Whether the first games are shown in a `MonitorGUI` window, at no more than 10 frames per second
 
     Returns
     -------
-    int, float
-        The maximum score achieved and the average score
+    tuple(AbstractAgent, list(int) )
+        The trained agent and a list with the scores achieved for each episode of training, in order of ending
+    """
+    games = VectorGame(size, n_games, encoded, max_steps, _apple_budget(size, max_steps_per_apple),
+                       GUIMode.MONITOR if show else GUIMode.NO_SHOW)
+    t = tqdm(total=episodes)
+    max_score = 0
+    avg = 0
+    while len(games.scores) < episodes:
+        ended = int(games.play_step(agent).sum())
+        if ended:
+            t.update(min(ended, episodes - t.n))
+            length = min(len(games.scores), avg_length)
+            avg = sum(games.scores[-length:]) / length
+            max_score = max(max_score, max(games.scores[-ended:]))
+            t.set_postfix_str(f"HS: {max_score}, avg: {avg:.2f}")
+    t.close()
+    games.view.quit()
+    agent.flush()
+    print("\nEpsilon:", agent.epsilon)
+    print("High Score:", max_score)
+    print("Average score:", avg)
+    print("Truncated episodes:", games.truncations)
+    return agent, games.scores
 
+
+def evaluate_agent(agent: AbstractAgent, trials: int = 50, max_steps_per_apple: int = None,
+                   detect_loops: bool = False, hooks: Sequence[Callable] = ()) -> Dict[str, float]:
+    """Play a certain number of games with epsilon=0, and collect the statistics
+
+    Parameters
+    ----------
+    agent: AbstractAgent
+        The agent to be tested
+    trials: int, default=50
+        The number of games
+    max_steps_per_apple: int, optional
+        The maximum number of steps without eating an apple, after which the game is truncated (0 for no
+        limit). If not given, twice the area of the board
+    detect_loops: bool, default=False
+        Whether the games are truncated as soon as a state repeats without the snake eating an apple. This is
+        meant for agents that do not learn (e.g. `CompiledPolicyAgent`): the others keep learning during the
+        games, and often leave the loop after a while
+    hooks: list(callable), default=()
+        Functions called with each transition (see `AgentGame`), for example a `DatasetWriter`
+
+    Returns
+    -------
+    dict
+        The maximum and average score, the average number of steps, and the number of truncated games
     """
     epsilon = agent.epsilon
     board_size = agent.dim
     agent.epsilon = 0
     scores = []
+    steps = 0
+    truncated = 0
     for _ in tqdm(range(trials)):
-        game = AgentGame(board_size, show=False)
+        game = AgentGame(board_size, show=False, max_steps_per_apple=_apple_budget(board_size, max_steps_per_apple),
+                         detect_loops=detect_loops, hooks=hooks)
         game.play(agent)
         scores.append(game.model.score)
+        steps += game.steps
+        truncated += game.truncated
         agent.reset()
     agent.epsilon = epsilon
-    return max(scores), sum(scores)/len(scores)
+    return {"high_score": max(scores), "average_score": sum(scores) / len(scores), "average_steps": steps / trials,
+            "truncated": truncated}
+
+
+def test_agent(agent: AbstractAgent, trials: int = 50) -> Tuple[int, float]:
+    """Test the agent for a certain number of time to calculate average and maximum score
+
+    The games are truncated when the agent does not eat for too long (see `evaluate_agent`).
+
+    Parameters
+    ----------
+    agent: AbstractAgent
+        Teh agent to be tested
+    trials: int, default=50
+        The number of run to execute to get the statistics
+
+    Returns
+    -------
+    int, float
+        The maximum score achieved and the average score
+
+    """
+    stats = evaluate_agent(agent, trials)
+    return stats["high_score"], stats["average_score"]
 
 
 def train_and_play(cls: Type[AbstractAgent], board_size: int, episodes: int, output_model: str, model_input_file=None,
@@ -125,10 +246,11 @@ def train_and_play(cls: Type[AbstractAgent], board_size: int, episodes: int, out
             pkl.dump(all_scores, f_out)
 
     # Test trained Agent
-    max_score, avg = test_agent(agent, test_run)
+    stats = evaluate_agent(agent, test_run)
     print("---Stats with epsilon=0---")
-    print("Average:", avg)
-    print("High score:", max_score)
+    print("Average:", stats["average_score"])
+    print("High score:", stats["high_score"])
+    print("Truncated games:", stats["truncated"])
 
     # Play with Agent
     game = AgentGame(board_size, replay_allowed=True, fps=7)
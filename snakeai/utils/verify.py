@@ -0,0 +1,167 @@
+"""Check many recorded games at once, without showing them
+
+Each recording is simulated with `Snake` at full speed, and compared with what the file says about the game: the
+recorded directions must be ones that the snake can take (never the reverse of its direction), the apple must
+move only when the snake eats it, the game must end (with a game over, unless it was truncated) exactly at the last
+step, and the final score and the keyframes of the ``.snkr`` files must match the simulation. The ``.pkl`` files
+do not record truncations, so their games must end with a game over. The files are checked in parallel by a pool
+of processes.
+"""
+import os
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, List, Optional
+
+from snakeai.game.constants import ACTION_LIST, Coords, Rewards
+from snakeai.game.model import Snake
+from snakeai.utils.recording import EXTENSION, RecordingReader
+
+# The number of problems listed for each recording: a desynchronized game usually has one at every step
+MAX_PROBLEMS = 10
+
+
+def find_recordings(paths: Iterable[str]) -> List[str]:
+    """List the recordings in some files and directories
+
+    Parameters
+    ----------
+    paths : list(str)
+        Recordings, or directories that are searched recursively for ``.snkr`` and ``.pkl`` files
+
+    Returns
+    -------
+    list(str)
+        The paths of the recordings, sorted
+    """
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for root, _, names in os.walk(path):
+            found += [os.path.join(root, name) for name in names if name.endswith((EXTENSION, ".pkl"))]
+    return sorted(found)
+
+
+def _load(path: str):
+    # The recording as lists of apple cells and of directions, with the size of the board and the reader (if any)
+    if path.endswith(EXTENSION):
+        reader = RecordingReader(path)
+        return reader.dim, reader.apples.tolist(), [ACTION_LIST[d] for d in reader.directions.tolist()], reader
+    from snakeai.utils.recorder import Recorder
+
+    recording = Recorder.load(path)
+    dim = recording.dim
+    steps = recording.recording
+    return dim, [apple.y * dim + apple.x for apple, _ in steps], [direction for _, direction in steps], None
+
+
+def verify_recording(path: str) -> Dict[str, Any]:
+    """Simulate a recorded game and compare it with the recording
+
+    Parameters
+    ----------
+    path : str
+        The path of the recording (``.snkr`` or ``.pkl``)
+
+    Returns
+    -------
+    dict
+        The path, whether the recording is valid (``ok``), the number of steps, the simulated score, the score
+        written in the file (None for ``.pkl`` files and interrupted ``.snkr`` files), whether the game ended with
+        a game over and whether it was truncated (according to the file), the step of the game over in the
+        simulation (None if there is none), the problems found, and ``error`` if the file could not be read
+    """
+    start = time.perf_counter()
+    result = {"path": path, "ok": False, "steps": 0, "score": None, "expected_score": None, "game_over": None,
+              "truncated": None, "game_over_step": None, "problems": [], "error": None}
+    try:
+        dim, apples, directions, reader = _load(path)
+    except Exception as error:  # Any error means that the file is corrupted
+        result["error"] = f"{type(error).__name__}: {error}"
+        result["seconds"] = time.perf_counter() - start
+        return result
+    problems = result["problems"]
+    keyframes = {keyframe.step: keyframe for keyframe in reader.keyframes} if reader else {}
+    model = Snake(dim)
+    model.apple, model.direction = Coords(apples[0] % dim, apples[0] // dim), directions[0]
+    for index in range(1, len(apples)):
+        if model.isGameOver:
+            problems.append(f"step {index} is recorded after the game over")
+            break
+        model.change_direction(directions[index])
+        if model.direction != directions[index]:
+            # The recordings store the direction after the change, so a reversal means a damaged step
+            problems.append(f"the direction at step {index} is the reverse of the direction of the snake")
+        eaten = model.step() == Rewards.GOT_APPLE
+        if model.isGameOver:
+            result["game_over_step"] = index
+        if apples[index] != apples[index - 1]:
+            model.apple = Coords(apples[index] % dim, apples[index] // dim)
+            if not eaten:
+                problems.append(f"the apple moves at step {index}, but it has not been eaten")
+        elif eaten and not model.isGameOver:
+            problems.append(f"the apple is eaten at step {index}, but it does not move")
+        keyframe = keyframes.get(index)
+        if keyframe and (keyframe.snake != model.snake or keyframe.apple != model.apple or
+                         keyframe.direction != model.direction or keyframe.score != model.score):
+            problems.append(f"the keyframe at step {index} does not match the game")
+        if len(problems) >= MAX_PROBLEMS:
+            break
+    result.update(steps=len(apples) - 1, score=model.score)
+    if reader:
+        result.update(expected_score=reader.score, game_over=reader.game_over, truncated=reader.truncated)
+        if reader.score is None:
+            problems.append("the recording is incomplete")
+        elif reader.score != model.score:
+            problems.append(f"the final score is {model.score}, but the recording says {reader.score}")
+        elif reader.game_over != model.isGameOver:
+            problems.append("the game ends with a game over, but the recording says it does not" if model.isGameOver
+                            else "the recording ends with a game over, but the game is not over")
+        elif not model.isGameOver and not reader.truncated:
+            # Only a truncated game may end without a game over
+            problems.append("the recording ends before the game over")
+    elif not model.isGameOver and not problems:
+        # The .pkl files do not record truncations, so their games must end with a game over
+        problems.append("the recording ends before the game over")
+    result["ok"] = not problems
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def verify_recordings(paths: Iterable[str], workers: Optional[int] = None, chunksize: int = 16) -> Dict[str, Any]:
+    """Check many recordings in parallel, and summarize the results
+
+    Parameters
+    ----------
+    paths : list(str)
+        Recordings, or directories with recordings (see `find_recordings`)
+    workers : int, optional
+        The number of processes. If not given, the number of CPUs. With 1, the recordings are checked in this process
+    chunksize : int, default=16
+        The number of recordings sent to a process at once
+
+    Returns
+    -------
+    dict
+        The number of recordings, valid recordings, corrupted files (which could not be read) and recordings that
+        do not match their game, the total number of steps, the average and maximum score, the seconds and steps per
+        second, and the results (see `verify_recording`) of the recordings with problems
+    """
+    paths = find_recordings(paths)
+    start = time.perf_counter()
+    if workers == 1:
+        results = [verify_recording(path) for path in paths]
+    else:
+        with Pool(workers) as pool:
+            results = list(pool.imap(verify_recording, paths, chunksize))
+    elapsed = time.perf_counter() - start
+    read = [result for result in results if result["error"] is None]
+    steps = sum(result["steps"] for result in read)
+    return {"recordings": len(results), "ok": sum(result["ok"] for result in results),
+            "corrupted": len(results) - len(read), "mismatched": sum(not result["ok"] for result in read),
+            "steps": steps, "average_score": sum(result["score"] for result in read) / len(read) if read else None,
+            "max_score": max((result["score"] for result in read), default=None),
+            "truncated": sum(bool(result["truncated"]) for result in read),
+            "seconds": elapsed, "steps_per_second": steps / elapsed if elapsed else 0.0,
+            "failures": [result for result in results if not result["ok"]]}